@@ -1,16 +1,105 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from dotenv import load_dotenv
 
-SQLALCHEMY_DATABASE_URL = 'sqlite:///./chatapp.db'
+load_dotenv()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={'check_same_thread': False})
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chatapp.db")
+# Cùng cơ sở dữ liệu, qua driver bất đồng bộ aiosqlite
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+)
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# Cấu hình lưu trữ SQLite, áp dụng cho mọi kết nối trong pool
+SQLITE_PRAGMAS = {
+    # WAL: người đọc không bị chặn bởi người ghi (và ngược lại)
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    # NORMAL an toàn với WAL (chỉ có thể mất transaction cuối khi mất điện)
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    # Số trang, hoặc số âm tính theo KiB
+    "cache_size": int(os.getenv("DB_CACHE_SIZE", "-20000")),
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Chờ khóa thay vì báo "database is locked" ngay lập tức
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+}
+
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+}
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite(engine, read_only=False):
+    """
+    Đăng ký áp dụng SQLITE_PRAGMAS cho mỗi kết nối mới của engine
+
+    Args:
+        engine: Engine đồng bộ (với AsyncEngine dùng engine.sync_engine)
+        read_only: Bật query_only, kết nối chỉ được đọc
+    """
+    pragmas = dict(SQLITE_PRAGMAS)
+    if read_only:
+        # Chế độ journal là thuộc tính của tệp, do pool ghi thiết lập
+        pragmas.pop("journal_mode")
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+
+connect_args = {'check_same_thread': False} if IS_SQLITE else {}
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **POOL_OPTIONS)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
+
+# Pool riêng chỉ đọc cho lịch sử tin nhắn và các truy vấn liệt kê,
+# không tranh kết nối với luồng ghi tin nhắn và các request ghi
+read_async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=POOL_OPTIONS["max_overflow"]
+)
+
+if IS_SQLITE:
+    configure_sqlite(engine)
+    configure_sqlite(async_engine.sync_engine)
+    configure_sqlite(read_async_engine.sync_engine, read_only=True)
+
+# expire_on_commit=False: đối tượng vẫn đọc được sau commit mà không phải nạp lại (không có lazy load trong async)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+AsyncReadSessionLocal = async_sessionmaker(read_async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
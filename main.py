@@ -1,11 +1,21 @@
 from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
 from database import engine
-from models import Base
-from routers import auth, channel, signaling, server, connection_logs
+from sqlalchemy import inspect
+from alembic import command
+from alembic.config import Config
+from routers import auth, channel, signaling, server, connection_logs, search
 from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
 import os
 from service.logger import get_logger
+from service.connection_logger import get_connection_logger
+from service.message_persister import get_message_persister
+from service.broker import get_broker, run_broker_server, BROKER_URL
+from service.channel_cache import get_channel_cache
+from service.auth import token_cache
+from service.presence import get_presence_tracker
+from service.signaling_server import get_signaling_server
 
 # Tạo thư mục logs nếu chưa tồn tại
 os.makedirs("logs", exist_ok=True)
@@ -14,7 +24,33 @@ os.makedirs("logs", exist_ok=True)
 logger = get_logger("main")
 logger.info("Starting application")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Kết nối tới broker pub/sub giữa các worker
+    await get_broker().start()
+    # Nhận thông báo thay đổi channel/thành viên từ các worker khác
+    get_channel_cache().subscribe()
+    # Xóa token cache của người dùng đổi status/đăng nhập ở worker khác
+    token_cache.subscribe()
+    # Nhận quy tắc ghi connection logs đổi ở worker khác
+    get_connection_logger().subscribe()
+    # Theo dõi online/offline theo kết nối WebSocket, ghi status theo lô
+    await get_presence_tracker().start()
+    # Listener signaling không qua FastAPI (bật khi SIGNALING_SERVER_PORT khác 0)
+    if get_signaling_server().port:
+        await get_signaling_server().start()
+    yield
+    await get_signaling_server().stop()
+    await get_presence_tracker().stop()
+    await get_broker().stop()
+    # Commit nốt các tin nhắn đang chờ ghi
+    logger.info("Flushing pending messages")
+    await get_message_persister().stop()
+    # Ghi nốt connection logs còn trong hàng đợi trước khi tắt
+    logger.info("Flushing connection logs")
+    get_connection_logger().close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,8 +63,22 @@ app.add_middleware(
 
 logger.info("Setting up CORS middleware")
 
-Base.metadata.create_all(bind=engine)
-logger.info("Database tables created")
+def upgrade_database():
+    """Nâng cấp lược đồ lên revision mới nhất (migrations/)"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(base_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(base_dir, "migrations"))
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if "users" in tables and "alembic_version" not in tables:
+            # CSDL được tạo bằng create_all trước khi có migration: đánh dấu là lược đồ ban đầu
+            logger.info("Stamping existing database at baseline revision")
+            command.stamp(config, "0001")
+        command.upgrade(config, "head")
+
+upgrade_database()
+logger.info("Database schema up to date")
 
 @app.get("/healthy")
 def health_check():
@@ -41,12 +91,27 @@ app.include_router(channel.router)
 app.include_router(signaling.router)
 app.include_router(server.router)
 app.include_router(connection_logs.router)
+app.include_router(search.router)
 
 if __name__ == "__main__":
     import uvicorn
-    logger.info("Starting uvicorn server")
+    import multiprocessing
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        if BROKER_URL.startswith("memory://"):
+            raise SystemExit("WORKERS > 1 requires BROKER_URL=unix://... or tcp://...")
+        # Tiến trình quản lý không ghi connection logs: nhả slot cho các worker
+        # (trước khi tạo tiến trình broker để nó không giữ khóa)
+        get_connection_logger().release_slot()
+        # Chạy broker cục bộ ở tiến trình riêng để các worker chia sẻ channel
+        logger.info(f"Starting broker on {BROKER_URL}")
+        multiprocessing.Process(target=run_broker_server, args=(BROKER_URL,), daemon=True).start()
+    logger.info(f"Starting uvicorn server with {workers} worker(s)")
     uvicorn.run(
-        app,
+        "main:app" if workers > 1 else app,
         host="0.0.0.0",  # Cho phép truy cập từ LAN
-        port=8000
+        port=8000,
+        workers=workers,
+        # permessage-deflate theo WS_DEFLATE_* (service/ws_compression.py)
+        ws="service.ws_compression:CompressedWebSocketProtocol"
     )
\ No newline at end of file
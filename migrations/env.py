@@ -0,0 +1,52 @@
+from alembic import context
+from database import engine
+from models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Bỏ qua bảng FTS5 (messages_fts và các bảng phụ) khi autogenerate: không có trong models"""
+    return not (type_ == "table" and name.startswith("messages_fts"))
+
+
+def run_migrations_offline():
+    """Sinh SQL thay vì chạy trực tiếp (alembic upgrade head --sql)"""
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True,
+        include_object=include_object
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # main.py truyền sẵn kết nối khi tự nâng cấp lúc khởi động
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    with engine.connect() as connection:
+        _run(connection)
+
+
+def _run(connection):
+    # render_as_batch: SQLite chỉ đổi kiểu cột được bằng cách tạo lại bảng
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=True,
+        include_object=include_object
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
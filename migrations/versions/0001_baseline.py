@@ -0,0 +1,90 @@
+"""Lược đồ ban đầu (trước khi dùng Alembic)
+
+Cơ sở dữ liệu đã được tạo bằng Base.metadata.create_all được đánh dấu ở
+revision này (alembic stamp 0001) thay vì chạy lại.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('full_name', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username')
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+
+    op.create_table(
+        'servers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('host_user_id', sa.Integer(), nullable=False),
+        sa.Column('color', sa.String(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('is_private', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['host_user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_servers_id', 'servers', ['id'])
+
+    op.create_table(
+        'channels',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('channel_type', sa.Enum('text', 'voice', name='channeltype'), nullable=False),
+        sa.Column('server_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['server_id'], ['servers.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_channels_id', 'channels', ['id'])
+
+    op.create_table(
+        'channel_members',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('channel_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['channel_id'], ['channels.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('channel_id', 'user_id', name='uix_channel_user')
+    )
+    op.create_index('ix_channel_members_id', 'channel_members', ['id'])
+
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.String(), nullable=True),
+        sa.Column('channel_id', sa.Integer(), nullable=True),
+        sa.Column('sender_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['channel_id'], ['channels.id']),
+        sa.ForeignKeyConstraint(['sender_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_messages_id', 'messages', ['id'])
+    op.create_index('ix_messages_channel_id_id', 'messages', ['channel_id', 'id'])
+
+
+def downgrade():
+    op.drop_table('messages')
+    op.drop_table('channel_members')
+    op.drop_table('channels')
+    op.drop_table('servers')
+    op.drop_table('users')
@@ -0,0 +1,150 @@
+"""Index cho các khóa ngoại hay truy vấn, created_at thành timestamp phía server
+
+- Index: messages.sender_id, channel_members.user_id, channels.server_id,
+  servers.host_user_id, messages(channel_id, created_at)
+- messages.created_at: chuỗi tự do do client gửi -> DateTime (UTC) do server
+  gán. Giá trị cũ dạng ISO 8601 được giữ lại. Giá trị chỉ có giờ ("03:16 PM",
+  "20:40") được ghép với ngày suy ra: đi ngược theo id từ thời điểm chạy
+  migration, mỗi khi giờ lớn hơn thời điểm của tin nhắn ngay sau thì lùi một
+  ngày (ngày là ước lượng, thứ tự và khoảng cách trong ngày được giữ). Chuỗi
+  gốc được giữ trong messages.legacy_created_at (downgrade khôi phục từ cột này).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from datetime import datetime, timedelta, timezone
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_messages_sender_id', 'messages', ['sender_id']),
+    ('ix_channel_members_user_id', 'channel_members', ['user_id']),
+    ('ix_channels_server_id', 'channels', ['server_id']),
+    ('ix_servers_host_user_id', 'servers', ['host_user_id']),
+]
+
+
+# Các dạng chỉ có giờ mà client cũ gửi lên
+TIME_FORMATS = ('%I:%M %p', '%I:%M:%S %p', '%H:%M', '%H:%M:%S')
+
+
+def parse_created_at(value):
+    """datetime (UTC) nếu là ISO 8601, time nếu chỉ có giờ, None nếu không đọc được"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        pass
+    else:
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), time_format).time()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+
+def resolve_created_at(rows, migrated_at):
+    """
+    Gán datetime cho từng tin nhắn (rows sắp xếp theo id tăng dần)
+
+    Returns:
+        {id: datetime}, không giảm theo id và không sau migrated_at
+    """
+    resolved = {}
+    day = migrated_at.date()
+    following = migrated_at  # datetime của tin nhắn ngay sau (theo id)
+    for message_id, value in reversed(rows):
+        parsed = parse_created_at(value)
+        if isinstance(parsed, datetime):
+            created_at = parsed
+        elif parsed is not None:
+            created_at = datetime.combine(day, parsed)
+            if created_at > following:
+                day -= timedelta(days=1)
+                created_at = datetime.combine(day, parsed)
+        else:
+            created_at = following
+        # Giá trị ISO sai thứ tự không làm đảo thứ tự theo id
+        created_at = min(created_at, following)
+        day = created_at.date()
+        resolved[message_id] = created_at
+        following = created_at
+    return resolved
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Các CSDL được tạo trước đó bằng create_all có thể thiếu index keyset này
+    existing = {index['name'] for index in sa.inspect(bind).get_indexes('messages')}
+    if 'ix_messages_channel_id_id' not in existing:
+        op.create_index('ix_messages_channel_id_id', 'messages', ['channel_id', 'id'])
+
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+    # Chuyển created_at sang DateTime qua một cột tạm, giữ chuỗi gốc
+    with op.batch_alter_table('messages') as batch:
+        batch.add_column(sa.Column('created_at_ts', sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column('legacy_created_at', sa.String(), nullable=True))
+
+    messages = sa.table(
+        'messages',
+        sa.column('id', sa.Integer),
+        sa.column('created_at', sa.String),
+        sa.column('created_at_ts', sa.DateTime),
+        sa.column('legacy_created_at', sa.String),
+    )
+    migrated_at = datetime.utcnow()
+    rows = bind.execute(sa.select(messages.c.id, messages.c.created_at).order_by(messages.c.id)).all()
+    if rows:
+        resolved = resolve_created_at(rows, migrated_at)
+        bind.execute(
+            messages.update().where(messages.c.id == sa.bindparam('message_id')),
+            [
+                {'message_id': row.id, 'created_at_ts': resolved[row.id], 'legacy_created_at': row.created_at}
+                for row in rows
+            ]
+        )
+
+    with op.batch_alter_table('messages') as batch:
+        batch.drop_column('created_at')
+        batch.alter_column(
+            'created_at_ts',
+            new_column_name='created_at',
+            existing_type=sa.DateTime(),
+            nullable=False,
+            server_default=sa.func.current_timestamp()
+        )
+    op.create_index('ix_messages_channel_id_created_at', 'messages', ['channel_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_messages_channel_id_created_at', table_name='messages')
+    with op.batch_alter_table('messages') as batch:
+        batch.alter_column(
+            'created_at',
+            existing_type=sa.DateTime(),
+            type_=sa.String(),
+            nullable=True,
+            server_default=None
+        )
+    # Khôi phục chuỗi gốc của các tin nhắn có trước migration
+    messages = sa.table('messages', sa.column('created_at', sa.String), sa.column('legacy_created_at', sa.String))
+    op.get_bind().execute(
+        messages.update()
+        .where(messages.c.legacy_created_at.isnot(None))
+        .values(created_at=messages.c.legacy_created_at)
+    )
+    with op.batch_alter_table('messages') as batch:
+        batch.drop_column('legacy_created_at')
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,66 @@
+"""Tìm kiếm toàn văn tin nhắn bằng SQLite FTS5
+
+- messages_fts: bảng ảo FTS5 external content trên messages.content
+  (rowid = messages.id), tokenizer unicode61 bỏ dấu (tìm "tieng viet" khớp
+  "tiếng việt")
+- Trigger sau INSERT / DELETE / UPDATE OF content trên messages giữ index
+  đồng bộ trong cùng transaction ghi tin nhắn
+- Index được dựng lại từ dữ liệu hiện có ('rebuild'); chạy tay bằng
+  tools/rebuild_search_index.py
+
+Lưu ý: batch_alter_table trên messages (SQLite tạo lại bảng) xóa các trigger,
+migration sau đó cần tạo lại chúng (TRIGGERS).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+
+TRIGGERS = [
+    ('messages_fts_insert', """
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """),
+    ('messages_fts_delete', """
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """),
+    ('messages_fts_update', """
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """),
+]
+
+
+def upgrade():
+    # FTS5 chỉ có trên SQLite
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(CREATE_TABLE)
+    for _, statement in TRIGGERS:
+        op.execute(statement)
+    op.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name, _ in reversed(TRIGGERS):
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS messages_fts")
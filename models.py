@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Enum, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Enum, UniqueConstraint, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -32,7 +32,7 @@ class Servers(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    host_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    host_user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     color = Column(String)
     host_user = relationship('Users', back_populates='servers')
     channels = relationship('Channels', back_populates='server')
@@ -47,7 +47,7 @@ class Channels(Base):
     channel_type = Column(Enum(ChannelType), nullable=False)
     members = relationship('ChannelMembers', back_populates='channel')
     messages = relationship('Messages', back_populates='channel')
-    server_id = Column(Integer, ForeignKey('servers.id'), nullable=False)
+    server_id = Column(Integer, ForeignKey('servers.id'), nullable=False, index=True)
     server = relationship('Servers', back_populates='channels')
     
 class ChannelMembers(Base):
@@ -56,7 +56,7 @@ class ChannelMembers(Base):
     id = Column(Integer, primary_key=True, index=True)
     channel_id = Column(Integer, ForeignKey('channels.id'))
     channel = relationship('Channels', back_populates='members')
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     role = Column(String, default='user')
     user = relationship('Users', back_populates='members')
     __table_args__ = (UniqueConstraint('channel_id', 'user_id', name='uix_channel_user'),)
@@ -68,6 +68,15 @@ class Messages(Base):
     content = Column(String)
     channel_id = Column(Integer, ForeignKey('channels.id'))
     channel = relationship('Channels', back_populates='messages')
-    sender_id = Column(Integer, ForeignKey('users.id'))
+    sender_id = Column(Integer, ForeignKey('users.id'), index=True)
     sender = relationship('Users', back_populates='messages')
-    created_at = Column(String)
+    # Thời điểm server nhận tin nhắn (UTC)
+    created_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+    # Chuỗi thời gian gốc do client gửi, chỉ có ở tin nhắn trước migration 0002
+    legacy_created_at = Column(String, nullable=True)
+    __table_args__ = (
+        # Phục vụ phân trang keyset lịch sử tin nhắn theo channel
+        Index('ix_messages_channel_id_id', 'channel_id', 'id'),
+        # Truy vấn tin nhắn theo khoảng thời gian trong một channel
+        Index('ix_messages_channel_id_created_at', 'channel_id', 'created_at'),
+    )
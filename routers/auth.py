@@ -4,10 +4,16 @@ from pydantic import BaseModel
 from typing import Optional
 from database import get_db
 from models import Users
-from service.auth import hash_password, authenticate_user, create_access_token, get_current_user, get_current_user_optional
+from service.auth import hash_password, authenticate_user, create_access_token, get_current_user, get_current_user_optional, token_cache
+from service.channel_cache import get_channel_cache
+from service.presence import get_presence_tracker
 from datetime import timedelta
 
 router = APIRouter(prefix="/auth", tags=["auth"])
+# Status của người dùng cũng nằm trong danh sách thành viên được cache
+channel_cache = get_channel_cache()
+# Trạng thái do người dùng chọn, presence_tracker giữ "offline"/"invisible" khi có kết nối
+presence_tracker = get_presence_tracker()
 
 # Pydantic models cho request/response
 class UserCreate(BaseModel):
@@ -73,6 +79,11 @@ async def login(username: str = Form(...), password: str = Form(...), db: Sessio
     user.status = "online"
     db.commit()
     db.refresh(user)
+    token_cache.invalidate_user(user.id)
+    await token_cache.publish(user.id)
+    channel_cache.update_user(user.id, user.status)
+    await channel_cache.publish(user_id=user.id, status=user.status)
+    await presence_tracker.update_preference(user.id, user.status)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login-guest", response_model=Token)
@@ -94,7 +105,19 @@ async def get_me(current_user: Users = Depends(get_current_user_optional)):
 async def update_status(status_update: StatusUpdate, current_user: Users = Depends(get_current_user_optional), db: Session = Depends(get_db)):
     if status_update.status not in ["online", "offline", "invisible"]:
         raise HTTPException(status_code=400, detail="Invalid status")
-    current_user.status = status_update.status
+    # current_user là bản sao trong cache, cập nhật trên đối tượng của Session
+    user = db.query(Users).filter(Users.id == current_user.id).first()
+    user.status = status_update.status
     db.commit()
-    db.refresh(current_user)
-    return current_user
\ No newline at end of file
+    db.refresh(user)
+    token_cache.invalidate_user(user.id)
+    await token_cache.publish(user.id)
+    channel_cache.update_user(user.id, user.status)
+    await channel_cache.publish(user_id=user.id, status=user.status)
+    await presence_tracker.update_preference(user.id, user.status)
+    return user
+
+# Thống kê cache xác thực token
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: Users = Depends(get_current_user)):
+    return token_cache.stats()
\ No newline at end of file
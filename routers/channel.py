@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
-from database import get_db
-from models import Channels, ChannelMembers, Users, ChannelType, Messages
+from datetime import datetime
+from database import get_async_db, get_async_read_db
+from models import Users, ChannelType
 from service.auth import get_current_user, get_current_user_optional
+from service.provisioning import MEMBER_ROLE, add_channel, add_member, remove_member
+from service.channel_cache import get_channel_cache
+from service.message_cache import get_message_cache
+from service.fast_json import FastJSONResponse, user_json
 from routers.auth import UserResponse
 import uuid
 
 router = APIRouter(prefix="/channels", tags=["channels"])
+# Metadata và thành viên channel được phục vụ từ cache
+channel_cache = get_channel_cache()
+# Trang lịch sử mới nhất được phục vụ từ ring buffer tin nhắn gần đây
+message_cache = get_message_cache()
 
 # Pydantic model
 
@@ -37,7 +46,7 @@ class ChannelResponse(BaseModel):
 class MessageResponse(BaseModel):
     id: int
     content: str
-    created_at: str
+    created_at: datetime
     sender: UserResponse
 
     class Config:
@@ -47,134 +56,133 @@ class DataChannelResponse(BaseModel):
     name: str
     channel_type: ChannelType
     messages: list[MessageResponse]
+    next_cursor: Optional[int] = None  # before_id/after_id cho trang tiếp theo
     class Config:
         from_attributes = True
         
 class JoinChannelRequest(BaseModel):
     channel_id: int
 
+def channel_response(channel):
+    """ChannelResponse từ ChannelInfo trong cache"""
+    return {
+        "id": channel.id,
+        "name": channel.name,
+        "channel_type": channel.channel_type,
+        "members": channel.member_list()
+    }
+
+# Dựng dict JSON trực tiếp (thứ tự khóa như các Pydantic model ở trên), dùng với FastJSONResponse
+
+def member_json(member):
+    """ChannelMember từ MemberInfo trong cache"""
+    user = member.user
+    return {"id": member.id, "user": user_json(user.id, user.username, user.full_name, user.status), "role": member.role}
+
 # Create channel (chỉ authenticated-user)
 @router.post("/create", response_model=ChannelResponse)
 async def create_channel(
     channel: ChannelCreate,
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Tạo channel mới
-    db_channel = Channels(name=channel.name, channel_type=channel.channel_type, server_id=channel.server_id)
-    db.add(db_channel)
-    db.commit()
-    db.refresh(db_channel)
-
-    # Thêm host làm thành viên
-    db_member = ChannelMembers(channel_id=db_channel.id, user_id=current_user.id, role='host')
-    db.add(db_member)
-    db.commit()
-    db.refresh(db_channel)
-
-    # Tải lại members với thông tin từ Users
-    db_channel.members = (
-        db.query(ChannelMembers)
-        .filter(ChannelMembers.channel_id == db_channel.id)
-        .all()
-    )
-    for member in db_channel.members:
-        member.username = member.user.username
-        member.full_name = member.user.full_name
-        member.status = member.user.status
-
+    # Tạo channel mới, host là thành viên (một commit)
+    db_channel = await add_channel(db, channel.server_id, channel.name, channel.channel_type, current_user.id)
+    channel_cache.put_channel(db_channel)
     return db_channel
 
+# Thống kê cache channel và cache tin nhắn (tỉ lệ hit)
+@router.get("/cache-stats")
+async def get_cache_stats(current_user: Users = Depends(get_current_user)):
+    return {"channels": channel_cache.stats(), "messages": message_cache.stats()}
+
 # Get channel info
 @router.get("/{channel_id}", response_model=ChannelResponse)
 async def get_channel_info(
     channel_id: int,
-    current_user: Optional[Users] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    current_user: Optional[Users] = Depends(get_current_user_optional)
 ):
-    db_channel = db.query(Channels).filter(Channels.id == channel_id).first()
+    db_channel = await channel_cache.get(channel_id)
     if not db_channel:
         raise HTTPException(status_code=404, detail="Channel not found")
-    return db_channel
+    return channel_response(db_channel)
 
 
 @router.get("/{channel_id}/messages", response_model=DataChannelResponse, status_code=status.HTTP_200_OK)
 async def get_messages(
     channel_id: int,
-    db: Session = Depends(get_db)
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    # eager load messages
-    db_channel = db.query(Channels).options(joinedload(Channels.messages).joinedload(Messages.sender)).filter(Channels.id == channel_id).first()
+    """
+    Lấy lịch sử tin nhắn theo trang (keyset trên index (channel_id, id))
+
+    - Mặc định / before_id: các tin nhắn mới nhất cũ hơn before_id, next_cursor là before_id của trang cũ hơn
+    - after_id: các tin nhắn mới hơn after_id, next_cursor là after_id của trang mới hơn
+    Tin nhắn trong trang luôn được sắp xếp từ cũ đến mới. Các trang nằm trong
+    ring buffer của message_cache không truy vấn DB.
+    """
+    db_channel = await channel_cache.get(channel_id)
     if not db_channel:
         raise HTTPException(status_code=404, detail="Channel not found")
-    return db_channel
+
+    messages, next_cursor = await message_cache.page(channel_id, before_id, after_id, limit, db=db)
+    return FastJSONResponse({
+        "id": db_channel.id,
+        "name": db_channel.name,
+        "channel_type": db_channel.channel_type.value,
+        "messages": messages,
+        "next_cursor": next_cursor
+    })
 
 @router.post("/join", response_model=ChannelResponse)
 async def join_channel(
     channel: JoinChannelRequest,
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Kiểm tra xem người dùng đã là thành viên của channel chưa
-    existing_member = db.query(ChannelMembers).filter(
-        ChannelMembers.channel_id == channel.channel_id,
-        ChannelMembers.user_id == current_user.id
-    ).first()
-
-    if existing_member:
+    db_channel = await channel_cache.get(channel.channel_id)
+    if not db_channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    if db_channel.is_member(current_user.id):
         raise HTTPException(status_code=400, detail="User already a member of the channel")
 
     # Thêm người dùng vào channel
-    db_member = ChannelMembers(channel_id=channel.channel_id, user_id=current_user.id, role='member')
-    db.add(db_member)
-    db.commit()
-    db.refresh(db_member)
-
-    # Tải lại members với thông tin từ Users
-    db_channel = db.query(Channels).filter(Channels.id == channel.channel_id).first()
-    db_channel.members = (
-        db.query(ChannelMembers)
-        .filter(ChannelMembers.channel_id == db_channel.id)
-        .all()
-    )
-    for member in db_channel.members:
-        member.username = member.user.username
-        member.full_name = member.user.full_name
-        member.status = member.user.status
+    db_member = await add_member(db, channel.channel_id, current_user.id, role=MEMBER_ROLE)
+    if db_member is None:
+        raise HTTPException(status_code=400, detail="User already a member of the channel")
 
-    return db_channel
+    # Cập nhật cache thay vì tải lại toàn bộ members
+    channel_cache.add_member(channel.channel_id, db_member.id, db_member.role, current_user)
+    await channel_cache.publish([channel.channel_id])
+    return channel_response(db_channel)
+
+
+@router.post("/leave", status_code=status.HTTP_204_NO_CONTENT)
+async def leave_channel(
+    channel: JoinChannelRequest,
+    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if not await remove_member(db, channel.channel_id, current_user.id):
+        raise HTTPException(status_code=400, detail="User is not a member of the channel")
+    channel_cache.remove_member(channel.channel_id, current_user.id)
+    await channel_cache.publish([channel.channel_id])
 
 
 # get all members of channel except current user
 @router.get("/{channel_id}/members", response_model=list[ChannelMember])
 async def get_channel_members(
     channel_id: int,
-    current_user: Users = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    current_user: Users = Depends(get_current_user_optional)
 ):
     # Kiểm tra xem người dùng có quyền truy cập vào channel không
-    db_channel = db.query(Channels).filter(Channels.id == channel_id).first()
+    db_channel = await channel_cache.get(channel_id)
     if not db_channel:
         raise HTTPException(status_code=404, detail="Channel not found")
 
-    # Lấy danh sách thành viên của channel 
-    if current_user is None:
-        # Nếu không có người dùng hiện tại, chỉ lấy thành viên
-        members = (
-            db.query(ChannelMembers)
-            .filter(ChannelMembers.channel_id == channel_id)
-            .all()
-        )
-    else:
-        # Nếu có người dùng hiện tại, lấy thành viên không bao gồm người dùng hiện tại  
-        members = (
-            db.query(ChannelMembers)
-            .filter((ChannelMembers.channel_id == channel_id) & (ChannelMembers.user_id != current_user.id))
-            .all()
-        )
-
-    # Thêm thông tin người dùng vào danh sách thành viên
-    for member in members:
-        member.user = db.query(Users).filter(Users.id == member.user_id).first()
-
-    return members
\ No newline at end of file
+    # Nếu có người dùng hiện tại, lấy thành viên không bao gồm người dùng hiện tại
+    members = db_channel.member_list(exclude_user_id=current_user.id if current_user is not None else None)
+    return FastJSONResponse([member_json(member) for member in members])
@@ -1,19 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+from datetime import datetime
 from database import get_db
 from models import Users, ChannelMembers
 from service.auth import get_current_user
 from service.connection_logger import get_connection_logger
 from service.logger import get_logger
-import os
 
 # Tạo logger cho module connection_logs
 logger = get_logger("connection_logs")
 # Tạo connection logger để theo dõi kết nối host
 connection_logger = get_connection_logger()
 
+# Các route đọc log là hàm đồng bộ (chạy trong threadpool): truy vấn Session và
+# connection_logger (flush, khóa của luồng ghi) đều chặn, không chạy trên event loop
 router = APIRouter(prefix="/connection-logs", tags=["connection-logs"])
 
 class ConnectionLogResponse(BaseModel):
@@ -25,12 +28,29 @@ class ConnectionLogResponse(BaseModel):
     event_type: str
     metadata: Dict[str, Any]
 
+class LogPolicyRule(BaseModel):
+    host_type: str = "*"
+    event_type: str = "*"
+    mode: str = "always"  # always / sample / aggregate
+    rate: float = 1.0  # Tỉ lệ ghi khi mode là sample (0-1)
+    interval_seconds: Optional[float] = None  # Chu kỳ bản ghi tổng hợp khi mode là aggregate
+
+class LogPolicyResponse(BaseModel):
+    rules: List[LogPolicyRule]
+
+class LogPolicyUpdate(BaseModel):
+    rules: List[LogPolicyRule]  # Thay toàn bộ quy tắc hiện tại
+
 @router.get("", response_model=List[ConnectionLogResponse], status_code=status.HTTP_200_OK)
-async def get_connection_logs(
+def get_connection_logs(
     limit: int = 100, 
     offset: int = 0,
     host_type: Optional[str] = None,
     event_type: Optional[str] = None,
+    channel_id: Optional[int] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     current_user: Users = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -42,6 +62,9 @@ async def get_connection_logs(
     - offset: Vị trí bắt đầu
     - host_type: Lọc theo loại host (centralized_host, channel_hosting, text_channel, message, signaling)
     - event_type: Lọc theo loại sự kiện (connect, disconnect, create, send_message, offer, answer, ice_candidate)
+    - channel_id: Lọc theo channel
+    - user_id: Lọc theo người dùng (ID số hoặc UUID của guest)
+    - since/until: Lọc theo khoảng thời gian
     """
     try:
         # Kiểm tra xem người dùng có quyền admin trong bất kỳ channel nào hay không
@@ -56,16 +79,24 @@ async def get_connection_logs(
                 detail="You don't have permission to view connection logs"
             )
             
-        logs = connection_logger.get_connection_logs(limit=limit, offset=offset)
-        
-        # Lọc theo host_type nếu có
+        # Bộ lọc được áp dụng trước khi phân trang (qua chỉ mục của connection logger)
+        filters = {}
         if host_type:
-            logs = [log for log in logs if log.get("host_type") == host_type]
-            
-        # Lọc theo event_type nếu có
+            filters["host_type"] = host_type
         if event_type:
-            logs = [log for log in logs if log.get("event_type") == event_type]
-            
+            filters["event_type"] = event_type
+        if channel_id is not None:
+            filters["channel_id"] = channel_id
+        if user_id is not None:
+            filters["user_id"] = int(user_id) if user_id.isdigit() else user_id
+
+        logs = connection_logger.get_connection_logs(
+            limit=limit,
+            offset=offset,
+            filters=filters,
+            since=since,
+            until=until
+        )
         return logs
     except Exception as e:
         logger.error(f"Error getting connection logs: {str(e)}")
@@ -75,7 +106,7 @@ async def get_connection_logs(
         )
 
 @router.get("/count", response_model=int, status_code=status.HTTP_200_OK)
-async def get_connection_logs_count(
+def get_connection_logs_count(
     current_user: Users = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -95,15 +126,8 @@ async def get_connection_logs_count(
                 detail="You don't have permission to view connection logs"
             )
             
-        # Kiểm tra file logs tồn tại
-        if not os.path.exists(connection_logger.log_file):
-            return 0
-            
-        # Đếm số dòng trong file
-        with open(connection_logger.log_file, 'r', encoding='utf-8') as f:
-            count = sum(1 for _ in f)
-            
-        return count
+        # Lấy từ bộ đếm thống kê, không đọc lại tệp log
+        return connection_logger.count()
     except Exception as e:
         logger.error(f"Error counting connection logs: {str(e)}")
         raise HTTPException(
@@ -117,14 +141,14 @@ async def clear_connection_logs(
     db: Session = Depends(get_db)
 ):
     """
-    Xóa toàn bộ connection logs
+    Xóa toàn bộ connection logs (của mọi worker)
     """
     try:
         # Kiểm tra xem người dùng có quyền admin trong bất kỳ channel nào hay không
-        is_admin = db.query(ChannelMembers).filter(
+        is_admin = await run_in_threadpool(lambda: db.query(ChannelMembers).filter(
             ChannelMembers.user_id == current_user.id,
             ChannelMembers.role == "host"
-        ).first() is not None
+        ).first() is not None)
             
         if not is_admin:
             raise HTTPException(
@@ -132,12 +156,10 @@ async def clear_connection_logs(
                 detail="You don't have permission to clear connection logs"
             )
             
-        # Xóa file logs nếu tồn tại
-        if os.path.exists(connection_logger.log_file):
-            os.remove(connection_logger.log_file)
-            
-        # Reset counter
-        connection_logger.record_count = 0
+        # Xóa file logs và reset counter của worker này (chờ luồng ghi, ngoài event loop),
+        # các worker khác xóa tệp của chúng khi nhận yêu cầu qua broker
+        await run_in_threadpool(connection_logger.clear)
+        await connection_logger.publish_clear()
         
         return None
     except Exception as e:
@@ -153,12 +175,20 @@ class StatsResponse(BaseModel):
     event_types: Dict[str, int]
 
 @router.get("/stats", response_model=StatsResponse, status_code=status.HTTP_200_OK)
-async def get_connection_logs_stats(
+def get_connection_logs_stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     current_user: Users = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Lấy thống kê về các loại sự kiện và host trong connection logs
+    
+    Parameters:
+    - since/until: Chỉ thống kê trong khoảng thời gian (độ chính xác theo phút, theo giờ với dữ liệu cũ)
+
+    Số liệu là số sự kiện: bản ghi lấy mẫu được tính 1/sample_rate, bản ghi
+    tổng hợp được tính theo count (ước lượng, làm tròn)
     """
     try:
         # Kiểm tra xem người dùng có quyền admin trong bất kỳ channel nào hay không
@@ -173,11 +203,69 @@ async def get_connection_logs_stats(
                 detail="You don't have permission to view connection logs statistics"
             )
             
-        stats = connection_logger.get_stats()
+        stats = connection_logger.get_stats(since=since, until=until)
         return stats
     except Exception as e:
         logger.error(f"Error getting connection logs statistics: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/policy", response_model=LogPolicyResponse, status_code=status.HTTP_200_OK)
+def get_connection_logs_policy(
+    current_user: Users = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Lấy chính sách ghi connection logs theo host_type/event_type
+    """
+    # Kiểm tra xem người dùng có quyền admin trong bất kỳ channel nào hay không
+    is_admin = db.query(ChannelMembers).filter(
+        ChannelMembers.user_id == current_user.id,
+        ChannelMembers.role == "host"
+    ).first() is not None
+
+    if not is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to view connection logs policy"
+        )
+
+    return {"rules": connection_logger.get_policy()}
+
+@router.put("/policy", response_model=LogPolicyResponse, status_code=status.HTTP_200_OK)
+async def update_connection_logs_policy(
+    policy: LogPolicyUpdate,
+    current_user: Users = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Thay toàn bộ chính sách ghi connection logs (áp dụng ngay cho mọi worker)
+
+    Mỗi quy tắc áp dụng cho một host_type/event_type ("*" khớp tất cả), quy
+    tắc cụ thể nhất được dùng; sự kiện không khớp quy tắc nào luôn được ghi.
+    - always: ghi mọi bản ghi
+    - sample: ghi ngẫu nhiên theo tỉ lệ rate, metadata có sample_rate
+    - aggregate: mỗi interval_seconds ghi một bản ghi tổng hợp cho từng
+      channel, metadata có count (số sự kiện) và users (số người dùng)
+    """
+    # Kiểm tra xem người dùng có quyền admin trong bất kỳ channel nào hay không
+    is_admin = await run_in_threadpool(lambda: db.query(ChannelMembers).filter(
+        ChannelMembers.user_id == current_user.id,
+        ChannelMembers.role == "host"
+    ).first() is not None)
+
+    if not is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to change connection logs policy"
+        )
+
+    try:
+        # Lưu quy tắc xuống tệp ngoài event loop
+        await run_in_threadpool(connection_logger.set_policy, [rule.model_dump() for rule in policy.rules])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    await connection_logger.publish_policy()
+    return {"rules": connection_logger.get_policy()}
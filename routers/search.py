@@ -0,0 +1,147 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, table, column, literal_column, or_, and_, Integer, String
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from database import get_async_read_db
+from models import Messages, Users, Channels, Servers
+from service.auth import get_current_user
+from service.channel_cache import get_channel_cache
+from service.fast_json import FastJSONResponse, user_json
+from routers.auth import UserResponse
+
+router = APIRouter(prefix="/search", tags=["search"])
+# Kiểm tra channel tồn tại qua cache
+channel_cache = get_channel_cache()
+
+# Bảng ảo FTS5 tạo bởi migration 0003 (rowid = messages.id), giữ đồng bộ bằng trigger
+messages_fts = table("messages_fts", column("rowid", Integer), column("content", String))
+# Cột ẩn cùng tên bảng: vế trái của MATCH và tham số đầu của bm25()/snippet()
+FTS = literal_column("messages_fts")
+
+# Đánh dấu từ khớp trong snippet, dấu lược bớt và số token tối đa của snippet
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_ELLIPSIS = "…"
+SNIPPET_TOKENS = 16
+
+# Pydantic model
+
+class SearchHit(BaseModel):
+    id: int
+    channel_id: int
+    content: str
+    snippet: str  # Đoạn nội dung quanh từ khớp, từ khớp nằm giữa SNIPPET_START/SNIPPET_END
+    created_at: datetime
+    sender: UserResponse
+
+class SearchResponse(BaseModel):
+    results: list[SearchHit]
+    next_cursor: Optional[str] = None  # cursor cho trang tiếp theo
+
+
+def match_query(text: str) -> Optional[str]:
+    """
+    Chuyển chuỗi người dùng nhập thành biểu thức MATCH của FTS5: mỗi từ là một
+    phrase trong ngoặc kép (không bị hiểu là toán tử hay tên cột), các từ nối
+    bằng AND. Từ kết thúc bằng * được tìm theo tiền tố.
+
+    Returns:
+        Biểu thức MATCH, None nếu không có từ nào
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+def encode_cursor(rank: float, message_id: int) -> str:
+    # repr của float khôi phục đúng giá trị khi đọc lại
+    return f"{rank!r}:{message_id}"
+
+
+def decode_cursor(cursor: str):
+    try:
+        rank, message_id = cursor.rsplit(":", 1)
+        return float(rank), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def hit_json(row):
+    """SearchHit từ một hàng (id, channel_id, content, snippet, created_at, sender..., rank)"""
+    message_id, channel_id, content, snippet, created_at, sender_id, username, full_name, user_status, _ = row
+    return {
+        "id": message_id,
+        "channel_id": channel_id,
+        "content": content,
+        "snippet": snippet,
+        "created_at": created_at.isoformat(),
+        "sender": user_json(sender_id, username, full_name, user_status) if sender_id is not None else None
+    }
+
+
+@router.get("/messages", response_model=SearchResponse, status_code=status.HTTP_200_OK)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    channel_id: Optional[int] = None,
+    server_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Tìm tin nhắn theo nội dung (FTS5) trong một channel (channel_id) hoặc mọi
+    channel của một server (server_id)
+
+    Kết quả xếp theo bm25 (khớp nhất trước), cùng điểm thì tin nhắn mới hơn
+    trước. Phân trang keyset trên (điểm, id): next_cursor truyền lại qua
+    cursor. Điểm bm25 phụ thuộc thống kê toàn bộ index nên khi có tin nhắn mới
+    giữa hai trang, ranh giới trang có thể lệch nhẹ.
+    """
+    if (channel_id is None) == (server_id is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Specify exactly one of channel_id or server_id")
+    expression = match_query(q)
+    if expression is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty search query")
+
+    rank = func.bm25(FTS)
+    query = (
+        select(
+            Messages.id, Messages.channel_id, Messages.content,
+            func.snippet(FTS, 0, SNIPPET_START, SNIPPET_END, SNIPPET_ELLIPSIS, SNIPPET_TOKENS),
+            Messages.created_at,
+            Users.id, Users.username, Users.full_name, Users.status,
+            rank
+        )
+        .select_from(messages_fts)
+        .join(Messages, Messages.id == messages_fts.c.rowid)
+        .outerjoin(Users, Users.id == Messages.sender_id)
+        .where(FTS.match(expression))
+        .order_by(rank, Messages.id.desc())
+        .limit(limit + 1)
+    )
+    if channel_id is not None:
+        if not await channel_cache.get(channel_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Channel not found")
+        query = query.where(Messages.channel_id == channel_id)
+    else:
+        if (await db.execute(select(Servers.id).where(Servers.id == server_id))).first() is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Server not found")
+        query = query.where(Messages.channel_id.in_(select(Channels.id).where(Channels.server_id == server_id)))
+    if cursor is not None:
+        after_rank, after_id = decode_cursor(cursor)
+        query = query.where(or_(rank > after_rank, and_(rank == after_rank, Messages.id < after_id)))
+
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return FastJSONResponse({
+        "results": [hit_json(row) for row in rows],
+        "next_cursor": encode_cursor(rows[-1][-1], rows[-1][0]) if has_more else None
+    })
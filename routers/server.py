@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, selectinload, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, or_
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-from database import get_db
+from typing import Optional, List, Dict, Any, Literal
+from database import get_async_db, get_async_read_db
 from models import Servers, Users, Channels, ChannelType, ChannelMembers
 from service.auth import get_current_user
+from service.provisioning import DEFAULT_CHANNELS, MEMBER_ROLE, provision_server, import_members
+from service.channel_cache import get_channel_cache
 from routers.channel import ChannelResponse
+from service.fast_json import FastJSONResponse, user_json
 from service.connection_logger import get_connection_logger
 from service.logger import get_logger
 import uuid
@@ -14,6 +18,8 @@ import uuid
 logger = get_logger("server")
 # Tạo connection logger để theo dõi kết nối host
 connection_logger = get_connection_logger()
+# Cache thành viên channel, cần cập nhật khi thêm thành viên
+channel_cache = get_channel_cache()
 
 router = APIRouter(prefix="/servers", tags=["servers"])
 
@@ -33,114 +39,194 @@ class ServerResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ServerSummary(BaseModel):
+    id: int
+    name: str
+    host_user_id: int
+    color: Optional[str] = None
+    is_private: Optional[bool] = None
+    channel_count: int
+
+class ServerListResponse(BaseModel):
+    servers: list[ServerSummary]
+    next_cursor: Optional[int] = None  # after_id cho trang tiếp theo
+
+class ChannelLayout(BaseModel):
+    name: str
+    channel_type: ChannelType
+    members: Optional[list[int]] = None  # None: mọi thành viên của server
+
+class MemberSpec(BaseModel):
+    user_id: int
+    role: Literal["member", "host"] = MEMBER_ROLE  # MEMBER_ROLE / HOST_ROLE
+
+class ServerProvisionRequest(ServerRequest):
+    channels: list[ChannelLayout] = [ChannelLayout(**channel) for channel in DEFAULT_CHANNELS]
+    members: list[MemberSpec] = []
+
+class MemberImportRequest(BaseModel):
+    user_ids: list[int]
+    channel_ids: Optional[list[int]] = None  # None: mọi channel của server
+    role: Literal["member", "host"] = MEMBER_ROLE  # MEMBER_ROLE / HOST_ROLE
+
+class MemberImportResponse(BaseModel):
+    added: int
+
+async def provision(request: ServerProvisionRequest, current_user: Users, db: AsyncSession):
+    try:
+        new_server = await provision_server(
+            db,
+            host_user_id=current_user.id,
+            name=request.name,
+            color=request.color,
+            is_private=request.is_private,
+            channels=[channel.model_dump() for channel in request.channels],
+            members=[member.model_dump() for member in request.members]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # Log tạo centralized host
+    connection_logger.log_connection(
+        host_type="centralized_host",
+        host_id=new_server.id,
+        user_id=current_user.id,
+        event_type="create",
+        metadata={
+            "server_name": new_server.name
+        }
+    )
+    return new_server
+
 # create server
 @router.post("/create", response_model=ServerResponse, status_code=status.HTTP_201_CREATED)
 async def create_server(
     server: ServerRequest,
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    try:    
-        new_server = Servers(
-            name=server.name,
-            color=server.color,
-            host_user_id=current_user.id,
-            is_private=server.is_private
-        )
-        db.add(new_server)
-        db.commit()
-        db.refresh(new_server)
-        
-        # Log tạo centralized host
-        connection_logger.log_connection(
-            host_type="centralized_host",
-            host_id=new_server.id,
-            user_id=current_user.id,
-            event_type="create",
-            metadata={
-                "server_name": new_server.name
-            }
-        )
-        
-        # create default channel
-        default_text_channel = Channels(
-            name="general",
-            server_id=new_server.id,
-            channel_type=ChannelType.text
-        )
-        db.add(default_text_channel)
-        db.commit()
-        db.refresh(default_text_channel)
-        
-        # create default voice channel
-        default_voice_channel = Channels(
-            name="general",
-            server_id=new_server.id,
-            channel_type=ChannelType.voice
-        )
-        db.add(default_voice_channel)
-        db.commit()
-        db.refresh(default_voice_channel)
-        
-        # create default text channel member
-        default_text_channel_member = ChannelMembers(
-            channel_id=default_text_channel.id,
-            user_id=current_user.id,
-            role="host"
-        )
-        db.add(default_text_channel_member)
-        db.commit()
-        db.refresh(default_text_channel_member)
-        
-        # create default voice channel member
-        default_voice_channel_member = ChannelMembers(
-            channel_id=default_voice_channel.id,
-            user_id=current_user.id,
-            role="host"
-        )
-        db.add(default_voice_channel_member)
-        db.commit()
-        db.refresh(default_voice_channel_member)
-        
-        # Eager load channels và members, bao gồm user
-        new_server = (
-            db.query(Servers)
-            .options(joinedload(Servers.channels).joinedload(Channels.members).joinedload(ChannelMembers.user))
-            .get(new_server.id)
-        )
-        return new_server
+    # Server với một text channel và một voice channel mặc định
+    return await provision(ServerProvisionRequest(**server.model_dump()), current_user, db)
+
+# create server with channel layout and members (một transaction)
+@router.post("/provision", response_model=ServerResponse, status_code=status.HTTP_201_CREATED)
+async def provision_server_endpoint(
+    request: ServerProvisionRequest,
+    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await provision(request, current_user, db)
+
+# bulk import members into server channels (chỉ host)
+@router.post("/{server_id}/members", response_model=MemberImportResponse, status_code=status.HTTP_200_OK)
+async def import_server_members(
+    server_id: int,
+    request: MemberImportRequest,
+    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    server = await db.get(Servers, server_id)
+    if not server:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Server not found")
+    if server.host_user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the host can import members")
+
+    channel_ids = (await db.execute(select(Channels.id).where(Channels.server_id == server_id))).scalars().all()
+    if request.channel_ids is not None:
+        unknown = set(request.channel_ids) - set(channel_ids)
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Channels not in server: {sorted(unknown)}")
+        channel_ids = request.channel_ids
+    try:
+        added = await import_members(db, channel_ids, request.user_ids, role=request.role)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if added:
+        for channel_id in channel_ids:
+            channel_cache.invalidate(channel_id)
+        await channel_cache.publish(channel_ids)
+    return {"added": added}
     
-# get all servers
-@router.get("", response_model=list[ServerResponse], status_code=status.HTTP_200_OK)
+# get servers of current user
+@router.get("", response_model=ServerListResponse, status_code=status.HTTP_200_OK)
 async def get_all_servers(
-    db: Session = Depends(get_db)
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    try:
-        # Eager load channels và members, bao gồm user
-        servers = (
-            db.query(Servers)
-            .options(joinedload(Servers.channels).joinedload(Channels.members).joinedload(ChannelMembers.user))
-            .all()
+    """
+    Liệt kê theo trang các server mà người dùng hiện tại là host hoặc là thành
+    viên của ít nhất một channel (keyset theo id, next_cursor là after_id của
+    trang tiếp theo). Chỉ trả về thông tin tóm tắt; cây channel/thành viên đầy
+    đủ lấy qua GET /servers/{server_id}.
+    """
+    member_server_ids = (
+        select(Channels.server_id)
+        .join(ChannelMembers, ChannelMembers.channel_id == Channels.id)
+        .where(ChannelMembers.user_id == current_user.id)
+    )
+    channel_count = (
+        select(func.count(Channels.id))
+        .where(Channels.server_id == Servers.id)
+        .correlate(Servers)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Servers.id,
+            Servers.name,
+            Servers.host_user_id,
+            Servers.color,
+            Servers.is_private,
+            channel_count.label("channel_count")
         )
-        return servers
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        .where(or_(Servers.host_user_id == current_user.id, Servers.id.in_(member_server_ids)))
+        .order_by(Servers.id)
+        .limit(limit + 1)
+    )
+    if after_id is not None:
+        query = query.where(Servers.id > after_id)
+
+    rows = (await db.execute(query)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return FastJSONResponse({
+        "servers": [dict(row) for row in rows],
+        "next_cursor": rows[-1]["id"] if has_more else None
+    })
 
 # get server by id
 @router.get("/{server_id}", response_model=ServerResponse, status_code=status.HTTP_200_OK)
-async def get_server_by_id(server_id: int, db: Session = Depends(get_db)):
+async def get_server_by_id(server_id: int, db: AsyncSession = Depends(get_async_read_db)):
     try:
-        # Eager load channels và members, bao gồm user
-        server = (
-            db.query(Servers)
-            .options(joinedload(Servers.channels).joinedload(Channels.members).joinedload(ChannelMembers.user))
-            .get(server_id)
-        )
+        # Chỉ lấy các cột cần trả về: server, channels, rồi members kèm user bằng một truy vấn IN
+        server = (await db.execute(
+            select(Servers.id, Servers.name, Servers.host_user_id, Servers.color, Servers.is_private)
+            .where(Servers.id == server_id)
+        )).mappings().first()
         if not server:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Server not found")
-        return server
+        channels = {
+            channel_id: {"id": channel_id, "name": name, "channel_type": channel_type.value, "members": []}
+            for channel_id, name, channel_type in await db.execute(
+                select(Channels.id, Channels.name, Channels.channel_type)
+                .where(Channels.server_id == server_id)
+                .order_by(Channels.id)
+            )
+        }
+        if channels:
+            members = await db.execute(
+                select(
+                    ChannelMembers.channel_id, ChannelMembers.id, ChannelMembers.role,
+                    Users.id, Users.username, Users.full_name, Users.status
+                )
+                .join(Users, Users.id == ChannelMembers.user_id)
+                .where(ChannelMembers.channel_id.in_(channels))
+                .order_by(ChannelMembers.channel_id, ChannelMembers.user_id)
+            )
+            for channel_id, member_id, role, *user in members:
+                channels[channel_id]["members"].append({"id": member_id, "user": user_json(*user), "role": role})
+        return FastJSONResponse({**server, "channels": list(channels.values())})
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -1,24 +1,106 @@
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query
-from sqlalchemy.orm import Session
-from database import get_db
-from models import Channels, Users, Messages
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from models import Users
 from datetime import datetime
 from typing import Optional, Dict
 import json
-from service.auth import get_current_user, get_current_user_optional, getUsernameByToken
+import asyncio
+from service.auth import get_current_user, get_current_user_optional, getUsernameByToken, token_cache
 from service.logger import get_logger
 from service.connection_logger import get_connection_logger
+from service.message_persister import get_message_persister
+from service.fanout import ChannelFanout, OutboundConnection, serialize
+from service.wire_codec import negotiate_codec, reject_frame, CLOSE_INVALID_DATA
+from service.broker import get_broker
+from service.channel_cache import get_channel_cache
+from service.message_cache import get_message_cache
+from service.presence import get_presence_tracker
+from service.signaling_relay import SignalingRelay, RELAYED_ACTIONS, ROUTING_FIELDS, with_peer_id
 import uuid
+import os
 
 # Tạo logger cho module signaling
 logger = get_logger("signaling")
 # Tạo connection logger để theo dõi kết nối host
 connection_logger = get_connection_logger()
+# Ghi tin nhắn theo lô
+message_persister = get_message_persister()
+# Pub/sub giữa các worker: mỗi worker chỉ giữ kết nối cục bộ của nó
+broker = get_broker()
+# Cache metadata channel cho bước kiểm tra khi kết nối WebSocket
+channel_cache = get_channel_cache()
+# Trạng thái online theo kết nối WebSocket
+presence_tracker = get_presence_tracker()
+# Tin nhắn gần đây của các text channel mà worker đang nhận broadcast
+message_cache = get_message_cache()
 
 router = APIRouter(prefix="/ws", tags=["signaling"])
-# channel_id: {peer_id: websocket}
-active_connections: Dict[int, Dict[str, WebSocket]] = {}
-text_connections: Dict[int, Dict[int, WebSocket]] = {}
+# Phát tin nhắn chat/signaling: mỗi kết nối có hàng đợi gửi riêng, client chậm bị loại
+text_fanout = ChannelFanout(
+    max_queue=int(os.getenv("CHAT_OUTBOUND_QUEUE_SIZE", "256")),
+    max_lag=float(os.getenv("CHAT_MAX_LAG_SECONDS", "10"))
+)
+signaling_fanout = ChannelFanout(max_queue=text_fanout.max_queue, max_lag=text_fanout.max_lag)
+# channel_id: {peer_id: OutboundConnection}
+active_connections: Dict[int, Dict[str, OutboundConnection]] = signaling_fanout.channels
+# Chuyển tiếp offer/answer/ice_candidate, gộp ice_candidate nếu được bật
+signaling_relay = SignalingRelay(coalesce_window=int(os.getenv("SIGNALING_ICE_COALESCE_MS", "0")) / 1000)
+# channel_id: {user_id: OutboundConnection}
+text_connections: Dict[int, Dict[int, OutboundConnection]] = text_fanout.channels
+
+def text_topic(channel_id):
+    return f"text:{channel_id}"
+
+def signaling_topic(channel_id):
+    return f"signaling:{channel_id}"
+
+def deliver_text(channel_id):
+    """Handler của broker: phát tin nhắn chat tới các kết nối cục bộ của channel"""
+    def handler(payload):
+        text_fanout.broadcast_text(channel_id, payload)
+        message_cache.on_broadcast(channel_id, payload)
+    return handler
+
+def deliver_signaling(channel_id):
+    """Handler của broker: chuyển frame signaling tới peer đích hoặc các peer cục bộ"""
+    def handler(payload):
+        header, _, frame = payload.partition("\n")
+        target_id, exclude, action = json.loads(header)
+        if target_id is None:
+            signaling_fanout.broadcast_text(channel_id, frame, exclude=exclude)
+            return
+        target = active_connections.get(channel_id, {}).get(target_id)
+        if target is not None:
+            signaling_relay.forward((channel_id, target_id), target, action, frame)
+    return handler
+
+def push_presence(changes):
+    """
+    Listener của presence_tracker: cập nhật cache và gửi thay đổi trạng thái
+    tới các text channel cục bộ có người dùng đó là thành viên hoặc đang kết nối
+    """
+    for user_id, status in changes.items():
+        channel_cache.update_user(user_id, status)
+        token_cache.invalidate_user(user_id)
+    for channel_id, connections in list(text_connections.items()):
+        channel = channel_cache.peek(channel_id)
+        users = [
+            {"id": user_id, "status": status}
+            for user_id, status in changes.items()
+            if user_id in connections or (channel is not None and channel.is_member(user_id))
+        ]
+        if users:
+            text_fanout.broadcast(channel_id, {"action": "presence", "users": users})
+
+presence_tracker.add_listener(push_presence)
+# Status người gửi trong các tin nhắn đã cache đổi theo channel_cache (cả từ worker khác)
+channel_cache.add_user_listener(message_cache.update_user)
+
+async def publish_signaling(channel_id, frame, target_id=None, exclude=None, action=None):
+    """Gửi frame signaling tới peer target_id, hoặc tới mọi peer trừ exclude, trên mọi worker"""
+    header = json.dumps([target_id, exclude, action])
+    await broker.publish(signaling_topic(channel_id), f"{header}\n{frame}")
 
 @router.websocket("/{channel_id}/signaling")
 async def signaling_websocket(
@@ -26,11 +108,11 @@ async def signaling_websocket(
     channel_id: int,
     peer_id: str,
     token: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Kiểm tra channel tồn tại
     logger.info(f"channel_id: {channel_id}, peer_id: {peer_id}, token: {token}")
-    channel = db.query(Channels).filter(Channels.id == channel_id).first()
+    channel = await channel_cache.get(channel_id)
     if not channel:
         await websocket.close(code=4001, reason="Channel not found")
         logger.warning(f"Channel {channel_id} not found, connection closed")
@@ -60,11 +142,15 @@ async def signaling_websocket(
         )
         logger.info(f"Guest user created: {current_user.username}")
 
-    # Đăng ký peer vào active_connections
-    await websocket.accept()
-    if channel_id not in active_connections:
-        active_connections[channel_id] = {}
-    active_connections[channel_id][peer_id] = websocket
+    # Trả kết nối DB về pool, không giữ trong suốt thời gian WebSocket mở
+    await db.close()
+
+    # Đăng ký peer vào active_connections; cách mã hóa chọn theo subprotocol client đề nghị
+    codec = negotiate_codec(websocket.scope.get("subprotocols"))
+    await websocket.accept(subprotocol=codec.subprotocol)
+    connection = signaling_fanout.add(channel_id, peer_id, websocket, codec=codec)
+    broker.subscribe(signaling_topic(channel_id), deliver_signaling(channel_id))
+    presence_tracker.connect(current_user.id, current_user.status)
     
     # Thông báo peer mới join tới các peer khác
     join_message = {
@@ -88,24 +174,26 @@ async def signaling_websocket(
         }
     )
     
-    for ws in active_connections[channel_id].values():
-        if ws != websocket:  # Không gửi lại cho peer vừa join
-            await ws.send_text(json.dumps(join_message))
+    # Không gửi lại cho peer vừa join
+    await publish_signaling(channel_id, serialize(join_message), exclude=peer_id)
     logger.info(f"User {peer_id} joined voice channel {channel_id}")
 
     try:
         while True:
-            data = await websocket.receive_text()
+            # Thường chỉ đọc action/target_id ở đầu frame (phân tích toàn bộ nếu không
+            # có ở đó hoặc client dùng compact), payload được chuyển tiếp nguyên vẹn
+            message, data = await codec.receive_routed(websocket, ROUTING_FIELDS)
             logger.debug(f"Received from {peer_id}: {data}")
-            message = json.loads(data)
             action = message.get("action")
+            # Mọi frame nhận được đều tính là hoạt động; heartbeat không được chuyển tiếp
+            presence_tracker.heartbeat(current_user.id)
+            if action == "heartbeat":
+                continue
             # Xử lý signaling cho WebRTC
-            if action in ["offer", "answer", "ice_candidate"]:
+            if action in RELAYED_ACTIONS:
                 # send all member in channel => khoong can target id
                 target_id = message.get("target_id")
-                if target_id and channel_id in active_connections and target_id in active_connections[channel_id]:
-                    target_ws = active_connections[channel_id][target_id]
-                    message["peer_id"] = peer_id
+                if target_id:
                     # Log signaling event
                     connection_logger.log_connection(
                         host_type="signaling",
@@ -119,56 +207,68 @@ async def signaling_websocket(
                             "username": current_user.username
                         }
                     )
-                    await target_ws.send_text(json.dumps(message))
+                    # Worker đang giữ kết nối của peer đích sẽ chuyển tiếp frame
+                    try:
+                        frame = with_peer_id(data, peer_id)
+                    except ValueError:
+                        # Frame chưa được phân tích lúc định tuyến (xem receive_routed)
+                        await reject_frame(websocket, CLOSE_INVALID_DATA, "Invalid JSON")
+                    await publish_signaling(channel_id, frame, target_id=target_id, action=action)
                 else:
-                    logger.warning(f"Target {target_id} not found in channel {channel_id}")
+                    logger.warning(f"Missing target_id for {action} in channel {channel_id}")
             else:
                 # Gửi tới tất cả peer khác (nếu cần broadcast thông tin khác)
-                for ws in active_connections[channel_id].values():
-                    if ws != websocket:
-                        await ws.send_text(data)
+                await publish_signaling(channel_id, data, exclude=peer_id)
 
     except WebSocketDisconnect:
-        # Log ngắt kết nối
-        connection_logger.log_connection(
-            host_type="channel_hosting",
-            host_id=channel.id,
-            user_id=current_user.id,
-            channel_id=channel_id,
-            event_type="disconnect",
-            metadata={
-                "peer_id": peer_id,
-                "username": current_user.username
-            }
-        )
-        
-        # Xóa peer khỏi active_connections
-        if channel_id in active_connections and peer_id in active_connections[channel_id]:
-            del active_connections[channel_id][peer_id]
-        
-        # Nếu channel rỗng, xóa channel
-        if channel_id in active_connections and not active_connections[channel_id]:
-            del active_connections[channel_id]
+        logger.info(f"User {peer_id} disconnected from channel {channel_id}")
+    finally:
+        # Dọn dẹp cả khi vòng lặp dừng vì lỗi khác (vd. ConnectionResetError khi publish)
+        presence_tracker.disconnect(current_user.id)
+        # Xóa peer khỏi active_connections (channel rỗng cũng bị xóa)
+        await signaling_fanout.remove(channel_id, peer_id, connection)
+        if channel_id not in active_connections:
+            broker.unsubscribe(signaling_topic(channel_id))
 
-        # Chỉ gửi thông báo "peer_left" nếu channel vẫn còn trong active_connections
-        if channel_id in active_connections:
+        try:
+            # Log ngắt kết nối
+            connection_logger.log_connection(
+                host_type="channel_hosting",
+                host_id=channel.id,
+                user_id=current_user.id,
+                channel_id=channel_id,
+                event_type="disconnect",
+                metadata={
+                    "peer_id": peer_id,
+                    "username": current_user.username
+                }
+            )
+            # Thông báo "peer_left" tới các peer còn lại (có thể ở worker khác)
             leave_message = {
                 "action": "peer_left",
                 "peer_id": peer_id,
                 "channel_id": channel_id
             }
-            for ws in active_connections[channel_id].values():
-                await ws.send_text(json.dumps(leave_message))
-        logger.info(f"User {peer_id} disconnected from channel {channel_id}")
+            await publish_signaling(channel_id, serialize(leave_message))
+        except Exception as e:
+            logger.warning(f"Could not announce that {peer_id} left channel {channel_id}: {str(e)}")
      
 @router.websocket("/{channel_id}")
 async def text_websocket(
     websocket: WebSocket,
     channel_id: int,
     token: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    backfill: int = Query(0, ge=0, le=200),
+    after_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    channel = db.query(Channels).filter(Channels.id == channel_id).first()
+    """
+    Kênh chat văn bản. backfill > 0: gửi ngay sau khi kết nối frame
+    {"action": "history", "messages": [...], "next_cursor": ...} gồm tối đa
+    backfill tin nhắn mới nhất, hoặc các tin nhắn sau after_id khi kết nối lại
+    (cùng trang với GET /channels/{channel_id}/messages).
+    """
+    channel = await channel_cache.get(channel_id)
     if not channel:
         await websocket.close(code=4001, reason="Channel not found")
         logger.warning(f"Text channel {channel_id} not found, connection closed")
@@ -196,12 +296,22 @@ async def text_websocket(
             status="online"
         )
         logger.info(f"Guest user created: {current_user.username}")
+
+    # Trả kết nối DB về pool, không giữ trong suốt thời gian WebSocket mở
+    await db.close()
         
     # handshake dc fastapi xu ly khi dung app.websocket
-    await websocket.accept()
-    if channel_id not in text_connections:
-        text_connections[channel_id] = {}
-    text_connections[channel_id][current_user.id] = websocket
+    codec = negotiate_codec(websocket.scope.get("subprotocols"))
+    await websocket.accept(subprotocol=codec.subprotocol)
+    connection = text_fanout.add(channel_id, current_user.id, websocket, codec=codec)
+    broker.subscribe(text_topic(channel_id), deliver_text(channel_id))
+    message_cache.track(channel_id)
+    presence_tracker.connect(current_user.id, current_user.status)
+
+    if backfill:
+        # Đã nhận broadcast của channel từ trước khi đọc, không bỏ sót tin nhắn ở giữa
+        messages, next_cursor = await message_cache.page(channel_id, after_id=after_id, limit=backfill)
+        connection.send_json({"action": "history", "messages": messages, "next_cursor": next_cursor})
     
     # Log kết nối text channel
     connection_logger.log_connection(
@@ -218,40 +328,56 @@ async def text_websocket(
     
     logger.info(f"User {current_user.username} connected to text channel {channel_id}")
 
+    def log_message(message_id, created_at):
+        # Log message event
+        connection_logger.log_connection(
+            host_type="message",
+            host_id=channel.id,
+            user_id=current_user.id,
+            channel_id=channel_id,
+            event_type="send_message",
+            metadata={
+                "message_id": message_id,
+                "username": current_user.username,
+                "timestamp": created_at
+            }
+        )
+
+    async def confirm_message(saved, temp_id, created_at):
+        # Gửi ID đã được commit cho người gửi (chế độ optimistic)
+        try:
+            message_id = await saved
+            log_message(message_id, created_at)
+            connection.send_json({"action": "message_ack", "temp_id": temp_id, "id": message_id})
+        except Exception as e:
+            logger.warning(f"Could not confirm message {temp_id} in channel {channel_id}: {str(e)}")
+
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            message_data, _ = await codec.receive(websocket)
             logger.debug(f"Received from {current_user.id}: {message_data}")
-            new_message = Messages(
-                content=message_data["content"],
+            presence_tracker.heartbeat(current_user.id)
+            if message_data.get("action") == "heartbeat":
+                continue
+            # Kiểm tra trước khi vào lô ghi chung với tin nhắn của người khác
+            content = message_data.get("content")
+            if not isinstance(content, str):
+                connection.send_json({"action": "message_error", "detail": "Message content must be a string"})
+                continue
+            # Thời điểm do server gán, không dùng giá trị client gửi
+            created_at = datetime.utcnow()
+            # Tin nhắn được ghi theo lô bởi message_persister
+            saved = message_persister.submit(
+                content=content,
                 channel_id=channel_id,
                 sender_id=current_user.id,
-                created_at=message_data["created_at"]
-            )
-            db.add(new_message)
-            db.commit()
-            db.refresh(new_message)
-            logger.debug(f"New message: {new_message.id}")
-            
-            # Log message event
-            connection_logger.log_connection(
-                host_type="message",
-                host_id=channel.id,
-                user_id=current_user.id,
-                channel_id=channel_id,
-                event_type="send_message",
-                metadata={
-                    "message_id": new_message.id,
-                    "username": current_user.username,
-                    "timestamp": new_message.created_at
-                }
+                created_at=created_at
             )
             
             response = {
-                "id": new_message.id,
-                "content": new_message.content,
-                "created_at": new_message.created_at,
+                "id": None,
+                "content": content,
+                "created_at": created_at.isoformat(),
                 "sender": {
                     "id": current_user.id,
                     "username": current_user.username,
@@ -259,25 +385,43 @@ async def text_websocket(
                     "status": current_user.status
                 }
             }
-            # Gửi tin nhắn tới tất cả client trong channel
-            for ws in text_connections[channel_id].values():
-                await ws.send_json(response)
+            if message_persister.optimistic:
+                # Broadcast ngay với temp_id, người gửi nhận ID thật khi commit xong
+                response["temp_id"] = message_data.get("temp_id") or uuid.uuid4().hex
+                asyncio.create_task(confirm_message(saved, response["temp_id"], response["created_at"]))
+            else:
+                try:
+                    response["id"] = await saved
+                except Exception as e:
+                    logger.error(f"Error saving message in channel {channel_id}: {str(e)}")
+                    connection.send_json({"action": "message_error", "detail": "Could not save message"})
+                    continue
+                log_message(response["id"], response["created_at"])
+
+            # Gửi tin nhắn tới tất cả client trong channel (mã hóa một lần)
+            await broker.publish(text_topic(channel_id), serialize(response))
     except WebSocketDisconnect:
-        # Log ngắt kết nối text channel
-        connection_logger.log_connection(
-            host_type="text_channel",
-            host_id=channel.id,
-            user_id=current_user.id,
-            channel_id=channel_id,
-            event_type="disconnect",
-            metadata={
-                "user_id": current_user.id,
-                "username": current_user.username
-            }
-        )
-        
-        if channel_id in text_connections and current_user.id in text_connections.get(channel_id, {}):
-            del text_connections[channel_id][current_user.id]
-            logger.info(f"User {current_user.username} disconnected from text channel {channel_id}")
-        if channel_id in text_connections and not text_connections[channel_id]:
-            del text_connections[channel_id]
\ No newline at end of file
+        logger.info(f"User {current_user.username} disconnected from text channel {channel_id}")
+    finally:
+        # Dọn dẹp cả khi vòng lặp dừng vì lỗi khác (vd. ConnectionResetError khi publish)
+        presence_tracker.disconnect(current_user.id)
+        await text_fanout.remove(channel_id, current_user.id, connection)
+        if channel_id not in text_connections:
+            broker.unsubscribe(text_topic(channel_id))
+            message_cache.untrack(channel_id)
+
+        try:
+            # Log ngắt kết nối text channel
+            connection_logger.log_connection(
+                host_type="text_channel",
+                host_id=channel.id,
+                user_id=current_user.id,
+                channel_id=channel_id,
+                event_type="disconnect",
+                metadata={
+                    "user_id": current_user.id,
+                    "username": current_user.username
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Could not log disconnect of {current_user.username} from text channel {channel_id}: {str(e)}")
@@ -2,12 +2,19 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from datetime import datetime, timedelta
 import hashlib
+import json
+import uuid
 from models import Users
-from database import get_db
+from database import get_async_db
+from service.broker import get_broker
 from typing import Optional
+from collections import OrderedDict
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,9 +22,110 @@ load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY");
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 3600
+# Topic broker để các worker khác xóa token của người dùng vừa thay đổi
+INVALIDATION_TOPIC = "cache:tokens"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+class UserSnapshot:
+    """Thông tin người dùng rút gọn được giữ trong cache token (không gắn với Session)"""
+    __slots__ = ("id", "username", "full_name", "status", "is_active")
+
+    def __init__(self, id, username, full_name, status, is_active):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.status = status
+        self.is_active = is_active
+
+    @classmethod
+    def from_user(cls, user: Users):
+        return cls(user.id, user.username, user.full_name, user.status, user.is_active)
+
+class TokenCache:
+    """
+    Cache LRU có hạn dùng cho token: giữ claims đã giải mã và UserSnapshot.
+    Mỗi mục hết hạn khi token hết hạn hoặc sau ttl giây, và bị xóa khi thông
+    tin người dùng thay đổi (invalidate_user); publish phát yêu cầu xóa qua
+    broker để các worker khác không giữ UserSnapshot cũ.
+    """
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # token: (expires_at, claims, snapshot)
+        self._entries = OrderedDict()
+        # user_id: {token}
+        self._tokens_by_user = {}
+        self._origin = uuid.uuid4().hex
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        entry = self._entries.get(token)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, token: str, claims: dict, snapshot: UserSnapshot):
+        expires_at = time.time() + self.ttl
+        if claims.get("exp"):
+            expires_at = min(expires_at, claims["exp"])
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (expires_at, claims, snapshot)
+        self._tokens_by_user.setdefault(snapshot.id, set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """Xóa mọi mục của một người dùng (khi status hoặc is_active thay đổi)"""
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    async def publish(self, user_id):
+        """Báo cho các worker khác xóa mục của user_id"""
+        await get_broker().publish(INVALIDATION_TOPIC, json.dumps({"origin": self._origin, "user_id": user_id}))
+
+    def subscribe(self):
+        """Nhận yêu cầu xóa từ các worker khác qua broker"""
+        get_broker().subscribe(INVALIDATION_TOPIC, self._on_invalidation)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    def _on_invalidation(self, payload):
+        message = json.loads(payload)
+        if message.get("origin") != self._origin:
+            self.invalidate_user(message["user_id"])
+
+    def _remove(self, token):
+        _, _, snapshot = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(snapshot.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[snapshot.id]
+
+token_cache = TokenCache(
+    max_entries=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+)
+
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
@@ -40,8 +148,11 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
-# Hàm xác thực token (tách riêng để tái sử dụng)
-async def verify_token(token: str, db: Session) -> Optional[Users]:
+async def resolve_user(token: str, db: AsyncSession) -> UserSnapshot:
+    """Giải mã token và lấy người dùng, dùng token_cache để tránh truy vấn lặp lại"""
+    user = token_cache.get(token)
+    if user is not None:
+        return user
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,10 +165,16 @@ async def verify_token(token: str, db: Session) -> Optional[Users]:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(Users).filter(Users.username == username).first()
+    user = (await db.execute(select(Users).where(Users.username == username))).scalars().first()
     if user is None or not user.is_active:
         raise credentials_exception
-    return user
+    snapshot = UserSnapshot.from_user(user)
+    token_cache.put(token, payload, snapshot)
+    return snapshot
+
+# Hàm xác thực token (tách riêng để tái sử dụng)
+async def verify_token(token: str, db: AsyncSession) -> Optional[UserSnapshot]:
+    return await resolve_user(token, db)
 
 def getUsernameByToken(token: str):
     credentials_exception = HTTPException(
@@ -74,25 +191,10 @@ def getUsernameByToken(token: str):
     except JWTError:
         raise credentials_exception
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(Users).filter(Users.username == username).first()
-    if user is None or not user.is_active:
-        raise credentials_exception
-    return user
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await resolve_user(token, db)
 
-async def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user_optional(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     try:
         return await get_current_user(token, db)
     except HTTPException:
@@ -0,0 +1,273 @@
+import asyncio
+import os
+import struct
+import sys
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import urlparse
+from service.logger import get_logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = get_logger("broker")
+
+# Frame giữa worker và broker server: op (1 byte), độ dài topic (2 byte), độ dài payload (4 byte)
+FRAME_HEADER = struct.Struct(">BHI")
+OP_SUBSCRIBE = 1
+OP_UNSUBSCRIBE = 2
+OP_PUBLISH = 3
+
+
+def pack_frame(op, topic: str, payload: str = "") -> bytes:
+    topic_bytes = topic.encode()
+    payload_bytes = payload.encode()
+    return FRAME_HEADER.pack(op, len(topic_bytes), len(payload_bytes)) + topic_bytes + payload_bytes
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    """
+    Đọc một frame từ stream
+
+    Returns:
+        Tuple (op, topic, payload, frame gốc dạng bytes)
+    """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    op, topic_length, payload_length = FRAME_HEADER.unpack(header)
+    body = await reader.readexactly(topic_length + payload_length)
+    topic = body[:topic_length].decode()
+    payload = body[topic_length:].decode()
+    return op, topic, payload, header + body
+
+
+async def open_stream(url: str):
+    """Mở kết nối tới broker theo URL unix:///đường/dẫn hoặc tcp://host:port"""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return await asyncio.open_unix_connection(parsed.path)
+    return await asyncio.open_connection(parsed.hostname, parsed.port)
+
+
+class Broker(ABC):
+    """
+    Pub/sub giữa các worker cho việc phát tin nhắn theo channel và signaling
+    tới peer. Mỗi worker đăng ký một handler cho mỗi topic mà nó có kết nối
+    cục bộ; handler được gọi trên event loop với payload dạng chuỗi.
+    """
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[str], None]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, topic: str, payload: str):
+        """Phát payload tới mọi worker có handler cho topic"""
+
+    def subscribe(self, topic: str, handler: Callable[[str], None]):
+        self._handlers[topic] = handler
+
+    def unsubscribe(self, topic: str):
+        self._handlers.pop(topic, None)
+
+    def _dispatch(self, topic: str, payload: str):
+        handler = self._handlers.get(topic)
+        if handler is None:
+            return
+        try:
+            handler(payload)
+        except Exception as e:
+            logger.error(f"Error handling message on topic {topic}: {str(e)}")
+
+
+class InProcessBroker(Broker):
+    """Broker trong tiến trình (chạy một worker): giao ngay cho handler cục bộ"""
+    async def publish(self, topic: str, payload: str):
+        self._dispatch(topic, payload)
+
+
+class SocketBroker(Broker):
+    """
+    Client của BrokerServer qua Unix socket hoặc TCP. Tin nhắn được phát qua
+    broker server (kể cả tới chính worker gửi) nên mọi worker nhận cùng thứ tự.
+    Tự kết nối lại và đăng ký lại các topic khi mất kết nối.
+    """
+    def __init__(self, url: str, connect_timeout=1.0):
+        super().__init__()
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def publish(self, topic: str, payload: str):
+        if self._writer is None:
+            await self.start()
+            try:
+                await asyncio.wait_for(self._connected.wait(), self.connect_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Broker {self.url} unavailable, dropping message on topic {topic}")
+                return
+        try:
+            self._writer.write(pack_frame(OP_PUBLISH, topic, payload))
+            await self._writer.drain()
+        except OSError as e:
+            # Mất kết nối giữa chừng (ConnectionResetError, BrokenPipeError...): _run tự kết nối lại
+            logger.warning(f"Broker connection {self.url} lost, dropping message on topic {topic}: {str(e)}")
+
+    def subscribe(self, topic: str, handler: Callable[[str], None]):
+        super().subscribe(topic, handler)
+        if self._writer is not None:
+            self._writer.write(pack_frame(OP_SUBSCRIBE, topic))
+
+    def unsubscribe(self, topic: str):
+        super().unsubscribe(topic)
+        if self._writer is not None:
+            self._writer.write(pack_frame(OP_UNSUBSCRIBE, topic))
+
+    async def _run(self):
+        delay = 0.1
+        while True:
+            try:
+                reader, writer = await open_stream(self.url)
+                for topic in self._handlers:
+                    writer.write(pack_frame(OP_SUBSCRIBE, topic))
+                self._writer = writer
+                self._connected.set()
+                delay = 0.1
+                logger.info(f"Connected to broker {self.url}")
+                while True:
+                    op, topic, payload, _ = await read_frame(reader)
+                    if op == OP_PUBLISH:
+                        self._dispatch(topic, payload)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.warning(f"Broker connection {self.url} lost: {str(e)}")
+            self._writer = None
+            self._connected.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+
+class BrokerServer:
+    """
+    Broker server cục bộ: chuyển tiếp frame PUBLISH tới các client đã đăng ký topic.
+    Client nhận không kịp (bộ đệm gửi vượt max_buffer byte) bị ngắt kết nối
+    thay vì để bộ nhớ của broker tăng mãi; SocketBroker tự kết nối và đăng
+    ký lại.
+    """
+    def __init__(self, url: str, max_buffer=64 * 1024 * 1024):
+        self.url = url
+        self.max_buffer = max_buffer
+        self._topics: Dict[str, Set[asyncio.StreamWriter]] = {}
+
+    async def serve(self):
+        parsed = urlparse(self.url)
+        if parsed.scheme == "unix":
+            if os.path.exists(parsed.path):
+                os.remove(parsed.path)
+            server = await asyncio.start_unix_server(self._handle, path=parsed.path)
+        else:
+            server = await asyncio.start_server(self._handle, parsed.hostname, parsed.port)
+        logger.info(f"Broker listening on {self.url}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        topics = set()
+        try:
+            while True:
+                op, topic, _, frame = await read_frame(reader)
+                if op == OP_SUBSCRIBE:
+                    self._topics.setdefault(topic, set()).add(writer)
+                    topics.add(topic)
+                elif op == OP_UNSUBSCRIBE:
+                    self._discard(topic, writer)
+                    topics.discard(topic)
+                elif op == OP_PUBLISH:
+                    stalled = []
+                    for subscriber in self._topics.get(topic, ()):
+                        subscriber.write(frame)
+                        if subscriber.transport.get_write_buffer_size() > self.max_buffer:
+                            stalled.append(subscriber)
+                    for subscriber in stalled:
+                        self._disconnect(subscriber)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for topic in topics:
+                self._discard(topic, writer)
+            writer.close()
+
+    def _disconnect(self, writer):
+        """Ngắt một client nhận chậm, bỏ phần dữ liệu chưa gửi"""
+        logger.warning(f"Disconnecting stalled broker subscriber ({writer.transport.get_write_buffer_size()} bytes buffered)")
+        for topic in [topic for topic, subscribers in self._topics.items() if writer in subscribers]:
+            self._discard(topic, writer)
+        writer.transport.abort()
+
+    def _discard(self, topic, writer):
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self._topics[topic]
+
+
+def create_broker(url: str) -> Broker:
+    """
+    Tạo broker theo URL
+
+    Args:
+        url: memory:// (một worker), unix:///đường/dẫn hoặc tcp://host:port
+
+    Returns:
+        Broker instance
+    """
+    if not url or url.startswith("memory://"):
+        return InProcessBroker()
+    return SocketBroker(url)
+
+
+def run_broker_server(url: str):
+    """Chạy broker server (dùng cho tiến trình riêng)"""
+    asyncio.run(BrokerServer(url, max_buffer=BROKER_MAX_BUFFER).serve())
+
+
+# Tạo instance mặc định của Broker
+BROKER_URL = os.getenv("BROKER_URL", "memory://")
+# Bộ đệm gửi tối đa cho mỗi worker tại broker server trước khi ngắt kết nối worker đó
+BROKER_MAX_BUFFER = int(os.getenv("BROKER_MAX_BUFFER_MB", "64")) * 1024 * 1024
+broker = create_broker(BROKER_URL)
+
+def get_broker():
+    """
+    Lấy instance mặc định của Broker
+
+    Returns:
+        Broker instance
+    """
+    return broker
+
+
+if __name__ == "__main__":
+    # python -m service.broker unix:///tmp/chatapp-broker.sock
+    run_broker_server(sys.argv[1] if len(sys.argv) > 1 else BROKER_URL)
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import select
+from database import AsyncReadSessionLocal
+from models import Channels, ChannelMembers, Users
+from service.broker import get_broker
+from service.logger import get_logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = get_logger("channel_cache")
+
+# Topic broker để các worker khác xóa mục cache khi dữ liệu thay đổi
+INVALIDATION_TOPIC = "cache:channels"
+
+
+class MemberUser:
+    """Thông tin người dùng của thành viên, dùng chung giữa các channel trong cache"""
+    __slots__ = ("id", "username", "full_name", "status")
+
+    def __init__(self, id, username, full_name, status):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.status = status
+
+
+class MemberInfo:
+    __slots__ = ("id", "role", "user")
+
+    def __init__(self, id, role, user: MemberUser):
+        self.id = id
+        self.role = role
+        self.user = user
+
+
+class ChannelInfo:
+    """Metadata và danh sách thành viên của một channel (không gắn với Session)"""
+    __slots__ = ("id", "name", "channel_type", "server_id", "members", "expires_at")
+
+    def __init__(self, id, name, channel_type, server_id, members: Dict[int, MemberInfo], expires_at):
+        self.id = id
+        self.name = name
+        self.channel_type = channel_type
+        self.server_id = server_id
+        # user_id: MemberInfo
+        self.members = members
+        self.expires_at = expires_at
+
+    def is_member(self, user_id) -> bool:
+        return user_id in self.members
+
+    def member_list(self, exclude_user_id=None) -> List[MemberInfo]:
+        return [member for user_id, member in self.members.items() if user_id != exclude_user_id]
+
+
+class ChannelCache:
+    """
+    Cache LRU có hạn cho metadata và thành viên của channel, dùng chung cho
+    REST và WebSocket.
+
+    Một channel được nạp trong một lượt (channel + thành viên kèm người dùng
+    bằng một truy vấn JOIN); các yêu cầu đồng thời cho cùng channel chờ chung
+    một lần nạp. Mục cache được cập nhật hoặc xóa khi tạo channel, join, leave
+    và đổi status; thay đổi được phát qua broker để các worker khác xóa bản
+    sao của chúng.
+    """
+    def __init__(self, session_factory=AsyncReadSessionLocal, max_channels=10000, ttl=300):
+        self.session_factory = session_factory
+        self.max_channels = max_channels
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._channels: "OrderedDict[int, ChannelInfo]" = OrderedDict()
+        self._users: Dict[int, MemberUser] = {}
+        # user_id: {channel_id}
+        self._channels_by_user: Dict[int, set] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._user_listeners: List[Callable[[int, str], None]] = []
+        self._origin = uuid.uuid4().hex
+
+    async def get(self, channel_id) -> Optional[ChannelInfo]:
+        """
+        Lấy channel kèm thành viên, nạp từ DB nếu chưa có trong cache
+
+        Returns:
+            ChannelInfo hoặc None nếu channel không tồn tại
+        """
+        channel = self._channels.get(channel_id)
+        if channel is not None and channel.expires_at > time.monotonic():
+            self._channels.move_to_end(channel_id)
+            self.hits += 1
+            return channel
+        self.misses += 1
+
+        loading = self._loading.get(channel_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[channel_id] = loading
+        try:
+            channel = await self._load(channel_id)
+            if channel is not None and self._loading.get(channel_id) is loading:
+                self._put(channel)
+            loading.set_result(channel)
+            return channel
+        except Exception as e:
+            loading.set_exception(e)
+            # Tránh cảnh báo "exception was never retrieved" khi không ai chờ
+            loading.exception()
+            raise
+        finally:
+            if self._loading.get(channel_id) is loading:
+                del self._loading[channel_id]
+
+    def peek(self, channel_id) -> Optional[ChannelInfo]:
+        """Lấy channel nếu đã có trong cache, không nạp từ DB"""
+        return self._channels.get(channel_id)
+
+    def put_channel(self, channel: Channels):
+        """Đưa một channel vừa tạo (đã nạp members.user) vào cache"""
+        members = {}
+        for member in channel.members:
+            members[member.user_id] = MemberInfo(member.id, member.role, self._user(
+                member.user.id, member.user.username, member.user.full_name, member.user.status
+            ))
+        self._put(ChannelInfo(
+            channel.id, channel.name, channel.channel_type, channel.server_id, members,
+            time.monotonic() + self.ttl
+        ))
+
+    def add_member(self, channel_id, member_id, role, user):
+        """Thêm thành viên vào channel đã có trong cache (sau khi join)"""
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            return
+        channel.members[user.id] = MemberInfo(member_id, role, self._user(user.id, user.username, user.full_name, user.status))
+        self._channels_by_user.setdefault(user.id, set()).add(channel_id)
+
+    def remove_member(self, channel_id, user_id):
+        """Xóa thành viên khỏi channel trong cache (sau khi leave)"""
+        channel = self._channels.get(channel_id)
+        if channel is not None:
+            channel.members.pop(user_id, None)
+        self._forget(user_id, channel_id)
+
+    def update_user(self, user_id, status):
+        """Cập nhật status của người dùng trong mọi channel đã cache"""
+        user = self._users.get(user_id)
+        if user is not None:
+            user.status = status
+        for listener in self._user_listeners:
+            listener(user_id, status)
+
+    def add_user_listener(self, listener: Callable[[int, str], None]):
+        """Đăng ký hàm nhận (user_id, status) khi status thay đổi (cả từ worker khác)"""
+        self._user_listeners.append(listener)
+
+    def invalidate(self, channel_id):
+        """Xóa một channel khỏi cache (lần truy cập sau sẽ nạp lại)"""
+        self._loading.pop(channel_id, None)
+        channel = self._channels.pop(channel_id, None)
+        if channel is not None:
+            for user_id in channel.members:
+                self._forget(user_id, channel_id)
+
+    async def publish(self, channel_ids=(), user_id=None, status=None):
+        """Báo cho các worker khác xóa channel_ids / cập nhật status của user_id"""
+        payload = {"origin": self._origin, "channel_ids": list(channel_ids)}
+        if user_id is not None:
+            payload["user"] = [user_id, status]
+        await get_broker().publish(INVALIDATION_TOPIC, json.dumps(payload))
+
+    def subscribe(self):
+        """Nhận thông báo thay đổi từ các worker khác qua broker"""
+        get_broker().subscribe(INVALIDATION_TOPIC, self._on_invalidation)
+
+    def clear(self):
+        self._channels.clear()
+        self._users.clear()
+        self._channels_by_user.clear()
+        self._loading.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "channels": len(self._channels),
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    def _on_invalidation(self, payload):
+        message = json.loads(payload)
+        if message.get("origin") == self._origin:
+            return
+        for channel_id in message.get("channel_ids", ()):
+            self.invalidate(channel_id)
+        if "user" in message:
+            self.update_user(*message["user"])
+
+    async def _load(self, channel_id) -> Optional[ChannelInfo]:
+        async with self.session_factory() as db:
+            channel = await db.get(Channels, channel_id)
+            if channel is None:
+                return None
+            rows = await db.execute(
+                select(
+                    ChannelMembers.id, ChannelMembers.role,
+                    Users.id, Users.username, Users.full_name, Users.status
+                )
+                .join(Users, Users.id == ChannelMembers.user_id)
+                .where(ChannelMembers.channel_id == channel_id)
+            )
+            members = {
+                user_id: MemberInfo(member_id, role, self._user(user_id, username, full_name, status))
+                for member_id, role, user_id, username, full_name, status in rows
+            }
+        return ChannelInfo(
+            channel.id, channel.name, channel.channel_type, channel.server_id, members,
+            time.monotonic() + self.ttl
+        )
+
+    def _user(self, user_id, username, full_name, status) -> MemberUser:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = MemberUser(user_id, username, full_name, status)
+        else:
+            user.username, user.full_name, user.status = username, full_name, status
+        return user
+
+    def _put(self, channel: ChannelInfo):
+        self._loading.pop(channel.id, None)
+        previous = self._channels.pop(channel.id, None)
+        self._channels[channel.id] = channel
+        # Đăng ký thành viên của mục mới trước khi bỏ mục cũ: người dùng còn
+        # trong mục mới không bị _forget xóa khỏi _users
+        for user_id, member in channel.members.items():
+            member.user = self._users.setdefault(user_id, member.user)
+            self._channels_by_user.setdefault(user_id, set()).add(channel.id)
+        if previous is not None:
+            for user_id in previous.members:
+                if user_id not in channel.members:
+                    self._forget(user_id, channel.id)
+        while len(self._channels) > self.max_channels:
+            self.invalidate(next(iter(self._channels)))
+
+    def _forget(self, user_id, channel_id):
+        channel_ids = self._channels_by_user.get(user_id)
+        if channel_ids is None:
+            return
+        channel_ids.discard(channel_id)
+        if not channel_ids:
+            del self._channels_by_user[user_id]
+            self._users.pop(user_id, None)
+
+
+# Tạo instance mặc định của ChannelCache
+channel_cache = ChannelCache(
+    max_channels=int(os.getenv("CHANNEL_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("CHANNEL_CACHE_TTL_SECONDS", "300"))
+)
+
+def get_channel_cache():
+    """
+    Lấy instance mặc định của ChannelCache
+
+    Returns:
+        ChannelCache instance
+    """
+    return channel_cache
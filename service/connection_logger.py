@@ -1,32 +1,180 @@
 import logging
 import os
+import glob
 import json
+import queue
+import threading
+import uuid
 from datetime import datetime
 import time
+from service.logger import get_logger
+from service.log_index import LogIndex, query_segments, merge_segments
+from service.log_stats import LogStats, combine
+from service.log_segments import SegmentManager
+from service.log_policy import LogPolicy, parse_rules
+from service.broker import get_broker
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Không có trên Windows: mọi worker dùng chung một tệp log
+    fcntl = None
+
+load_dotenv()
+
+logger = get_logger("connection_logger")
+
+# Chính sách khi hàng đợi ghi log bị đầy
+OVERFLOW_BLOCK = "block"    # Chờ hàng đợi có chỗ trống (tối đa block_timeout giây), hết thời gian thì như count
+OVERFLOW_DROP = "drop"      # Bỏ bản ghi mới
+OVERFLOW_COUNT = "count"    # Bỏ bản ghi mới và ghi lại số lượng bị bỏ vào log
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_COUNT)
+
+# Topic broker phát quy tắc ghi log mới tới mọi worker
+POLICY_TOPIC = "connection_logs:policy"
+# Topic broker yêu cầu mọi worker xóa tệp log của mình
+CLEAR_TOPIC = "connection_logs:clear"
+# Số lần đọc lại khi tệp của worker khác bị xoay vòng/nén giữa chừng
+PEER_READ_ATTEMPTS = 3
+
+
+def slot_log_file(log_file, slot):
+    """Tệp log của worker ở slot (slot 0 dùng chính log_file)"""
+    if slot == 0:
+        return log_file
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{slot}{ext}"
+
+
+def claim_slot(log_file):
+    """
+    Giữ slot nhỏ nhất còn trống cho tiến trình này bằng flock trên
+    <log_file không đuôi>.<slot>.lock; khóa tự nhả khi tiến trình kết thúc nên
+    worker khởi động lại dùng lại tệp của slot cũ.
+
+    Returns:
+        (slot, tệp khóa đang mở), (0, None) nếu không có fcntl
+    """
+    if fcntl is None:
+        return 0, None
+    root, _ = os.path.splitext(log_file)
+    slot = 0
+    while True:
+        handle = open(f"{root}.{slot}.lock", "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            slot += 1
+            continue
+        return slot, handle
+
+
+def known_slots(log_file):
+    """Các slot đã từng được worker nào đó giữ (có tệp khóa)"""
+    root, _ = os.path.splitext(log_file)
+    slots = []
+    for path in glob.glob(glob.escape(root) + ".*.lock"):
+        slot = path[len(root) + 1:-len(".lock")]
+        if slot.isdigit():
+            slots.append(int(slot))
+    return sorted(slots)
+
+# Đánh dấu dừng luồng ghi
+_STOP = object()
+# Đánh thức luồng ghi (xem _policy_changed)
+_WAKE = object()
 
 class ConnectionLogger:
     """
     Logger để theo dõi các kết nối host (centralized hoặc channel hosting)
     Tự động xoay vòng tệp log khi số lượng bản ghi vượt quá giới hạn.
+
+    Bản ghi được đưa vào hàng đợi có giới hạn và một luồng nền ghi theo lô
+    (mỗi lô là một lần write), nên log_connection không chặn event loop.
+    Mỗi bản ghi được đánh chỉ mục (xem LogIndex) ngay khi ghi để truy vấn
+    có lọc và phân trang không phải quét toàn bộ tệp, đồng thời được cộng vào
+    thống kê (xem LogStats) để get_stats không phải đọc lại tệp. Các tệp đã
+    xoay vòng do SegmentManager quản lý (nén, lưu giữ) và vẫn được truy vấn.
+    Sự kiện tần suất cao được lấy mẫu hoặc gộp thành bản ghi tổng hợp theo
+    chính sách (xem LogPolicy) trước khi vào hàng đợi.
+
+    Với worker_slots, mỗi tiến trình (worker uvicorn) giữ một slot riêng
+    (claim_slot) và chỉ ghi, xoay vòng, nén, xóa tệp log của slot đó. Truy vấn
+    và thống kê đọc thêm tệp của các slot khác (chỉ đọc) rồi trộn kết quả;
+    quy tắc ghi log dùng chung một tệp cho mọi worker.
     """
-    def __init__(self, log_file="logs/connections.log", max_records=10000):
+    def __init__(self, log_file="logs/connections.log", max_records=10000,
+                 queue_size=10000, batch_size=500, overflow_policy=OVERFLOW_COUNT, block_timeout=0.05,
+                 index_checkpoint_records=1000, stats_file=None, stats_checkpoint_interval=5.0,
+                 retention_bytes=None, retention_seconds=None, compress_segments=True,
+                 policy_rules=None, policy_file=None, aggregate_interval=60.0, worker_slots=False):
         # Tạo thư mục logs nếu chưa tồn tại
         log_dir = os.path.dirname(log_file)
         if log_dir and not os.path.exists(log_dir):
             os.makedirs(log_dir, exist_ok=True)
-        
+
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow_policy}")
+
+        # Tệp chung (tên gốc của các slot, tệp quy tắc) và tệp của worker này
+        self.base_log_file = log_file
+        self.worker_slots = worker_slots
+        self.slot, self._slot_lock = claim_slot(log_file) if worker_slots else (0, None)
+        self._origin = uuid.uuid4().hex
+        # Chỉ mục segment của các slot khác: tệp log -> SegmentManager (chỉ đọc)
+        self._peers = {}
+        log_file = slot_log_file(log_file, self.slot)
+
         self.log_file = log_file
         self.max_records = max_records
         self.record_count = 0
+        self.batch_size = batch_size
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.dropped_count = 0
+        self.index_checkpoint_records = index_checkpoint_records
+        self.stats_checkpoint_interval = stats_checkpoint_interval
+        self._stats_saved_at = time.monotonic()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self._pending_dropped = 0
+        # dropped_count/_pending_dropped được tăng ở event loop và đọc ở luồng ghi
+        self._dropped_lock = threading.Lock()
+        # Quy tắc ghi log đã đổi: luồng ghi ghi ngay các cửa sổ tổng hợp đang mở
+        self._policy_changed = threading.Event()
+        # Timestamp của bản ghi mới nhất đã ghi (chỉ luồng ghi dùng)
+        self._last_timestamp = ""
         
-        # Đếm số lượng bản ghi hiện tại nếu tệp đã tồn tại
-        if os.path.exists(log_file):
-            with open(log_file, 'r', encoding='utf-8') as f:
-                self.record_count = sum(1 for _ in f)
+        # Nạp chỉ mục (và số lượng bản ghi hiện tại) nếu tệp đã tồn tại
+        self.index = LogIndex(log_file)
+        self.index.load()
+        self.record_count = len(self.index)
+
+        # Quản lý các segment đã xoay vòng
+        self.segments = SegmentManager(
+            log_file,
+            max_total_bytes=retention_bytes,
+            max_age_seconds=retention_seconds,
+            compress=compress_segments,
+            on_remove=self._forget_segments
+        )
+
+        # Nạp thống kê đã checkpoint
+        self.stats = LogStats(stats_file or f"{os.path.splitext(log_file)[0]}.stats.json")
+        self.stats.load(log_file)
+
+        # Chính sách ghi theo loại sự kiện: quy tắc đã lưu (đổi lúc chạy) được ưu tiên hơn cấu hình
+        self.policy = LogPolicy(policy_file or f"{os.path.splitext(self.base_log_file)[0]}.policy.json", aggregate_interval)
+        if not self.policy.load():
+            self.policy.set_rules(policy_rules or [])
                 
     def log_connection(self, host_type, host_id, user_id, channel_id=None, event_type="connect", metadata=None):
         """
-        Ghi lại thông tin kết nối
+        Ghi lại thông tin kết nối (bất đồng bộ qua hàng đợi)
         
         Args:
             host_type: Loại host (centralized_host/channel_hosting/text_channel/message/signaling)
@@ -36,9 +184,13 @@ class ConnectionLogger:
             event_type: Loại sự kiện (connect/disconnect/create/send_message/offer/answer/ice_candidate)
             metadata: Thông tin bổ sung (nếu có)
         """
-        if self.record_count >= self.max_records:
-            self._rotate_log()
-            
+        self._ensure_writer()
+        write, sample_rate = self.policy.decide(host_type, event_type, host_id, channel_id, user_id)
+        if not write:
+            return
+        metadata = metadata or {}
+        if sample_rate is not None:
+            metadata = {**metadata, "sample_rate": sample_rate}
         timestamp = datetime.now().isoformat()
         log_entry = {
             "timestamp": timestamp,
@@ -47,122 +199,366 @@ class ConnectionLogger:
             "user_id": user_id,
             "channel_id": channel_id,
             "event_type": event_type,
-            "metadata": metadata or {}
+            "metadata": metadata
         }
-        
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry) + '\n')
-        
-        self.record_count += 1
+
+        try:
+            if self.overflow_policy == OVERFLOW_BLOCK:
+                # Gọi từ event loop: chỉ chờ trong thời gian ngắn
+                self._queue.put(log_entry, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(log_entry)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped_count += 1
+                if self.overflow_policy != OVERFLOW_DROP:
+                    self._pending_dropped += 1
+
+    def get_policy(self):
+        """Các quy tắc ghi log hiện tại"""
+        return self.policy.rules()
+
+    def set_policy(self, rules, save=True):
+        """
+        Thay toàn bộ quy tắc ghi log của worker này (ValueError nếu không hợp lệ)
+
+        Các sự kiện đang được gộp theo quy tắc cũ được ghi ngay thành bản ghi
+        tổng hợp (cửa sổ chưa đủ interval).
+
+        Args:
+            rules: Danh sách dict (host_type, event_type, mode, rate, interval_seconds)
+            save: Lưu xuống tệp để giữ qua các lần khởi động lại
+        """
+        self.policy.set_rules(rules)
+        if save:
+            self.policy.save()
+        self._ensure_writer()
+        # Đánh thức luồng ghi: ghi các cửa sổ cũ và chuyển sang chờ theo chu kỳ mới.
+        # Không chặn khi hàng đợi đầy: luồng ghi đang bận và sẽ thấy cờ ở lô tiếp theo
+        self._policy_changed.set()
+        try:
+            self._queue.put_nowait(_WAKE)
+        except queue.Full:
+            pass
+
+    async def publish_policy(self):
+        """Phát quy tắc hiện tại tới các worker khác qua broker"""
+        await get_broker().publish(POLICY_TOPIC, json.dumps({"rules": self.policy.rules()}))
+
+    def release_slot(self):
+        """Nhả slot cho tiến trình khác (tiến trình này không ghi log, ví dụ tiến trình quản lý worker)"""
+        if self._slot_lock is not None:
+            self._slot_lock.close()
+            self._slot_lock = None
+
+    async def publish_clear(self):
+        """Yêu cầu các worker khác xóa tệp log của chúng (sau khi clear ở worker này)"""
+        await get_broker().publish(CLEAR_TOPIC, json.dumps({"origin": self._origin}))
+
+    def subscribe(self):
+        """Nhận quy tắc ghi log thay đổi và yêu cầu xóa log từ worker khác qua broker"""
+        get_broker().subscribe(POLICY_TOPIC, self._on_policy)
+        get_broker().subscribe(CLEAR_TOPIC, self._on_clear)
+
+    def _on_clear(self, payload):
+        if json.loads(payload).get("origin") == self._origin:
+            return
+        # clear chờ luồng ghi: không chạy trên event loop
+        threading.Thread(target=self.clear, name="connection-log-clear", daemon=True).start()
+
+    def _on_policy(self, payload):
+        rules = json.loads(payload)["rules"]
+        if rules != self.policy.rules():
+            self.set_policy(rules, save=False)
+
+    def flush(self, timeout=5.0):
+        """
+        Chờ đến khi mọi bản ghi đã đưa vào hàng đợi được ghi xuống tệp (chặn
+        luồng gọi: không gọi trực tiếp từ event loop)
+
+        Args:
+            timeout: Thời gian chờ tối đa (giây)
+
+        Returns:
+            True nếu đã ghi xong trong thời gian chờ
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Ghi nốt các bản ghi còn trong hàng đợi và dừng luồng ghi (gọi khi tắt ứng dụng)"""
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            self._queue.put(_STOP)
+            writer.join(timeout)
+        self._writer = None
+        self.segments.close(timeout)
+        with self._lock:
+            self._close_file()
+            if self.index.dirty_records:
+                self.index.save()
+            if self.stats.dirty:
+                self.stats.save()
+
+    def clear(self):
+        """Xóa toàn bộ bản ghi log hiện tại của worker này (xem publish_clear)"""
+        self.flush()
+        with self._lock:
+            self._close_file()
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+            self.index.remove()
+            self.stats.remove()
+            self.segments.clear()
+            self.record_count = 0
+
+    def _ensure_writer(self):
+        """Khởi động luồng ghi nền nếu chưa chạy"""
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._run_writer, name="connection-log-writer", daemon=True
+                )
+                self._writer.start()
+                # Nén/dọn dẹp các segment còn sót từ lần chạy trước
+                self.segments.schedule()
+
+    def _run_writer(self):
+        """Vòng lặp của luồng ghi: gom các bản ghi đang chờ thành lô và ghi một lần"""
+        while True:
+            try:
+                # Có cửa sổ tổng hợp: thức dậy định kỳ để ghi các cửa sổ đến hạn
+                item = self._queue.get(timeout=self.policy.poll_interval())
+            except queue.Empty:
+                item = None
+            batch = []
+            waiters = []
+            stop = False
+            while True:
+                if item is None or item is _WAKE:
+                    pass
+                elif item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            # Dừng hoặc đổi quy tắc: ghi mọi cửa sổ tổng hợp đang mở
+            policy_changed = self._policy_changed.is_set()
+            if policy_changed:
+                self._policy_changed.clear()
+            force = stop or policy_changed
+            for entry in batch:
+                self._last_timestamp = max(self._last_timestamp, entry["timestamp"])
+            # Bản ghi tổng hợp được ghi sau mọi bản ghi đã vào hàng đợi trước đó
+            # (lô đầy: hàng đợi còn bản ghi, để lượt sau)
+            if force or len(batch) < self.batch_size:
+                batch.extend(self.policy.collect(force=force, not_before=self._last_timestamp))
+
+            with self._dropped_lock:
+                dropped, self._pending_dropped = self._pending_dropped, 0
+            if dropped:
+                batch.append({
+                    "timestamp": datetime.now().isoformat(),
+                    "host_type": "connection_logger",
+                    "host_id": None,
+                    "user_id": None,
+                    "channel_id": None,
+                    "event_type": "dropped",
+                    "metadata": {"count": dropped}
+                })
+
+            if batch:
+                self._last_timestamp = max(self._last_timestamp, batch[-1]["timestamp"])
+                try:
+                    with self._lock:
+                        self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Error writing connection logs: {str(e)}")
+
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write_batch(self, entries):
+        """Ghi một lô bản ghi, xoay vòng tệp khi vượt quá giới hạn"""
+        lines = []
+        for entry in entries:
+            if self.record_count + len(lines) >= self.max_records:
+                self._append(lines)
+                lines = []
+                self._rotate_log()
+            lines.append((entry, (json.dumps(entry) + '\n').encode('utf-8')))
+        self._append(lines)
+        if self.index.dirty_records >= self.index_checkpoint_records:
+            self.index.save()
+        if self.stats.dirty and time.monotonic() - self._stats_saved_at >= self.stats_checkpoint_interval:
+            self.stats.save()
+            self._stats_saved_at = time.monotonic()
+
+    def _append(self, lines):
+        """Ghi các dòng vào tệp log bằng một lần write và đánh chỉ mục chúng"""
+        if not lines:
+            return
+        if self._file is None:
+            self._file = open(self.log_file, 'ab')
+        offset = self._file.tell()
+        self._file.write(b''.join(line for _, line in lines))
+        self._file.flush()
+        for entry, line in lines:
+            self.index.add(offset, entry, len(line))
+            offset += len(line)
+            self.stats.add(entry, offset)
+        self.record_count += len(lines)
+
+    def _forget_segments(self, removed):
+        """Trừ khỏi thống kê các bản ghi của segment bị xóa theo chính sách lưu giữ"""
+        with self._lock:
+            self.stats.subtract(removed)
+
+    def _close_file(self):
+        """Đóng tệp log đang mở (nếu có)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
             
     def _rotate_log(self):
         """Xoay vòng tệp log khi số lượng bản ghi vượt quá giới hạn"""
+        self._close_file()
+
         # Tạo tên tệp log backup với timestamp
-        backup_timestamp = int(time.time())
-        backup_file = f"{self.log_file}.{backup_timestamp}"
+        backup_file = self.segments.new_segment_path()
         
-        # Đổi tên tệp log hiện tại thành tệp backup
+        # Đổi tên tệp log hiện tại thành segment, chỉ mục đi kèm segment
+        live_index_file = self.index.index_file
         if os.path.exists(self.log_file):
             os.rename(self.log_file, backup_file)
+            sealed = self.index
+            sealed.log_file = backup_file
+            sealed.index_file = f"{backup_file}.idx"
+            sealed.save()
+            self.segments.seal(backup_file, sealed)
+        if os.path.exists(live_index_file):
+            os.remove(live_index_file)
+        self.index = LogIndex(self.log_file)
+        self.stats.rebase(0)
+        self.stats.save()
             
         # Reset số lượng bản ghi
         self.record_count = 0
         
-    def get_connection_logs(self, limit=100, offset=0, filters=None):
+    def get_connection_logs(self, limit=100, offset=0, filters=None, since=None, until=None):
         """
-        Lấy danh sách bản ghi log theo giới hạn và vị trí
+        Lấy danh sách bản ghi log theo giới hạn và vị trí, trên các segment đã xoay vòng
+        lẫn tệp hiện tại (dùng chỉ mục, chỉ đọc các bản ghi của trang)
         
         Args:
             limit: Số lượng bản ghi tối đa
             offset: Vị trí bắt đầu
-            filters: Các điều kiện lọc (dictionary)
+            filters: Các điều kiện lọc (dictionary, theo host_type/event_type/channel_id/user_id)
+            since: Chỉ lấy bản ghi từ thời điểm này (datetime hoặc chuỗi ISO)
+            until: Chỉ lấy bản ghi đến thời điểm này (datetime hoặc chuỗi ISO)
             
         Returns:
             Danh sách bản ghi log
         """
-        logs = []
-        
-        if not os.path.exists(self.log_file):
-            return logs
-            
-        with open(self.log_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # Áp dụng bộ lọc nếu có
-        filtered_lines = []
-        if filters:
-            for line in lines:
+        self.flush()
+        peers = self._peer_files()
+        with self._lock, self.segments.lock:
+            segments = self.segments.indexes() + [self.index]
+            if not peers:
+                logs, _ = query_segments(segments, filters, since, until, limit, offset)
+                return logs
+            for attempt in range(PEER_READ_ATTEMPTS):
                 try:
-                    entry = json.loads(line)
-                    match = True
-                    for key, value in filters.items():
-                        if key in entry and entry[key] != value:
-                            match = False
-                            break
-                    if match:
-                        filtered_lines.append(line)
-                except json.JSONDecodeError:
-                    continue
-        else:
-            filtered_lines = lines
-            
-        # Phân trang
-        paginated_lines = filtered_lines[offset:offset + limit]
-                
-        # Chuyển đổi từ JSON sang dictionary
-        for line in paginated_lines:
-            try:
-                logs.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-                
-        return logs
+                    streams = [segments] + [self._peer_segments(peer) for peer in peers]
+                    return merge_segments(streams, filters, since, until, limit, offset)
+                except OSError:
+                    # Worker khác vừa xoay vòng, nén hoặc xóa segment: đọc lại
+                    if attempt == PEER_READ_ATTEMPTS - 1:
+                        raise
     
-    def get_stats(self):
+    def get_stats(self, since=None, until=None):
         """
-        Lấy thống kê về các loại sự kiện và host
+        Lấy thống kê về các loại sự kiện và host (từ bộ đếm được cập nhật khi ghi)
         
+        Args:
+            since: Chỉ đếm bản ghi từ thời điểm này (datetime hoặc chuỗi ISO)
+            until: Chỉ đếm bản ghi đến thời điểm này (datetime hoặc chuỗi ISO)
+
         Returns:
             Dictionary chứa thông tin thống kê
         """
-        if not os.path.exists(self.log_file):
-            return {
-                "total_records": 0,
-                "host_types": {},
-                "event_types": {}
-            }
-            
-        host_types = {}
-        event_types = {}
-        total_records = 0
-        
-        with open(self.log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                    total_records += 1
-                    
-                    # Đếm theo host_type
-                    host_type = entry.get("host_type")
-                    if host_type:
-                        host_types[host_type] = host_types.get(host_type, 0) + 1
-                        
-                    # Đếm theo event_type
-                    event_type = entry.get("event_type")
-                    if event_type:
-                        event_types[event_type] = event_types.get(event_type, 0) + 1
-                        
-                except json.JSONDecodeError:
-                    continue
-                    
-        return {
-            "total_records": total_records,
-            "host_types": host_types,
-            "event_types": event_types
-        }
+        with self._lock:
+            result = self.stats.get(since, until)
+        peers = [self._peer_stats(peer) for peer in self._peer_files()]
+        if not peers:
+            return result
+        return combine([result] + [stats.get(since, until) for stats in peers])
+
+    def count(self):
+        """
+        Lấy tổng số bản ghi đã ghi (từ bộ đếm, không đọc tệp)
+
+        Returns:
+            Số lượng bản ghi
+        """
+        with self._lock:
+            records = self.stats.records
+        return records + sum(self._peer_stats(peer).records for peer in self._peer_files())
+
+    def _peer_files(self):
+        """Tệp log của các slot khác (worker khác, kể cả worker đã dừng)"""
+        if not self.worker_slots:
+            return []
+        return [slot_log_file(self.base_log_file, slot) for slot in known_slots(self.base_log_file) if slot != self.slot]
+
+    def _peer_segments(self, peer_file):
+        """Chỉ mục các segment và tệp hiện tại của một slot khác, cũ nhất đứng trước"""
+        segments = self._peers.get(peer_file)
+        if segments is None:
+            segments = self._peers[peer_file] = SegmentManager(peer_file, compress=False)
+        # Tệp hiện tại đang được ghi: nạp checkpoint chỉ mục rồi đánh chỉ mục phần đuôi
+        live = LogIndex(peer_file)
+        live.load()
+        return segments.indexes() + [live]
+
+    def _peer_stats(self, peer_file):
+        """Thống kê của một slot khác: checkpoint cộng phần đuôi tệp hiện tại"""
+        stats = LogStats(f"{os.path.splitext(peer_file)[0]}.stats.json")
+        stats.load(peer_file)
+        return stats
 
 # Tạo instance mặc định của ConnectionLogger
-connection_logger = ConnectionLogger()
+connection_logger = ConnectionLogger(
+    queue_size=int(os.getenv("CONNECTION_LOG_QUEUE_SIZE", "10000")),
+    policy_rules=parse_rules(
+        os.getenv("CONNECTION_LOG_POLICY", ""),
+        float(os.getenv("CONNECTION_LOG_AGGREGATE_SECONDS", "60"))
+    ),
+    aggregate_interval=float(os.getenv("CONNECTION_LOG_AGGREGATE_SECONDS", "60")),
+    batch_size=int(os.getenv("CONNECTION_LOG_BATCH_SIZE", "500")),
+    overflow_policy=os.getenv("CONNECTION_LOG_OVERFLOW", OVERFLOW_COUNT),
+    block_timeout=int(os.getenv("CONNECTION_LOG_BLOCK_TIMEOUT_MS", "50")) / 1000,
+    retention_bytes=int(os.getenv("CONNECTION_LOG_RETENTION_MB", "500")) * 1024 * 1024,
+    retention_seconds=int(os.getenv("CONNECTION_LOG_RETENTION_DAYS", "30")) * 24 * 3600,
+    compress_segments=os.getenv("CONNECTION_LOG_COMPRESS", "true").lower() == "true",
+    # Mỗi worker uvicorn (WORKERS > 1) ghi một tệp riêng
+    worker_slots=True
+)
 
 def get_connection_logger():
     """
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Hashable
+from fastapi import WebSocket
+from service.logger import get_logger
+from service.wire_codec import DEFAULT_CODEC, WireCodec, serialize
+
+logger = get_logger("fanout")
+
+# Close code khi client nhận quá chậm (dải 4xxx dành cho ứng dụng)
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+
+class OutboundConnection:
+    """
+    Hàng đợi gửi có giới hạn của một WebSocket, được xả bởi task ghi riêng.
+    Client chậm chỉ làm đầy hàng đợi của chính nó; khi vượt quá max_queue
+    hoặc độ trễ vượt quá max_lag giây thì bị đóng với SLOW_CONSUMER_CLOSE_CODE.
+    Tin nhắn JSON được chuyển sang cách mã hóa (codec) đã thỏa thuận của kết nối.
+    """
+    def __init__(self, websocket: WebSocket, max_queue=256, max_lag=10.0, on_evict=None, codec: WireCodec = DEFAULT_CODEC):
+        self.websocket = websocket
+        self.codec = codec
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.closed = False
+        self._on_evict = on_evict
+        self._pending = deque()
+        self._sending_since = None
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    @property
+    def lag(self):
+        """Thời gian (giây) tin nhắn cũ nhất chưa gửi xong đã phải chờ"""
+        oldest = self._sending_since
+        if self._pending and (oldest is None or self._pending[0][0] < oldest):
+            oldest = self._pending[0][0]
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    def send(self, text: str) -> bool:
+        """
+        Đưa một tin nhắn JSON đã mã hóa vào hàng đợi (không chờ)
+
+        Returns:
+            False nếu kết nối đã đóng hoặc vừa bị loại vì nhận quá chậm
+        """
+        if self.closed:
+            return False
+        return self.send_frame(self.codec.transcode(text))
+
+    def send_frame(self, frame) -> bool:
+        """Đưa một frame đã mã hóa theo codec của kết nối (str hoặc bytes) vào hàng đợi"""
+        if self.closed:
+            return False
+        if len(self._pending) >= self.max_queue or self.lag > self.max_lag:
+            self.evict("Slow consumer")
+            return False
+        self._pending.append((time.monotonic(), frame))
+        self._wakeup.set()
+        return True
+
+    def send_json(self, message) -> bool:
+        return self.send(serialize(message))
+
+    def evict(self, reason):
+        """Loại kết nối: bỏ các frame đang chờ và đóng WebSocket"""
+        if self.closed:
+            return
+        logger.warning(f"Evicting connection ({reason}), {len(self._pending)} frames pending")
+        self.closed = True
+        self._pending.clear()
+        self._task.cancel()
+        asyncio.get_running_loop().create_task(self._close(reason))
+        if self._on_evict:
+            self._on_evict(self)
+
+    async def close(self):
+        """Dừng task ghi (WebSocket do handler tự đóng)"""
+        self.closed = True
+        self._task.cancel()
+
+    async def _close(self, reason):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason=reason)
+        except Exception:
+            pass
+
+    async def _drain(self):
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self._sending_since, frame = self._pending.popleft()
+            try:
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+            except Exception:
+                self.closed = True
+                self._pending.clear()
+                return
+            finally:
+                self._sending_since = None
+
+
+class ChannelFanout:
+    """
+    Phát tin nhắn tới các kết nối của một channel: mỗi tin nhắn chỉ được mã
+    hóa một lần rồi đưa vào hàng đợi của từng kết nối.
+    """
+    def __init__(self, max_queue=256, max_lag=10.0):
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        # channel_id: {key: OutboundConnection}
+        self.channels: Dict[int, Dict[Hashable, OutboundConnection]] = {}
+
+    def add(self, channel_id, key, websocket: WebSocket, codec: WireCodec = DEFAULT_CODEC) -> OutboundConnection:
+        """Đăng ký một WebSocket vào channel"""
+        connection = OutboundConnection(
+            websocket,
+            max_queue=self.max_queue,
+            max_lag=self.max_lag,
+            on_evict=lambda conn: self._discard(channel_id, key, conn),
+            codec=codec
+        )
+        self.channels.setdefault(channel_id, {})[key] = connection
+        return connection
+
+    async def remove(self, channel_id, key, connection: OutboundConnection):
+        """Hủy đăng ký một kết nối (chỉ khi nó vẫn là kết nối hiện tại của key)"""
+        self._discard(channel_id, key, connection)
+        await connection.close()
+
+    def _discard(self, channel_id, key, connection):
+        connections = self.channels.get(channel_id)
+        if connections is not None and connections.get(key) is connection:
+            del connections[key]
+            if not connections:
+                del self.channels[channel_id]
+
+    def broadcast(self, channel_id, message, exclude=None):
+        """
+        Gửi một tin nhắn tới mọi kết nối trong channel
+
+        Returns:
+            Số kết nối đã nhận tin nhắn vào hàng đợi
+        """
+        return self.broadcast_text(channel_id, serialize(message), exclude)
+
+    def broadcast_text(self, channel_id, text, exclude=None):
+        """Gửi một tin nhắn JSON đã mã hóa tới mọi kết nối trong channel (mỗi codec chuyển mã một lần)"""
+        delivered = 0
+        frames = {}
+        for key, connection in list(self.channels.get(channel_id, {}).items()):
+            if key == exclude:
+                continue
+            codec = connection.codec
+            frame = frames.get(codec.name)
+            if frame is None:
+                frame = frames[codec.name] = codec.transcode(text)
+            if connection.send_frame(frame):
+                delivered += 1
+        return delivered
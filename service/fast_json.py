@@ -0,0 +1,34 @@
+import json
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, không có thì dùng json chuẩn (cùng kết quả)
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """
+    Mã hóa JSON giống JSONResponse của Starlette (không khoảng trắng, giữ nguyên
+    ký tự Unicode). Chỉ nhận kiểu JSON gốc: dict, list, str, int, float, bool, None.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def user_json(id, username, full_name, status):
+    """UserResponse (cùng thứ tự khóa với Pydantic model)"""
+    return {"id": id, "username": username, "full_name": full_name, "status": status}
+
+
+class FastJSONResponse(Response):
+    """
+    Response JSON cho các endpoint đọc nhiều: nội dung là dict/list đã dựng sẵn
+    từ các cột truy vấn, không qua kiểm tra của Pydantic. Endpoint vẫn khai báo
+    response_model cho tài liệu OpenAPI; FastAPI trả Response nguyên vẹn.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,431 @@
+import os
+import gzip
+import heapq
+import json
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import islice
+
+# Các trường được đánh chỉ mục (postings) cho mỗi bản ghi
+INDEXED_FIELDS = ("host_type", "event_type", "channel_id", "user_id")
+# Bucket thời gian theo phút: "YYYY-MM-DDTHH:MM"
+BUCKET_FIELD = "bucket"
+BUCKET_LENGTH = 16
+INDEX_VERSION = 1
+# Kích thước (trước nén) của mỗi khối gzip trong segment nén
+BLOCK_SIZE = 64 * 1024
+
+
+def posting_key(value):
+    """Khóa posting của một giá trị (phân biệt 5 và "5" như khi so sánh trực tiếp)"""
+    return json.dumps(value)
+
+
+def bucket_of(timestamp):
+    """Bucket phút của một timestamp ISO"""
+    return timestamp[:BUCKET_LENGTH]
+
+
+def to_timestamp(value):
+    """Chuẩn hóa since/until (datetime hoặc chuỗi ISO) thành chuỗi ISO"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def write_blocks(src, dst, block_size=BLOCK_SIZE):
+    """
+    Nén tệp log thành chuỗi các gzip member độc lập, mỗi member chứa các dòng
+    trọn vẹn (khoảng block_size byte). Kết quả vẫn là tệp .gz hợp lệ.
+
+    Args:
+        src: Tệp nguồn đã mở dạng nhị phân
+        dst: Tệp đích đã mở dạng nhị phân
+
+    Returns:
+        Bảng khối: danh sách [offset trước nén, offset trong tệp nén] của từng khối
+    """
+    blocks = []
+    offset = 0
+    chunk = []
+    chunk_size = 0
+
+    def flush():
+        blocks.append([offset - chunk_size, dst.tell()])
+        dst.write(gzip.compress(b''.join(chunk), mtime=0))
+
+    for line in src:
+        chunk.append(line)
+        chunk_size += len(line)
+        offset += len(line)
+        if chunk_size >= block_size:
+            flush()
+            chunk, chunk_size = [], 0
+    if chunk:
+        flush()
+    return blocks
+
+
+class BlockReader:
+    """
+    Đọc ngẫu nhiên segment nén bằng write_blocks: seek tới khối chứa offset
+    (qua bảng khối) và chỉ giải nén khối đó, giữ lại khối vừa giải nén.
+    Cùng giao diện seek/readline với tệp thường (offset tính trên dữ liệu
+    trước nén).
+    """
+    def __init__(self, path, blocks):
+        self._file = open(path, 'rb')
+        self._starts = [start for start, _ in blocks]
+        self._positions = [position for _, position in blocks]
+        self._block = -1
+        self._data = b''
+        self._offset = 0
+
+    def seek(self, offset):
+        self._offset = offset
+
+    def readline(self):
+        block = bisect_right(self._starts, self._offset) - 1
+        if block < 0:
+            return b''
+        if block != self._block:
+            self._file.seek(self._positions[block])
+            if block + 1 < len(self._positions):
+                raw = self._file.read(self._positions[block + 1] - self._positions[block])
+            else:
+                raw = self._file.read()
+            self._data = zlib.decompress(raw, wbits=31)
+            self._block = block
+        start = self._offset - self._starts[block]
+        end = self._data.find(b'\n', start)
+        end = len(self._data) if end < 0 else end + 1
+        self._offset += end - start
+        return self._data[start:end]
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LogIndex:
+    """
+    Chỉ mục sidecar cho một tệp log JSON-lines (một segment).
+
+    Lưu byte offset của từng bản ghi và postings theo host_type, event_type,
+    channel_id, user_id và bucket thời gian. Chỉ mục được checkpoint xuống
+    tệp <log_file>.idx; khi nạp lại chỉ cần quét phần đuôi tệp log được ghi
+    sau lần checkpoint cuối.
+    """
+    def __init__(self, log_file, index_file=None):
+        self.log_file = log_file
+        self.index_file = index_file or f"{log_file}.idx"
+        self.reset()
+
+    def reset(self):
+        """Xóa toàn bộ chỉ mục trong bộ nhớ"""
+        self.offsets = array('q')
+        self.postings = {field: {} for field in INDEXED_FIELDS + (BUCKET_FIELD,)}
+        self.size = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        # Bảng khối của segment nén (None: tệp thường hoặc gzip một khối kiểu cũ)
+        self.blocks = None
+        self._saved_records = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def dirty_records(self):
+        """Số bản ghi đã đánh chỉ mục nhưng chưa checkpoint"""
+        return len(self.offsets) - self._saved_records
+
+    def add(self, offset, entry, length):
+        """
+        Thêm một bản ghi vào chỉ mục
+
+        Args:
+            offset: Byte offset của dòng trong tệp log
+            entry: Bản ghi (dictionary)
+            length: Độ dài dòng tính bằng byte (kể cả ký tự xuống dòng)
+        """
+        record_id = len(self.offsets)
+        self.offsets.append(offset)
+        for field in INDEXED_FIELDS:
+            key = posting_key(entry.get(field))
+            self.postings[field].setdefault(key, []).append(record_id)
+
+        timestamp = entry.get("timestamp") or ""
+        self.postings[BUCKET_FIELD].setdefault(bucket_of(timestamp), []).append(record_id)
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.size = offset + length
+
+    @property
+    def compressed(self):
+        """Segment đã được nén gzip (không còn ghi thêm)"""
+        return self.log_file.endswith(".gz")
+
+    def load(self):
+        """Nạp chỉ mục từ tệp sidecar rồi đánh chỉ mục phần đuôi còn thiếu của tệp log"""
+        self.reset()
+        if self.compressed:
+            # Segment nén không thay đổi; offset tính trên dữ liệu đã giải nén
+            log_size = float("inf")
+        else:
+            log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION and data["size"] <= log_size:
+                    self.offsets = array('q', data["offsets"])
+                    self.postings = data["postings"]
+                    self.size = data["size"]
+                    self.first_timestamp = data["first_timestamp"]
+                    self.last_timestamp = data["last_timestamp"]
+                    self.blocks = data.get("blocks")
+                    self._saved_records = len(self.offsets)
+            except (OSError, ValueError, KeyError):
+                self.reset()
+        if self.compressed:
+            if not self.offsets:
+                self._scan_tail()
+        elif log_size > self.size:
+            self._scan_tail()
+
+    def _scan_tail(self):
+        """Đánh chỉ mục các dòng nằm sau self.size trong tệp log"""
+        with self._open() as f:
+            f.seek(self.size)
+            offset = self.size
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Dòng ghi dở, bỏ qua
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = {}
+                self.add(offset, entry, len(line))
+                offset += len(line)
+
+    def save(self):
+        """Checkpoint chỉ mục xuống tệp sidecar (ghi tệp tạm rồi thay thế)"""
+        data = {
+            "version": INDEX_VERSION,
+            "size": self.size,
+            "offsets": self.offsets.tolist(),
+            "postings": self.postings,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp
+        }
+        if self.blocks is not None:
+            data["blocks"] = self.blocks
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_file, self.index_file)
+        self._saved_records = len(self.offsets)
+
+    def remove(self):
+        """Xóa tệp sidecar và chỉ mục trong bộ nhớ"""
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+        self.reset()
+
+    def overlaps(self, since=None, until=None):
+        """Segment có bản ghi nằm trong khoảng [since, until] hay không"""
+        if not self.offsets:
+            return False
+        if since is not None and self.last_timestamp < since:
+            return False
+        if until is not None and self.first_timestamp > until:
+            return False
+        return True
+
+    def match(self, filters=None, since=None, until=None, reader=None):
+        """
+        Tìm các bản ghi thỏa mãn bộ lọc
+
+        Args:
+            filters: Dictionary {trường: giá trị} với trường thuộc INDEXED_FIELDS
+            since: Chỉ lấy bản ghi có timestamp >= since (chuỗi ISO)
+            until: Chỉ lấy bản ghi có timestamp <= until (chuỗi ISO)
+            reader: Tệp log đã mở (để đọc timestamp ở hai đầu khoảng thời gian)
+
+        Returns:
+            Dãy record id (tăng dần) thỏa mãn bộ lọc
+        """
+        lo, hi = self._time_range(since, until, reader)
+        if lo >= hi:
+            return []
+
+        lists = []
+        for field, value in (filters or {}).items():
+            if field not in INDEXED_FIELDS:
+                raise ValueError(f"Field {field} is not indexed")
+            ids = self.postings[field].get(posting_key(value))
+            if not ids:
+                return []
+            lists.append(ids)
+        if not lists:
+            return range(lo, hi)
+
+        # Duyệt danh sách ngắn nhất, kiểm tra các danh sách còn lại bằng bisect
+        lists.sort(key=len)
+        smallest, others = lists[0], lists[1:]
+        result = []
+        for record_id in smallest[bisect_left(smallest, lo):bisect_left(smallest, hi)]:
+            for ids in others:
+                i = bisect_left(ids, record_id)
+                if i == len(ids) or ids[i] != record_id:
+                    break
+            else:
+                result.append(record_id)
+        return result
+
+    def _time_range(self, since, until, reader):
+        """
+        Chuyển khoảng thời gian thành khoảng record id [lo, hi).
+        Bản ghi được ghi theo thứ tự thời gian nên khoảng này liên tục; hai đầu
+        được xác định bằng bucket phút rồi tìm nhị phân trong bucket biên.
+        """
+        lo, hi = 0, len(self.offsets)
+        if since is None and until is None:
+            return lo, hi
+        buckets = sorted(self.postings[BUCKET_FIELD])
+        if since is not None:
+            i = bisect_left(buckets, bucket_of(since))
+            if i == len(buckets):
+                return hi, hi
+            ids = self.postings[BUCKET_FIELD][buckets[i]]
+            lo = self._bisect_timestamp(ids, since, reader, inclusive=False)
+        if until is not None:
+            i = bisect_right(buckets, bucket_of(until)) - 1
+            if i < 0:
+                return lo, lo
+            ids = self.postings[BUCKET_FIELD][buckets[i]]
+            hi = self._bisect_timestamp(ids, until, reader, inclusive=True)
+        return lo, hi
+
+    def _bisect_timestamp(self, ids, timestamp, reader, inclusive):
+        """Record id đầu tiên trong bucket có timestamp > (hoặc >=) timestamp"""
+        left, right = 0, len(ids)
+        while left < right:
+            mid = (left + right) // 2
+            value = self.read(reader, ids[mid]).get("timestamp", "")
+            if value < timestamp or (inclusive and value == timestamp):
+                left = mid + 1
+            else:
+                right = mid
+        return ids[left] if left < len(ids) else ids[-1] + 1
+
+    def read(self, reader, record_id):
+        """Đọc một bản ghi theo record id từ tệp log đã mở"""
+        reader.seek(self.offsets[record_id])
+        try:
+            return json.loads(reader.readline())
+        except ValueError:
+            return {}
+
+    def _open(self):
+        """Mở tệp log để đọc dạng nhị phân (giải nén nếu là segment gzip)"""
+        if self.compressed:
+            if self.blocks:
+                return BlockReader(self.log_file, self.blocks)
+            # Segment nén một khối (trước khi có bảng khối): seek phải giải nén từ đầu
+            return gzip.open(self.log_file, 'rb')
+        return open(self.log_file, 'rb')
+
+    def entries(self):
+        """Duyệt mọi bản ghi của segment theo thứ tự"""
+        with self._open() as reader:
+            for record_id in range(len(self.offsets)):
+                yield self.read(reader, record_id)
+
+    def query(self, filters=None, since=None, until=None, limit=100, offset=0):
+        """
+        Lấy một trang bản ghi của segment này
+
+        Returns:
+            Tuple (danh sách bản ghi, tổng số bản ghi khớp)
+        """
+        return query_segments([self], filters, since, until, limit, offset)
+
+
+def query_segments(segments, filters=None, since=None, until=None, limit=100, offset=0):
+    """
+    Truy vấn phân trang trên nhiều segment (theo thứ tự thời gian).
+    Chỉ đọc đúng các bản ghi thuộc trang, nên bộ nhớ tỉ lệ với kích thước trang.
+
+    Args:
+        segments: Danh sách LogIndex, segment cũ nhất đứng trước
+        filters: Dictionary {trường: giá trị}
+        since/until: Khoảng thời gian (datetime hoặc chuỗi ISO)
+        limit: Số lượng bản ghi tối đa
+        offset: Vị trí bắt đầu
+
+    Returns:
+        Tuple (danh sách bản ghi, tổng số bản ghi khớp)
+    """
+    since, until = to_timestamp(since), to_timestamp(until)
+    logs = []
+    total = 0
+    for segment in segments:
+        if not segment.overlaps(since, until):
+            continue
+        with segment._open() as reader:
+            ids = segment.match(filters, since, until, reader)
+            start = max(offset - total, 0)
+            total += len(ids)
+            for record_id in ids[start:start + limit - len(logs)]:
+                logs.append(segment.read(reader, record_id))
+    return logs, total
+
+
+def iter_segments(segments, filters=None, since=None, until=None):
+    """Duyệt các bản ghi khớp trên nhiều segment (theo thứ tự thời gian) của một tệp log"""
+    since, until = to_timestamp(since), to_timestamp(until)
+    for segment in segments:
+        if not segment.overlaps(since, until):
+            continue
+        with segment._open() as reader:
+            for record_id in segment.match(filters, since, until, reader):
+                yield segment.read(reader, record_id)
+
+
+def merge_segments(streams, filters=None, since=None, until=None, limit=100, offset=0):
+    """
+    Truy vấn phân trang trên nhiều tệp log ghi song song (mỗi worker một tệp),
+    trộn theo timestamp. Đọc offset + limit bản ghi đầu tiên của mỗi tệp.
+
+    Args:
+        streams: Danh sách các danh sách LogIndex (segment của từng tệp log, cũ nhất đứng trước)
+
+    Returns:
+        Danh sách bản ghi log
+    """
+    iterators = [iter_segments(segments, filters, since, until) for segments in streams]
+    try:
+        merged = heapq.merge(*iterators, key=lambda entry: entry.get("timestamp") or "")
+        return list(islice(merged, offset, offset + limit))
+    finally:
+        for iterator in iterators:
+            iterator.close()
@@ -0,0 +1,206 @@
+import os
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Cách ghi một loại sự kiện (host_type, event_type)
+POLICY_ALWAYS = "always"        # Ghi mọi bản ghi
+POLICY_SAMPLE = "sample"        # Ghi ngẫu nhiên theo tỉ lệ rate, metadata có sample_rate
+POLICY_AGGREGATE = "aggregate"  # Chỉ đếm, ghi bản ghi tổng hợp mỗi interval_seconds cho từng channel
+POLICY_MODES = (POLICY_ALWAYS, POLICY_SAMPLE, POLICY_AGGREGATE)
+
+# Khớp mọi host_type / event_type
+WILDCARD = "*"
+# Chu kỳ luồng ghi kiểm tra các cửa sổ tổng hợp đến hạn (giây)
+POLL_INTERVAL = 1.0
+
+_ALWAYS_RULE = {"host_type": WILDCARD, "event_type": WILDCARD, "mode": POLICY_ALWAYS, "rate": 1.0, "interval_seconds": None}
+
+
+def make_rule(host_type=WILDCARD, event_type=WILDCARD, mode=POLICY_ALWAYS, rate=1.0, interval_seconds=None,
+              default_interval=60.0):
+    """Kiểm tra và chuẩn hóa một quy tắc (ValueError nếu không hợp lệ)"""
+    if mode not in POLICY_MODES:
+        raise ValueError(f"Invalid log policy mode: {mode}")
+    rate = float(rate)
+    if mode == POLICY_SAMPLE and not 0.0 <= rate <= 1.0:
+        raise ValueError(f"Sample rate must be between 0 and 1: {rate}")
+    if mode == POLICY_AGGREGATE:
+        interval_seconds = float(interval_seconds if interval_seconds is not None else default_interval)
+        if interval_seconds <= 0:
+            raise ValueError(f"Aggregate interval must be positive: {interval_seconds}")
+    return {
+        "host_type": host_type or WILDCARD,
+        "event_type": event_type or WILDCARD,
+        "mode": mode,
+        "rate": rate if mode == POLICY_SAMPLE else 1.0,
+        "interval_seconds": interval_seconds if mode == POLICY_AGGREGATE else None
+    }
+
+
+def parse_rules(text, default_interval=60.0):
+    """
+    Đọc quy tắc dạng "host_type:event_type=mode[:tham số]" phân tách bằng dấu
+    phẩy, tham số là rate (sample) hoặc interval_seconds (aggregate). Ví dụ:
+    "signaling:*=aggregate:60,message:send_message=sample:0.01"
+    """
+    rules = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            target, action = item.split("=", 1)
+            host_type, event_type = target.split(":", 1)
+        except ValueError:
+            raise ValueError(f"Invalid log policy rule: {item}")
+        mode, _, parameter = action.partition(":")
+        rule = {"host_type": host_type.strip(), "event_type": event_type.strip(), "mode": mode.strip()}
+        if parameter:
+            rule["rate" if rule["mode"] == POLICY_SAMPLE else "interval_seconds"] = float(parameter)
+        rules.append(make_rule(**rule, default_interval=default_interval))
+    return rules
+
+
+class LogPolicy:
+    """
+    Chính sách ghi connection logs theo (host_type, event_type).
+
+    Quy tắc cụ thể nhất được áp dụng: (host_type, event_type), rồi
+    (host_type, *), rồi (*, event_type), rồi (*, *); không khớp quy tắc nào
+    thì ghi mọi bản ghi. Sự kiện aggregate được đếm trong bộ nhớ theo
+    (host_type, event_type, host_id, channel_id); collect trả về bản ghi tổng
+    hợp của các cửa sổ đã đến hạn để luồng ghi đưa vào tệp. Quy tắc được
+    lưu xuống tệp JSON để giữ qua các lần khởi động lại.
+    """
+    def __init__(self, policy_file, default_interval=60.0):
+        self.policy_file = policy_file
+        self.default_interval = default_interval
+        self._rules = {}
+        # (host_type, event_type) -> quy tắc đang áp dụng
+        self._resolved = {}
+        # (host_type, event_type, host_id, channel_id) -> [số sự kiện, user_ids, bắt đầu (monotonic), bắt đầu (datetime), interval]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def rules(self):
+        """Các quy tắc hiện tại"""
+        return [dict(rule) for rule in self._rules.values()]
+
+    def set_rules(self, rules):
+        """
+        Thay toàn bộ quy tắc
+
+        Args:
+            rules: Danh sách dict (host_type, event_type, mode, rate, interval_seconds)
+        """
+        normalized = {}
+        for rule in rules:
+            rule = make_rule(**rule, default_interval=self.default_interval)
+            normalized[(rule["host_type"], rule["event_type"])] = rule
+        with self._lock:
+            self._rules = normalized
+            self._resolved = {}
+
+    @property
+    def aggregating(self):
+        return any(rule["mode"] == POLICY_AGGREGATE for rule in self._rules.values())
+
+    def decide(self, host_type, event_type, host_id, channel_id, user_id):
+        """
+        Quyết định cách ghi một sự kiện
+
+        Returns:
+            (ghi bản ghi hay không, sample_rate hoặc None)
+        """
+        rule = self._resolved.get((host_type, event_type))
+        if rule is None:
+            rule = self._resolve(host_type, event_type)
+        mode = rule["mode"]
+        if mode == POLICY_ALWAYS:
+            return True, None
+        if mode == POLICY_SAMPLE:
+            return random.random() < rule["rate"], rule["rate"]
+        key = (host_type, event_type, host_id, channel_id)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = [0, set(), time.monotonic(), datetime.now(), rule["interval_seconds"]]
+            window[0] += 1
+            if user_id is not None:
+                window[1].add(user_id)
+        return False, None
+
+    def collect(self, force=False, not_before=""):
+        """
+        Lấy bản ghi tổng hợp của các cửa sổ đã đến hạn (force: mọi cửa sổ).
+        Mỗi bản ghi mang thời điểm kết thúc cửa sổ, nhưng không sớm hơn
+        not_before (timestamp của bản ghi mới nhất đã ghi) để tệp log giữ thứ
+        tự thời gian mà LogIndex dựa vào.
+
+        Returns:
+            Danh sách bản ghi log, theo thứ tự thời gian
+        """
+        if not self._windows:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                key for key, window in self._windows.items()
+                if force or now - window[2] >= window[4]
+            ]
+            windows = [(key, self._windows.pop(key)) for key in due]
+        entries = []
+        for (host_type, event_type, host_id, channel_id), (count, users, started, started_at, interval) in windows:
+            ended_at = (started_at + timedelta(seconds=min(interval, now - started))).isoformat()
+            entries.append({
+                "timestamp": max(ended_at, not_before),
+                "host_type": host_type,
+                "host_id": host_id,
+                "user_id": None,
+                "channel_id": channel_id,
+                "event_type": event_type,
+                "metadata": {
+                    "aggregated": True,
+                    "count": count,
+                    "users": len(users),
+                    "since": started_at.isoformat(),
+                    "interval_seconds": interval
+                }
+            })
+        entries.sort(key=lambda entry: entry["timestamp"])
+        return entries
+
+    def poll_interval(self):
+        """Thời gian chờ tối đa của luồng ghi (None: không có cửa sổ tổng hợp nào)"""
+        if self._windows or self.aggregating:
+            return POLL_INTERVAL
+        return None
+
+    def load(self):
+        """Nạp quy tắc đã lưu; Returns: True nếu có tệp"""
+        if not os.path.exists(self.policy_file):
+            return False
+        with open(self.policy_file, "r", encoding="utf-8") as f:
+            self.set_rules(json.load(f)["rules"])
+        return True
+
+    def save(self):
+        temp_file = f"{self.policy_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"rules": self.rules()}, f)
+        os.replace(temp_file, self.policy_file)
+
+    def _resolve(self, host_type, event_type):
+        rules = self._rules
+        rule = (
+            rules.get((host_type, event_type))
+            or rules.get((host_type, WILDCARD))
+            or rules.get((WILDCARD, event_type))
+            or rules.get((WILDCARD, WILDCARD))
+            or _ALWAYS_RULE
+        )
+        self._resolved[(host_type, event_type)] = rule
+        return rule
@@ -0,0 +1,217 @@
+import os
+import glob
+import queue
+import threading
+import time
+from service.log_index import LogIndex, write_blocks
+from service.log_stats import LogStats
+from service.logger import get_logger
+
+logger = get_logger("connection_logger")
+
+COMPRESSED_SUFFIX = ".gz"
+INDEX_SUFFIX = ".idx"
+
+
+class SegmentManager:
+    """
+    Quản lý các segment đã xoay vòng của connection log.
+
+    Segment có tên <log_file>.<timestamp> (thêm -<n> nếu trùng giây). Sau khi
+    được niêm phong, segment được nén gzip ở luồng nền cùng với chỉ mục của
+    nó, rồi áp dụng chính sách lưu giữ theo tổng dung lượng và theo tuổi.
+    Segment nén gồm các khối gzip độc lập (bảng khối lưu trong chỉ mục), nên
+    đọc một trang chỉ giải nén các khối chứa bản ghi của trang.
+    """
+    def __init__(self, log_file, max_total_bytes=None, max_age_seconds=None, compress=True, on_remove=None):
+        self.log_file = log_file
+        self.max_total_bytes = max_total_bytes
+        self.max_age_seconds = max_age_seconds
+        self.compress = compress
+        # Nhận LogStats của các bản ghi trong segment bị xóa theo chính sách lưu giữ
+        self.on_remove = on_remove
+        self.lock = threading.RLock()
+        self._indexes = {}
+        self._tasks = queue.Queue()
+        self._worker = None
+
+    def new_segment_path(self):
+        """Tên tệp cho segment sắp được xoay vòng"""
+        base = f"{self.log_file}.{int(time.time())}"
+        path, n = base, 0
+        while os.path.exists(path) or os.path.exists(path + COMPRESSED_SUFFIX):
+            n += 1
+            path = f"{base}-{n}"
+        return path
+
+    def _parse(self, path):
+        """Khóa sắp xếp (timestamp, n) của một segment, None nếu không phải segment"""
+        name = path[len(self.log_file) + 1:]
+        if name.endswith(COMPRESSED_SUFFIX):
+            name = name[:-len(COMPRESSED_SUFFIX)]
+        stamp, _, n = name.partition("-")
+        if not stamp.isdigit() or (n and not n.isdigit()):
+            return None
+        return int(stamp), int(n or 0)
+
+    def paths(self):
+        """Danh sách segment trên đĩa, cũ nhất đứng trước"""
+        segments = []
+        for path in glob.glob(glob.escape(self.log_file) + ".*"):
+            key = self._parse(path)
+            if key is not None:
+                segments.append((key, path))
+        segments.sort()
+        return [path for _, path in segments]
+
+    def indexes(self):
+        """Chỉ mục của các segment (nạp lười và giữ lại vì segment không đổi), cũ nhất đứng trước"""
+        with self.lock:
+            result = []
+            paths = self.paths()
+            # Bỏ chỉ mục của segment đã bị xóa (bởi worker khác khi đọc segment của nó)
+            for path in set(self._indexes) - set(paths):
+                del self._indexes[path]
+            for path in paths:
+                index = self._indexes.get(path)
+                if index is None:
+                    index = LogIndex(path, index_file=path + INDEX_SUFFIX)
+                    index.load()
+                    if index.dirty_records:
+                        index.save()
+                    self._indexes[path] = index
+                result.append(index)
+            return result
+
+    def seal(self, path, index=None):
+        """
+        Nhận một segment vừa được xoay vòng và lên lịch nén/dọn dẹp ở luồng nền
+
+        Args:
+            path: Đường dẫn segment
+            index: Chỉ mục đã có của segment (để không phải nạp lại)
+        """
+        with self.lock:
+            if index is not None:
+                self._indexes[path] = index
+        self.schedule()
+
+    def schedule(self):
+        """Lên lịch nén các segment chưa nén và áp dụng chính sách lưu giữ"""
+        self._ensure_worker()
+        self._tasks.put(True)
+
+    def clear(self):
+        """Xóa toàn bộ segment và chỉ mục của chúng"""
+        with self.lock:
+            for path in self.paths():
+                self._remove(path)
+
+    def close(self, timeout=5.0):
+        """Dừng luồng nền sau khi xử lý xong các tác vụ đang chờ"""
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            self._tasks.put(None)
+            worker.join(timeout)
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self.lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_worker, name="connection-log-segments", daemon=True
+                )
+                self._worker.start()
+
+    def _run_worker(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            # Gộp các yêu cầu đang chờ thành một lượt xử lý
+            stop = False
+            while not self._tasks.empty():
+                if self._tasks.get_nowait() is None:
+                    stop = True
+            try:
+                if self.compress:
+                    for path in self.paths():
+                        if not path.endswith(COMPRESSED_SUFFIX):
+                            self._compress(path)
+                self._enforce_retention()
+            except Exception as e:
+                logger.error(f"Error maintaining connection log segments: {str(e)}")
+            if stop:
+                return
+
+    def _compress(self, path):
+        """Nén gzip một segment theo khối; chỉ mục giữ nguyên offset trên dữ liệu đã giải nén"""
+        compressed = path + COMPRESSED_SUFFIX
+        tmp_file = compressed + ".tmp"
+        with open(path, 'rb') as src, open(tmp_file, 'wb') as dst:
+            blocks = write_blocks(src, dst)
+
+        with self.lock:
+            index = self._indexes.pop(path, None)
+            if index is None:
+                index = LogIndex(path, index_file=path + INDEX_SUFFIX)
+                index.load()
+            os.replace(tmp_file, compressed)
+            index.log_file = compressed
+            index.index_file = compressed + INDEX_SUFFIX
+            index.blocks = blocks
+            index.save()
+            if os.path.exists(path + INDEX_SUFFIX):
+                os.remove(path + INDEX_SUFFIX)
+            os.remove(path)
+            self._indexes[compressed] = index
+
+    def _enforce_retention(self):
+        """Xóa segment cũ nhất khi vượt quá tổng dung lượng hoặc quá tuổi cho phép"""
+        removed = LogStats(None)
+        with self.lock:
+            paths = self.paths()
+            now = time.time()
+            if self.max_age_seconds is not None:
+                for path in list(paths):
+                    if now - self._parse(path)[0] > self.max_age_seconds:
+                        self._expire(path, removed)
+                        paths.remove(path)
+            if self.max_total_bytes is not None:
+                sizes = {path: self._size(path) for path in paths}
+                total = sum(sizes.values())
+                while paths and total > self.max_total_bytes:
+                    path = paths.pop(0)
+                    total -= sizes[path]
+                    self._expire(path, removed)
+        # Gọi ngoài self.lock: on_remove lấy khóa của ConnectionLogger
+        if self.on_remove is not None and removed.records:
+            self.on_remove(removed)
+
+    def _expire(self, path, removed):
+        """Xóa một segment theo chính sách lưu giữ, cộng các bản ghi của nó vào removed"""
+        if self.on_remove is not None:
+            try:
+                index = self._indexes.get(path)
+                if index is None:
+                    index = LogIndex(path, index_file=path + INDEX_SUFFIX)
+                    index.load()
+                for entry in index.entries():
+                    removed.add(entry)
+            except Exception as e:
+                logger.error(f"Error counting records of expired segment {path}: {str(e)}")
+        self._remove(path)
+
+    def _size(self, path):
+        size = os.path.getsize(path)
+        if os.path.exists(path + INDEX_SUFFIX):
+            size += os.path.getsize(path + INDEX_SUFFIX)
+        return size
+
+    def _remove(self, path):
+        for file in (path, path + INDEX_SUFFIX):
+            if os.path.exists(file):
+                os.remove(file)
+        self._indexes.pop(path, None)
@@ -0,0 +1,260 @@
+import os
+import json
+from datetime import datetime
+
+# Độ dài khóa bucket: phút "YYYY-MM-DDTHH:MM", giờ "YYYY-MM-DDTHH"
+MINUTE_KEY_LENGTH = 16
+HOUR_KEY_LENGTH = 13
+STATS_VERSION = 1
+# Số chữ số thập phân giữ lại khi cộng trọng số (1/sample_rate không chẵn)
+WEIGHT_PRECISION = 6
+
+
+def weight(entry):
+    """
+    Số sự kiện mà một bản ghi đại diện: count của bản ghi tổng hợp,
+    1/sample_rate của bản ghi lấy mẫu, 1 với bản ghi thường
+    """
+    metadata = entry.get("metadata") or {}
+    if metadata.get("aggregated"):
+        return metadata.get("count", 1)
+    sample_rate = metadata.get("sample_rate")
+    if sample_rate:
+        return round(1 / sample_rate, WEIGHT_PRECISION)
+    return 1
+
+
+def _empty_counter():
+    return {"total_records": 0, "host_types": {}, "event_types": {}}
+
+
+def _count(counter, host_type, event_type, amount=1):
+    """Cộng một bản ghi (amount: trọng số của bản ghi) vào bộ đếm"""
+    counter["total_records"] = round(counter["total_records"] + amount, WEIGHT_PRECISION)
+    if host_type:
+        counter["host_types"][host_type] = round(counter["host_types"].get(host_type, 0) + amount, WEIGHT_PRECISION)
+    if event_type:
+        counter["event_types"][event_type] = round(counter["event_types"].get(event_type, 0) + amount, WEIGHT_PRECISION)
+
+
+def _merge(target, counter, sign=1):
+    """Cộng dồn (sign = -1: trừ) bộ đếm counter vào target"""
+    target["total_records"] = round(target["total_records"] + sign * counter["total_records"], WEIGHT_PRECISION)
+    for field in ("host_types", "event_types"):
+        for key, value in counter[field].items():
+            amount = round(target[field].get(key, 0) + sign * value, WEIGHT_PRECISION)
+            if amount > 0:
+                target[field][key] = amount
+            else:
+                target[field].pop(key, None)
+
+
+def _rounded(counter):
+    """Bộ đếm với số sự kiện làm tròn thành số nguyên"""
+    return {
+        "total_records": round(counter["total_records"]),
+        "host_types": {key: round(value) for key, value in counter["host_types"].items()},
+        "event_types": {key: round(value) for key, value in counter["event_types"].items()}
+    }
+
+
+def combine(results):
+    """Cộng các kết quả của LogStats.get (thống kê của nhiều worker)"""
+    combined = _empty_counter()
+    for result in results:
+        _merge(combined, result)
+    return combined
+
+
+def _to_key(value):
+    """Chuẩn hóa since/until (datetime hoặc chuỗi ISO) thành chuỗi ISO"""
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+class LogStats:
+    """
+    Thống kê connection logs được cập nhật dần khi ghi bản ghi.
+
+    Giữ tổng số sự kiện, số lượng theo host_type/event_type, cùng các bucket
+    theo phút (giữ minute_retention giờ gần nhất) và theo giờ (giữ
+    hour_retention giờ). Mỗi bản ghi được đếm theo số sự kiện nó đại diện
+    (weight: bản ghi lấy mẫu và bản ghi tổng hợp của LogPolicy); số bản ghi
+    thực có trong tệp được đếm riêng (records). Thống kê được checkpoint xuống tệp JSON kèm vị trí
+    byte trong tệp log hiện tại, nên khi khởi động lại chỉ cần đếm phần đuôi.
+    """
+    def __init__(self, stats_file, minute_retention=24, hour_retention=24 * 30):
+        self.stats_file = stats_file
+        self.minute_retention = minute_retention
+        self.hour_retention = hour_retention
+        self.reset()
+
+    def reset(self):
+        """Xóa toàn bộ thống kê"""
+        self.totals = _empty_counter()
+        self.records = 0
+        self.minutes = {}
+        self.hours = {}
+        self.log_position = 0
+        self.dirty = False
+
+    def add(self, entry, position=None):
+        """
+        Đếm một bản ghi
+
+        Args:
+            entry: Bản ghi (dictionary)
+            position: Vị trí byte ngay sau bản ghi trong tệp log hiện tại
+        """
+        host_type = entry.get("host_type")
+        event_type = entry.get("event_type")
+        timestamp = entry.get("timestamp") or ""
+        amount = weight(entry)
+        self.records += 1
+        _count(self.totals, host_type, event_type, amount)
+
+        minute_key = timestamp[:MINUTE_KEY_LENGTH]
+        minute = self.minutes.get(minute_key)
+        if minute is None:
+            minute = self.minutes[minute_key] = _empty_counter()
+            self._prune()
+        _count(minute, host_type, event_type, amount)
+
+        hour_key = timestamp[:HOUR_KEY_LENGTH]
+        hour = self.hours.get(hour_key)
+        if hour is None:
+            hour = self.hours[hour_key] = _empty_counter()
+        _count(hour, host_type, event_type, amount)
+
+        if position is not None:
+            self.log_position = position
+        self.dirty = True
+
+    def _prune(self):
+        """Bỏ các bucket cũ hơn thời gian lưu giữ (bucket phút bị bỏ theo từng giờ)"""
+        for buckets, retention in ((self.minutes, self.minute_retention), (self.hours, self.hour_retention)):
+            hours = sorted({key[:HOUR_KEY_LENGTH] for key in buckets})
+            if len(hours) <= retention:
+                continue
+            cutoff = hours[-retention]
+            for key in [key for key in buckets if key[:HOUR_KEY_LENGTH] < cutoff]:
+                del buckets[key]
+
+    def subtract(self, other):
+        """
+        Trừ các bản ghi đã đếm trong other (LogStats của các segment bị xóa)
+
+        Bucket đã bị bỏ theo thời gian lưu giữ thì không cần trừ.
+        """
+        self.records = max(self.records - other.records, 0)
+        _merge(self.totals, other.totals, -1)
+        for buckets, removed in ((self.minutes, other.minutes), (self.hours, other.hours)):
+            for key, counter in removed.items():
+                bucket = buckets.get(key)
+                if bucket is None:
+                    continue
+                _merge(bucket, counter, -1)
+                if bucket["total_records"] <= 0:
+                    del buckets[key]
+        self.dirty = True
+
+    def rebase(self, position=0):
+        """Đặt lại vị trí trong tệp log hiện tại (sau khi xoay vòng tệp)"""
+        self.log_position = position
+        self.dirty = True
+
+    def get(self, since=None, until=None):
+        """
+        Lấy thống kê, toàn bộ hoặc trong khoảng thời gian [since, until]
+
+        Không có khoảng thời gian thì trả về bộ đếm tổng (O(1)). Có khoảng thời
+        gian thì cộng các bucket phút còn lưu giữ và bucket giờ cho phần cũ hơn.
+
+        Returns:
+            Dictionary chứa total_records, host_types và event_types (số sự
+            kiện ước lượng, làm tròn)
+        """
+        if since is None and until is None:
+            return _rounded(self.totals)
+
+        since, until = _to_key(since), _to_key(until)
+        result = _empty_counter()
+        minute_lo = since[:MINUTE_KEY_LENGTH] if since else None
+        minute_hi = until[:MINUTE_KEY_LENGTH] if until else None
+        for key, counter in self.minutes.items():
+            if (minute_lo is None or key >= minute_lo) and (minute_hi is None or key <= minute_hi):
+                _merge(result, counter)
+
+        # Phần cũ hơn các bucket phút được lấy từ bucket giờ
+        first_minute_hour = min(self.minutes)[:HOUR_KEY_LENGTH] if self.minutes else None
+        hour_lo = since[:HOUR_KEY_LENGTH] if since else None
+        hour_hi = until[:HOUR_KEY_LENGTH] if until else None
+        for key, counter in self.hours.items():
+            if first_minute_hour is not None and key >= first_minute_hour:
+                continue
+            if (hour_lo is None or key >= hour_lo) and (hour_hi is None or key <= hour_hi):
+                _merge(result, counter)
+        return _rounded(result)
+
+    def load(self, log_file):
+        """
+        Nạp checkpoint rồi đếm các bản ghi được ghi vào tệp log sau checkpoint
+
+        Args:
+            log_file: Tệp log hiện tại
+        """
+        self.reset()
+        if os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == STATS_VERSION:
+                    self.totals = data["totals"]
+                    # Checkpoint cũ chưa có records: mọi bản ghi có trọng số 1
+                    self.records = data.get("records", self.totals["total_records"])
+                    self.minutes = data["minutes"]
+                    self.hours = data["hours"]
+                    self.log_position = data["log_position"]
+            except (OSError, ValueError, KeyError):
+                self.reset()
+
+        log_size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+        if log_size < self.log_position:
+            # Tệp log đã bị thay thế ngoài ứng dụng
+            self.log_position = 0
+        if log_size > self.log_position:
+            with open(log_file, 'rb') as f:
+                f.seek(self.log_position)
+                position = self.log_position
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    position += len(line)
+                    try:
+                        self.add(json.loads(line), position)
+                    except ValueError:
+                        self.log_position = position
+
+    def save(self):
+        """Checkpoint thống kê xuống tệp (ghi tệp tạm rồi thay thế)"""
+        data = {
+            "version": STATS_VERSION,
+            "saved_at": datetime.now().isoformat(),
+            "log_position": self.log_position,
+            "records": self.records,
+            "totals": self.totals,
+            "minutes": self.minutes,
+            "hours": self.hours
+        }
+        tmp_file = f"{self.stats_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_file, self.stats_file)
+        self.dirty = False
+
+    def remove(self):
+        """Xóa checkpoint và thống kê trong bộ nhớ"""
+        if os.path.exists(self.stats_file):
+            os.remove(self.stats_file)
+        self.reset()
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from database import AsyncReadSessionLocal
+from models import Messages, Users
+from service.fast_json import user_json
+from service.logger import get_logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = get_logger("message_cache")
+
+# Bộ nhớ ước tính của một tin nhắn ngoài nội dung (dict, số nguyên, chuỗi created_at)
+MESSAGE_OVERHEAD = 400
+
+
+def message_json(row):
+    """MessageResponse từ một hàng (id, content, created_at, sender_id, username, full_name, status)"""
+    message_id, content, created_at, sender_id, username, full_name, status = row
+    return {
+        "id": message_id,
+        "content": content,
+        "created_at": created_at.isoformat(),
+        "sender": user_json(sender_id, username, full_name, status) if sender_id is not None else None
+    }
+
+
+async def query_page(db, channel_id, before_id=None, after_id=None, limit=50):
+    """
+    Một trang lịch sử tin nhắn từ DB (keyset trên index (channel_id, id))
+
+    Returns:
+        (tin nhắn dạng dict JSON từ cũ đến mới, next_cursor)
+    """
+    # Chỉ lấy các cột cần trả về, người gửi lấy cùng truy vấn (khóa chính users)
+    query = (
+        select(
+            Messages.id, Messages.content, Messages.created_at,
+            Users.id, Users.username, Users.full_name, Users.status
+        )
+        .outerjoin(Users, Users.id == Messages.sender_id)
+        .where(Messages.channel_id == channel_id)
+    )
+    if after_id is not None:
+        query = query.where(Messages.id > after_id).order_by(Messages.id.asc()).limit(limit + 1)
+        rows = (await db.execute(query)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1][0] if has_more else None
+    else:
+        if before_id is not None:
+            query = query.where(Messages.id < before_id)
+        query = query.order_by(Messages.id.desc()).limit(limit + 1)
+        rows = (await db.execute(query)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        next_cursor = rows[0][0] if has_more else None
+    return [message_json(row) for row in rows], next_cursor
+
+
+class MessageRing:
+    """
+    Các tin nhắn mới nhất của một channel, sắp xếp theo id. Mọi tin nhắn của
+    channel có id >= floor đều có trong ring (floor = 0: toàn bộ lịch sử).
+    """
+    __slots__ = ("ids", "messages", "floor", "size", "expires_at")
+
+    def __init__(self, floor, expires_at):
+        self.ids: List[int] = []
+        self.messages: List[dict] = []
+        self.floor = floor
+        self.size = 0
+        self.expires_at = expires_at
+
+    def page(self, before_id=None, after_id=None, limit=50) -> Optional[Tuple[List[dict], Optional[int]]]:
+        """
+        Cùng kết quả với query_page nếu ring có đủ tin nhắn
+
+        Returns:
+            (tin nhắn, next_cursor) hoặc None nếu trang nằm ngoài ring
+        """
+        if after_id is not None:
+            if after_id + 1 < self.floor:
+                return None
+            start = bisect_right(self.ids, after_id)
+            messages = self.messages[start:start + limit + 1]
+            if len(messages) > limit:
+                return messages[:limit], messages[limit - 1]["id"]
+            return messages, None
+        end = len(self.ids) if before_id is None else bisect_left(self.ids, before_id)
+        if end > limit:
+            messages = self.messages[end - limit:end]
+            return messages, messages[0]["id"]
+        if self.floor == 0:
+            return self.messages[:end], None
+        return None
+
+
+class MessageCache:
+    """
+    Ring buffer các tin nhắn gần nhất của từng text channel, phục vụ trang lịch
+    sử đầu tiên (GET /channels/{channel_id}/messages) và backfill khi kết nối
+    WebSocket mà không truy vấn DB.
+
+    Ring được nạp lười từ DB (capacity tin nhắn mới nhất) khi có yêu cầu trang
+    mới nhất, rồi được bổ sung từ luồng broadcast (handler text topic của
+    broker). Vì vậy chỉ channel đang được theo dõi (worker đang nhận text topic,
+    xem track/untrack) mới có ring. Các channel bị loại nguyên channel theo LRU
+    khi tổng bộ nhớ ước tính vượt max_bytes; ring hết hạn sau ttl giây.
+    Tin nhắn broadcast chưa có ID (chế độ optimistic) làm ring mất liên tục nên
+    channel bị bỏ qua cache trong ttl giây.
+    """
+    def __init__(self, session_factory=AsyncReadSessionLocal, capacity=200, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.session_factory = session_factory
+        # 0: tắt cache
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._rings: "OrderedDict[int, MessageRing]" = OrderedDict()
+        # channel_id: (Future, tin nhắn broadcast đến trong lúc nạp)
+        self._loading: Dict[int, tuple] = {}
+        self._tracked = set()
+        # channel_id: bỏ qua cache đến thời điểm
+        self._bypass: Dict[int, float] = {}
+        # Người gửi dùng chung giữa các tin nhắn (cập nhật status tại chỗ): user_id -> [dict, số tin nhắn]
+        self._senders: Dict[int, list] = {}
+
+    async def page(self, channel_id, before_id=None, after_id=None, limit=50, db=None):
+        """
+        Một trang lịch sử như query_page, lấy từ ring nếu có thể
+
+        Args:
+            db: AsyncSession dùng khi phải truy vấn DB (mặc định mở session riêng)
+        """
+        ring = self._ring(channel_id)
+        warmed = False
+        if ring is None and before_id is None and after_id is None and self._can_warm(channel_id):
+            ring = await self._warm(channel_id)
+            warmed = True
+        if ring is not None:
+            result = ring.page(before_id, after_id, limit)
+            if result is not None:
+                if warmed:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                return result
+        self.misses += 1
+        if db is not None:
+            return await query_page(db, channel_id, before_id, after_id, limit)
+        async with self.session_factory() as session:
+            return await query_page(session, channel_id, before_id, after_id, limit)
+
+    def track(self, channel_id):
+        """Worker bắt đầu nhận broadcast của channel: ring của channel có thể được nạp"""
+        self._tracked.add(channel_id)
+
+    def untrack(self, channel_id):
+        """Worker ngừng nhận broadcast của channel: ring không còn được cập nhật"""
+        self._tracked.discard(channel_id)
+        self.invalidate(channel_id)
+
+    def on_broadcast(self, channel_id, payload: str):
+        """Bổ sung một tin nhắn chat (JSON đã broadcast) vào ring của channel"""
+        ring = self._rings.get(channel_id)
+        loading = self._loading.get(channel_id)
+        if ring is None and loading is None:
+            return
+        message = json.loads(payload)
+        if message.get("id") is None:
+            # Chưa có ID (optimistic): không giữ được ring liên tục
+            self.invalidate(channel_id)
+            self._bypass[channel_id] = time.monotonic() + self.ttl
+            return
+        if loading is not None:
+            loading[1].append(message)
+        if ring is not None:
+            size = ring.size
+            self._insert(ring, message)
+            self.size += ring.size - size
+            self._evict()
+
+    def update_user(self, user_id, status):
+        """Cập nhật status của người gửi trong mọi tin nhắn đã cache"""
+        sender = self._senders.get(user_id)
+        if sender is not None:
+            sender[0]["status"] = status
+
+    def invalidate(self, channel_id):
+        """Xóa ring của một channel (lần truy cập sau sẽ nạp lại)"""
+        self._loading.pop(channel_id, None)
+        ring = self._rings.pop(channel_id, None)
+        if ring is not None:
+            self.size -= ring.size
+            for message in ring.messages:
+                self._release(message["sender"])
+
+    def clear(self):
+        for channel_id in list(self._rings):
+            self.invalidate(channel_id)
+        self._loading.clear()
+        self._bypass.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "channels": len(self._rings),
+            "messages": sum(len(ring.ids) for ring in self._rings.values()),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    def _ring(self, channel_id) -> Optional[MessageRing]:
+        ring = self._rings.get(channel_id)
+        if ring is None:
+            return None
+        if ring.expires_at <= time.monotonic():
+            self.invalidate(channel_id)
+            return None
+        self._rings.move_to_end(channel_id)
+        return ring
+
+    def _can_warm(self, channel_id):
+        if not self.capacity or channel_id not in self._tracked:
+            return False
+        bypass_until = self._bypass.get(channel_id)
+        if bypass_until is None:
+            return True
+        if bypass_until > time.monotonic():
+            return False
+        del self._bypass[channel_id]
+        return True
+
+    async def _warm(self, channel_id) -> Optional[MessageRing]:
+        loading = self._loading.get(channel_id)
+        if loading is not None:
+            await asyncio.shield(loading[0])
+            return self._rings.get(channel_id)
+        loading = (asyncio.get_running_loop().create_future(), [])
+        self._loading[channel_id] = loading
+        try:
+            async with self.session_factory() as db:
+                messages, next_cursor = await query_page(db, channel_id, limit=self.capacity)
+            if self._loading.get(channel_id) is not loading:
+                # Bị hủy trong lúc nạp (untrack hoặc tin nhắn optimistic)
+                return None
+            ring = MessageRing(0 if next_cursor is None else messages[0]["id"], time.monotonic() + self.ttl)
+            for message in messages:
+                self._insert(ring, message, fresh_sender=True)
+            # Tin nhắn được commit sau khi đọc DB, broadcast đến trong lúc nạp
+            for message in loading[1]:
+                self._insert(ring, message)
+            self._rings[channel_id] = ring
+            self.size += ring.size
+            self._evict()
+            return self._rings.get(channel_id)
+        finally:
+            if self._loading.get(channel_id) is loading:
+                del self._loading[channel_id]
+            loading[0].set_result(None)
+
+    def _insert(self, ring: MessageRing, message, fresh_sender=False):
+        message_id = message["id"]
+        if message_id < ring.floor:
+            return
+        index = bisect_left(ring.ids, message_id)
+        if index < len(ring.ids) and ring.ids[index] == message_id:
+            return
+        entry = {
+            "id": message_id,
+            "content": message["content"],
+            "created_at": message["created_at"],
+            "sender": self._acquire(message["sender"], fresh_sender)
+        }
+        ring.ids.insert(index, message_id)
+        ring.messages.insert(index, entry)
+        ring.size += sys.getsizeof(entry["content"]) + MESSAGE_OVERHEAD
+        while len(ring.ids) > self.capacity:
+            self._drop_oldest(ring)
+
+    def _drop_oldest(self, ring: MessageRing):
+        del ring.ids[0]
+        message = ring.messages.pop(0)
+        ring.size -= sys.getsizeof(message["content"]) + MESSAGE_OVERHEAD
+        self._release(message["sender"])
+        ring.floor = ring.ids[0]
+
+    def _acquire(self, sender, fresh=False):
+        if sender is None or not isinstance(sender["id"], int):
+            # Khách (id là UUID) không có trong bảng users: đường DB trả sender null
+            return None
+        entry = self._senders.get(sender["id"])
+        if entry is None:
+            entry = self._senders[sender["id"]] = [
+                user_json(sender["id"], sender["username"], sender["full_name"], sender["status"]), 0
+            ]
+        elif fresh:
+            # Giá trị vừa đọc từ DB mới hơn giá trị kèm theo broadcast
+            entry[0].update(sender)
+        entry[1] += 1
+        return entry[0]
+
+    def _release(self, sender):
+        if sender is None:
+            return
+        entry = self._senders.get(sender["id"])
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._senders[sender["id"]]
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._rings:
+            self.invalidate(next(iter(self._rings)))
+
+
+# Tạo instance mặc định của MessageCache
+message_cache = MessageCache(
+    capacity=int(os.getenv("MESSAGE_CACHE_SIZE", "200")),
+    max_bytes=int(os.getenv("MESSAGE_CACHE_MAX_MB", "32")) * 1024 * 1024,
+    ttl=int(os.getenv("MESSAGE_CACHE_TTL_SECONDS", "300"))
+)
+
+def get_message_cache():
+    """
+    Lấy instance mặc định của MessageCache
+
+    Returns:
+        MessageCache instance
+    """
+    return message_cache
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from database import SessionLocal
+from models import Messages
+from service.logger import get_logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = get_logger("message_persister")
+
+# Thời điểm broadcast tin nhắn tới channel
+BROADCAST_OPTIMISTIC = "optimistic"      # Broadcast ngay, gửi ID thật cho người gửi sau khi commit
+BROADCAST_AFTER_COMMIT = "after_commit"  # Broadcast sau khi tin nhắn đã được commit
+BROADCAST_MODES = (BROADCAST_OPTIMISTIC, BROADCAST_AFTER_COMMIT)
+
+
+class MessagePersister:
+    """
+    Ghi tin nhắn xuống DB theo lô (group commit).
+
+    Tin nhắn được đưa vào hàng đợi; một task gom các tin nhắn đến trong cửa sổ
+    max_delay (hoặc đủ max_batch) rồi commit cả lô trong một transaction ở
+    luồng riêng, nên event loop không bị chặn bởi SQLite. Nếu lô bị lỗi, các
+    tin nhắn được ghi lại từng cái để chỉ tin nhắn lỗi thất bại.
+    """
+    def __init__(self, session_factory=SessionLocal, max_batch=100, max_delay=0.01,
+                 broadcast_mode=BROADCAST_AFTER_COMMIT):
+        if broadcast_mode not in BROADCAST_MODES:
+            raise ValueError(f"Invalid broadcast mode: {broadcast_mode}")
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.broadcast_mode = broadcast_mode
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-writer")
+
+    @property
+    def optimistic(self):
+        return self.broadcast_mode == BROADCAST_OPTIMISTIC
+
+    def submit(self, content, channel_id, sender_id, created_at=None):
+        """
+        Đưa một tin nhắn vào hàng đợi ghi
+
+        Args:
+            created_at: Thời điểm server nhận tin nhắn (UTC), mặc định là lúc gọi
+
+        Returns:
+            asyncio.Future trả về ID của tin nhắn sau khi commit
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(({
+            "content": content,
+            "channel_id": channel_id,
+            "sender_id": sender_id,
+            "created_at": created_at or datetime.utcnow()
+        }, future))
+        return future
+
+    async def stop(self):
+        """Commit nốt các tin nhắn đang chờ và dừng task ghi (gọi khi tắt ứng dụng)"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch):
+        """Commit một lô và trả ID (hoặc lỗi) cho từng future"""
+        loop = asyncio.get_running_loop()
+        try:
+            ids = await loop.run_in_executor(self._executor, self._commit, [row for row, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Một tin nhắn lỗi không làm hỏng các tin nhắn khác cùng lô
+                logger.warning(f"Error committing {len(batch)} messages, retrying one by one: {str(e)}")
+                for item in batch:
+                    await self._write([item])
+                return
+            logger.error(f"Error committing message: {str(e)}")
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+        for (_, future), message_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(message_id)
+
+    def _commit(self, rows):
+        """Ghi một lô tin nhắn trong một transaction (chạy ở luồng ghi)"""
+        db = self.session_factory()
+        try:
+            messages = [Messages(**row) for row in rows]
+            db.add_all(messages)
+            db.flush()
+            # Lấy ID trước khi commit để không phải nạp lại từng đối tượng
+            ids = [message.id for message in messages]
+            db.commit()
+            return ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# Tạo instance mặc định của MessagePersister
+message_persister = MessagePersister(
+    max_batch=int(os.getenv("MESSAGE_BATCH_SIZE", "100")),
+    max_delay=int(os.getenv("MESSAGE_BATCH_DELAY_MS", "10")) / 1000,
+    broadcast_mode=os.getenv("MESSAGE_BROADCAST_MODE", BROADCAST_AFTER_COMMIT)
+)
+
+def get_message_persister():
+    """
+    Lấy instance mặc định của MessagePersister
+
+    Returns:
+        MessagePersister instance
+    """
+    return message_persister
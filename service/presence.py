@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, List
+from sqlalchemy import update
+from database import AsyncSessionLocal
+from models import Users
+from service.broker import get_broker
+from service.logger import get_logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = get_logger("presence")
+
+# Topic broker để các worker trao đổi danh sách người dùng đang kết nối
+PRESENCE_TOPIC = "presence"
+ONLINE = "online"
+OFFLINE = "offline"
+INVISIBLE = "invisible"
+
+
+class LocalPresence:
+    __slots__ = ("connections", "last_seen")
+
+    def __init__(self):
+        self.connections = 0
+        self.last_seen = time.monotonic()
+
+
+class PresenceTracker:
+    """
+    Theo dõi trạng thái online của người dùng theo kết nối WebSocket thực tế.
+
+    Mỗi worker đếm số kết nối của từng người dùng (connect/disconnect) và thời
+    điểm hoạt động gần nhất (heartbeat). Cứ mỗi flush_interval giây, tracker
+    tính trạng thái hiệu lực, ghi các thay đổi xuống Users.status bằng một lệnh
+    UPDATE executemany và gọi các listener với danh sách thay đổi (để đẩy tới
+    channel). Kết nối bật/tắt liên tục trong một chu kỳ chỉ tạo một thay đổi.
+
+    Danh sách người dùng online của mỗi worker được phát qua broker khi thay
+    đổi (và nhắc lại mỗi keepalive giây), nên người dùng chỉ offline khi không
+    còn kết nối nào trên mọi worker.
+
+    Trạng thái chọn qua /auth/status được giữ nguyên: "invisible" và "offline"
+    không bị kết nối đổi thành "online", "online" (và đăng nhập) trả về trạng
+    thái theo kết nối. Tracker chỉ ghi status của người dùng đã từng kết nối
+    WebSocket, nên client chỉ dùng REST giữ status do /auth/login ghi. Sau khi
+    khởi động lại, chỉ "invisible" (đọc lại từ DB khi kết nối) còn hiệu lực.
+    """
+    def __init__(self, session_factory=AsyncSessionLocal, flush_interval=2.0, heartbeat_timeout=0, keepalive=20.0):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        # 0: không xét heartbeat, kết nối còn mở là online
+        self.heartbeat_timeout = heartbeat_timeout
+        self.keepalive = keepalive
+        self._local: Dict[int, LocalPresence] = {}
+        # origin: (hết hạn lúc, {user_id})
+        self._remote: Dict[str, tuple] = {}
+        # user_id: status do người dùng chọn ("offline"/"invisible")
+        self._preferences: Dict[int, str] = {}
+        # user_id: trạng thái đã ghi / đã thông báo gần nhất
+        self._published: Dict[int, str] = {}
+        self._listeners: List[Callable[[Dict[int, str]], None]] = []
+        self._origin = uuid.uuid4().hex
+        self._last_announced = None
+        self._announced_at = 0.0
+        self._task = None
+
+    def connect(self, user_id, status=None):
+        """Ghi nhận một kết nối WebSocket mới của người dùng"""
+        if not isinstance(user_id, int):
+            return  # khách không có bản ghi Users
+        if status == INVISIBLE:
+            # Status đã lưu trong DB; "offline" trong DB không phân biệt được với chưa kết nối
+            self._preferences.setdefault(user_id, INVISIBLE)
+        presence = self._local.get(user_id)
+        if presence is None:
+            presence = self._local[user_id] = LocalPresence()
+        presence.connections += 1
+        presence.last_seen = time.monotonic()
+
+    def disconnect(self, user_id):
+        presence = self._local.get(user_id)
+        if presence is None:
+            return
+        presence.connections -= 1
+        if presence.connections <= 0:
+            del self._local[user_id]
+
+    def heartbeat(self, user_id):
+        presence = self._local.get(user_id)
+        if presence is not None:
+            presence.last_seen = time.monotonic()
+
+    def set_preference(self, user_id, status):
+        """
+        Trạng thái do người dùng chọn qua /auth/status hoặc khi đăng nhập (đã ghi
+        xuống DB). Người dùng đang kết nối: lần flush sau ghi lại trạng thái hiệu
+        lực và thông báo thay đổi tới channel.
+        """
+        if status == ONLINE:
+            self._preferences.pop(user_id, None)
+        else:
+            self._preferences[user_id] = status
+
+    async def update_preference(self, user_id, status):
+        """set_preference trên worker này và báo cho các worker khác"""
+        self.set_preference(user_id, status)
+        await get_broker().publish(PRESENCE_TOPIC, json.dumps({
+            "origin": self._origin,
+            "preference": [user_id, status]
+        }))
+
+    def add_listener(self, listener: Callable[[Dict[int, str]], None]):
+        """Đăng ký hàm nhận {user_id: status} mỗi khi có thay đổi"""
+        self._listeners.append(listener)
+
+    def status(self, user_id):
+        """Trạng thái hiệu lực hiện tại của người dùng"""
+        preference = self._preferences.get(user_id)
+        if preference is not None:
+            return preference
+        return ONLINE if user_id in self._online_users() else OFFLINE
+
+    def stats(self):
+        return {
+            "local_users": len(self._local),
+            "online_users": len(self._online_users()),
+            "workers": len(self._remote) + 1
+        }
+
+    async def start(self):
+        if self._task is None:
+            get_broker().subscribe(PRESENCE_TOPIC, self._on_announcement)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Dừng tracker và ghi nốt các thay đổi (gọi khi tắt ứng dụng)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Các kết nối của worker này không còn, báo cho worker khác
+        self._local.clear()
+        await self.flush()
+
+    async def flush(self):
+        """Tính trạng thái hiệu lực, ghi thay đổi xuống DB và thông báo listener"""
+        await self._announce()
+        online = self._online_users()
+        changes = {}
+        for user_id in online | {user_id for user_id, status in self._published.items() if status == ONLINE}:
+            status = self._preferences.get(user_id) or (ONLINE if user_id in online else OFFLINE)
+            if self._published.get(user_id) != status:
+                changes[user_id] = status
+        if changes:
+            await self._write(changes)
+            self._published.update(changes)
+        # Không cần theo dõi người dùng đã offline/invisible và không còn kết nối
+        for user_id in [user_id for user_id, status in self._published.items() if status != ONLINE and user_id not in online]:
+            del self._published[user_id]
+        if not changes:
+            return changes
+
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Error notifying presence listener: {str(e)}")
+        return changes
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing presence: {str(e)}")
+
+    async def _write(self, changes: Dict[int, str]):
+        async with self.session_factory() as db:
+            await db.execute(
+                update(Users),
+                [{"id": user_id, "status": status} for user_id, status in changes.items()]
+            )
+            await db.commit()
+
+    def _local_online(self):
+        if not self.heartbeat_timeout:
+            return set(self._local)
+        deadline = time.monotonic() - self.heartbeat_timeout
+        return {user_id for user_id, presence in self._local.items() if presence.last_seen >= deadline}
+
+    def _online_users(self):
+        online = self._local_online()
+        now = time.monotonic()
+        for origin, (expires_at, users) in list(self._remote.items()):
+            if expires_at < now:
+                del self._remote[origin]
+            else:
+                online |= users
+        return online
+
+    async def _announce(self):
+        local = self._local_online()
+        now = time.monotonic()
+        if local == self._last_announced and now - self._announced_at < self.keepalive:
+            return
+        self._last_announced = local
+        self._announced_at = now
+        await get_broker().publish(PRESENCE_TOPIC, json.dumps({
+            "origin": self._origin,
+            "users": sorted(local),
+            "ttl": self.keepalive * 3
+        }))
+
+    def _on_announcement(self, payload):
+        message = json.loads(payload)
+        if message["origin"] == self._origin:
+            return
+        if "preference" in message:
+            self.set_preference(*message["preference"])
+            return
+        if message["users"]:
+            self._remote[message["origin"]] = (time.monotonic() + message["ttl"], set(message["users"]))
+        else:
+            self._remote.pop(message["origin"], None)
+
+
+# Tạo instance mặc định của PresenceTracker
+presence_tracker = PresenceTracker(
+    flush_interval=int(os.getenv("PRESENCE_FLUSH_INTERVAL_MS", "2000")) / 1000,
+    heartbeat_timeout=int(os.getenv("PRESENCE_HEARTBEAT_TIMEOUT_SECONDS", "0")),
+    keepalive=int(os.getenv("PRESENCE_KEEPALIVE_SECONDS", "20"))
+)
+
+def get_presence_tracker():
+    """
+    Lấy instance mặc định của PresenceTracker
+
+    Returns:
+        PresenceTracker instance
+    """
+    return presence_tracker
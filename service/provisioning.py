@@ -0,0 +1,205 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Servers, Channels, ChannelMembers, ChannelType, Users
+
+# Bố cục channel mặc định của một server mới
+DEFAULT_CHANNELS = (
+    {"name": "general", "channel_type": ChannelType.text},
+    {"name": "general", "channel_type": ChannelType.voice},
+)
+HOST_ROLE = "host"
+MEMBER_ROLE = "member"
+
+
+async def provision_server(
+    db: AsyncSession,
+    host_user_id: int,
+    name: str,
+    color: Optional[str] = None,
+    is_private: bool = False,
+    channels: Sequence[Dict] = DEFAULT_CHANNELS,
+    members: Sequence[Dict] = ()
+) -> Servers:
+    """
+    Tạo server cùng các channel và thành viên trong một transaction
+
+    Server và channel được ghi trong một lần flush; thành viên được thêm bằng
+    một lệnh INSERT executemany. Host là thành viên (role host) của mọi channel.
+
+    Args:
+        host_user_id: ID người tạo server
+        channels: Danh sách {"name", "channel_type", "members" (tùy chọn)}; nếu
+            không có "members" thì mọi thành viên của server vào channel đó
+        members: Danh sách {"user_id", "role" (tùy chọn)} của server
+
+    Returns:
+        Server đã nạp đầy đủ channel, thành viên và người dùng
+
+    Raises:
+        ValueError: Có user_id không tồn tại
+    """
+    members = [member for member in members if member["user_id"] != host_user_id]
+    await ensure_users_exist(db, [member["user_id"] for member in members])
+
+    server = Servers(name=name, color=color, host_user_id=host_user_id, is_private=is_private)
+    channel_objects = [
+        Channels(name=channel["name"], channel_type=channel["channel_type"], server=server)
+        for channel in channels
+    ]
+    db.add(server)
+    db.add_all(channel_objects)
+    try:
+        # Một lần flush cấp ID cho server và mọi channel
+        await db.flush()
+
+        rows = []
+        for channel, spec in zip(channel_objects, channels):
+            channel_user_ids = spec.get("members")
+            rows.append({"channel_id": channel.id, "user_id": host_user_id, "role": HOST_ROLE})
+            for member in members:
+                if channel_user_ids is None or member["user_id"] in channel_user_ids:
+                    rows.append({
+                        "channel_id": channel.id,
+                        "user_id": member["user_id"],
+                        "role": member.get("role") or MEMBER_ROLE
+                    })
+        await insert_members(db, rows)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return await load_server(db, server.id)
+
+
+async def add_channel(db: AsyncSession, server_id: int, name: str, channel_type: ChannelType, host_user_id: int) -> Channels:
+    """
+    Tạo channel trong server, người tạo là host của channel (một commit)
+
+    Returns:
+        Channel đã nạp thành viên
+    """
+    channel = Channels(name=name, channel_type=channel_type, server_id=server_id)
+    channel.members = [ChannelMembers(user_id=host_user_id, role=HOST_ROLE)]
+    db.add(channel)
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return await load_channel(db, channel.id)
+
+
+async def import_members(
+    db: AsyncSession,
+    channel_ids: Iterable[int],
+    user_ids: Iterable[int],
+    role: str = MEMBER_ROLE
+) -> int:
+    """
+    Thêm nhiều người dùng vào nhiều channel trong một transaction. Các thành
+    viên đã có được bỏ qua.
+
+    Returns:
+        Số thành viên đã thêm
+
+    Raises:
+        ValueError: Có user_id không tồn tại
+    """
+    channel_ids = list(dict.fromkeys(channel_ids))
+    user_ids = list(dict.fromkeys(user_ids))
+    if not channel_ids or not user_ids:
+        return 0
+    await ensure_users_exist(db, user_ids)
+
+    existing = set(
+        (await db.execute(
+            select(ChannelMembers.channel_id, ChannelMembers.user_id)
+            .where(ChannelMembers.channel_id.in_(channel_ids), ChannelMembers.user_id.in_(user_ids))
+        )).all()
+    )
+    rows = [
+        {"channel_id": channel_id, "user_id": user_id, "role": role}
+        for channel_id in channel_ids
+        for user_id in user_ids
+        if (channel_id, user_id) not in existing
+    ]
+    try:
+        await insert_members(db, rows)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return len(rows)
+
+
+async def add_member(db: AsyncSession, channel_id: int, user_id: int, role: str = MEMBER_ROLE) -> Optional[ChannelMembers]:
+    """
+    Thêm một người dùng vào channel
+
+    Returns:
+        Thành viên vừa thêm, None nếu người dùng đã là thành viên
+    """
+    member = ChannelMembers(channel_id=channel_id, user_id=user_id, role=role)
+    db.add(member)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # uix_channel_user: đã là thành viên
+        await db.rollback()
+        return None
+    return member
+
+
+async def remove_member(db: AsyncSession, channel_id: int, user_id: int) -> bool:
+    """
+    Xóa một người dùng khỏi channel
+
+    Returns:
+        False nếu người dùng không phải thành viên
+    """
+    result = await db.execute(
+        delete(ChannelMembers).where(ChannelMembers.channel_id == channel_id, ChannelMembers.user_id == user_id)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+async def insert_members(db: AsyncSession, rows: List[Dict]):
+    """Thêm các hàng channel_members bằng một lệnh INSERT executemany"""
+    if rows:
+        await db.execute(insert(ChannelMembers), rows)
+
+
+async def ensure_users_exist(db: AsyncSession, user_ids: Iterable[int]):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    found = set((await db.execute(select(Users.id).where(Users.id.in_(user_ids)))).scalars())
+    missing = user_ids - found
+    if missing:
+        raise ValueError(f"Users not found: {sorted(missing)}")
+
+
+async def load_server(db: AsyncSession, server_id: int) -> Optional[Servers]:
+    """Nạp server kèm channel, thành viên và người dùng (selectinload)"""
+    result = await db.execute(
+        select(Servers)
+        .where(Servers.id == server_id)
+        .options(selectinload(Servers.channels).selectinload(Channels.members).selectinload(ChannelMembers.user))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def load_channel(db: AsyncSession, channel_id: int) -> Optional[Channels]:
+    """Nạp channel kèm thành viên và người dùng (selectinload)"""
+    result = await db.execute(
+        select(Channels)
+        .where(Channels.id == channel_id)
+        .options(selectinload(Channels.members).selectinload(ChannelMembers.user))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from typing import Dict, Hashable, List
+from service.fanout import OutboundConnection
+
+# Các action WebRTC được chuyển tiếp tới một peer đích
+RELAYED_ACTIONS = ("offer", "answer", "ice_candidate")
+# Các trường cần để định tuyến một frame signaling (xem WireCodec.receive_routed)
+ROUTING_FIELDS = ("action", "target_id")
+# Frame gộp nhiều ice_candidate gửi tới cùng một peer
+ICE_BATCH_ACTION = "ice_candidate_batch"
+
+
+def with_peer_id(data: str, peer_id) -> str:
+    """
+    Gắn peer_id vào object JSON gốc mà không phân tích và mã hóa lại toàn bộ
+    (SDP/ICE giữ nguyên từng byte). Nếu client đã tự gửi peer_id thì mã hóa lại
+    để ghi đè giá trị đó.
+    """
+    body = data.rstrip()
+    if body == "{}" or not body.endswith("}") or '"peer_id"' in body:
+        message = json.loads(data) if body else {}
+        message["peer_id"] = peer_id
+        return json.dumps(message)
+    return f'{body[:-1]},"peer_id":{json.dumps(peer_id)}}}'
+
+
+def batch_frame(frames: List[str]) -> str:
+    """Gộp các frame ice_candidate đã mã hóa thành một frame"""
+    if len(frames) == 1:
+        return frames[0]
+    return f'{{"action":"{ICE_BATCH_ACTION}","messages":[{",".join(frames)}]}}'
+
+
+class SignalingRelay:
+    """
+    Chuyển tiếp offer/answer/ice_candidate tới peer đích.
+
+    Khi coalesce_window > 0, các ice_candidate gửi tới cùng một peer trong
+    khoảng coalesce_window giây được gộp thành một frame ICE_BATCH_ACTION.
+    Trước khi gửi offer/answer tới peer đó, các candidate đang chờ được gửi
+    trước để giữ đúng thứ tự.
+    """
+    def __init__(self, coalesce_window=0.0):
+        self.coalesce_window = coalesce_window
+        self._pending: Dict[Hashable, List[str]] = {}
+        self._targets: Dict[Hashable, OutboundConnection] = {}
+
+    def forward(self, key, target: OutboundConnection, action, frame: str):
+        """
+        Gửi một frame signaling tới peer đích
+
+        Args:
+            key: Khóa của peer đích, ví dụ (channel_id, target_id)
+            target: Kết nối của peer đích
+            action: Action của frame
+            frame: Frame đã mã hóa (xem with_peer_id)
+        """
+        if action == "ice_candidate" and self.coalesce_window > 0:
+            frames = self._pending.get(key)
+            if frames is None:
+                self._pending[key] = [frame]
+                self._targets[key] = target
+                asyncio.get_running_loop().call_later(self.coalesce_window, self.flush, key)
+            else:
+                frames.append(frame)
+            return
+        self.flush(key)
+        target.send(frame)
+
+    def flush(self, key):
+        """Gửi ngay các ice_candidate đang chờ của một peer"""
+        frames = self._pending.pop(key, None)
+        target = self._targets.pop(key, None)
+        if frames and target is not None:
+            target.send(batch_frame(frames))
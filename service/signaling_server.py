@@ -0,0 +1,344 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import List, Optional
+from urllib.parse import urlsplit, parse_qs
+from fastapi import WebSocketDisconnect
+from database import AsyncSessionLocal
+from routers.signaling import signaling_websocket
+from service.logger import get_logger
+from service.ws_compression import get_compression_settings
+from service.socket import (
+    FrameParser, PerMessageDeflate, ProtocolError, build_frame, compute_accept_key,
+    OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG
+)
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = get_logger("signaling_server")
+
+SIGNALING_PATH = re.compile(r"^/ws/(\d+)/signaling$")
+# Giới hạn kích thước header của request handshake
+MAX_HANDSHAKE_SIZE = 16 * 1024
+# Close code (RFC 6455 mục 7.4.1)
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_NO_STATUS = 1005
+CLOSE_ABNORMAL = 1006
+CLOSE_INVALID_DATA = 1007
+
+
+class HandshakeError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class StreamWebSocket:
+    """
+    WebSocket trên cặp StreamReader/StreamWriter của asyncio, có các phương
+    thức accept/receive_text/receive_bytes/send_text/send_bytes/close giống
+    WebSocket của Starlette nên dùng được với signaling_websocket,
+    OutboundConnection và ChannelFanout.
+
+    Tự trả lời ping, gửi ping mỗi ping_interval giây và đóng kết nối nếu không
+    nhận được frame nào trong ping_interval + ping_timeout giây. Khi đã thỏa
+    thuận permessage-deflate, tin nhắn gửi/nhận được nén theo deflate.
+    """
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        accept_key,
+        ping_interval=20.0,
+        ping_timeout=20.0,
+        extensions: Optional[str] = None,
+        deflate: Optional[PerMessageDeflate] = None,
+        subprotocols: Optional[List[str]] = None
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.accept_key = accept_key
+        # Giá trị Sec-WebSocket-Extensions trả cho client
+        self.extensions = extensions
+        self.deflate = deflate
+        # Subprotocol client đề nghị (Sec-WebSocket-Protocol), đọc qua scope giống Starlette
+        self.scope = {"type": "websocket", "subprotocols": subprotocols or []}
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.accepted = False
+        self.closed = False
+        self._parser = FrameParser(deflate=deflate)
+        self._messages = deque()
+        self._last_received = time.monotonic()
+        self._ping_task = None
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        response = (
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {self.accept_key}\r\n"
+        )
+        if self.extensions:
+            response += f"Sec-WebSocket-Extensions: {self.extensions}\r\n"
+        if subprotocol:
+            response += f"Sec-WebSocket-Protocol: {subprotocol}\r\n"
+        self.writer.write(response.encode("latin-1") + b"\r\n")
+        await self.writer.drain()
+        self.accepted = True
+        if self.ping_interval:
+            self._ping_task = asyncio.get_running_loop().create_task(self._keepalive())
+
+    async def receive_text(self) -> str:
+        """
+        Chờ tin nhắn text tiếp theo (ping/pong/close được xử lý tại đây)
+
+        Raises:
+            WebSocketDisconnect: Client đóng kết nối, mất kết nối hoặc vi phạm giao thức
+        """
+        payload = await self._receive(OP_TEXT)
+        try:
+            return payload.decode("utf-8")
+        except UnicodeDecodeError:
+            await self.close(CLOSE_INVALID_DATA, "Invalid UTF-8")
+            raise WebSocketDisconnect(CLOSE_INVALID_DATA)
+
+    async def receive_bytes(self) -> bytes:
+        """Chờ tin nhắn binary tiếp theo (giống receive_text)"""
+        return await self._receive(OP_BINARY)
+
+    async def _receive(self, opcode) -> bytes:
+        while True:
+            while not self._messages:
+                data = await self.reader.read(65536) if not self.closed else b""
+                if not data:
+                    await self._abort()
+                    raise WebSocketDisconnect(CLOSE_ABNORMAL)
+                self._last_received = time.monotonic()
+                try:
+                    self._messages.extend(self._parser.feed(data))
+                except ProtocolError as e:
+                    await self.close(CLOSE_PROTOCOL_ERROR, str(e)[:120])
+                    raise WebSocketDisconnect(CLOSE_PROTOCOL_ERROR)
+            message = self._messages.popleft()
+            if message.opcode == opcode:
+                return message.payload
+            if message.opcode == OP_PING:
+                await self._write(build_frame(message.payload, OP_PONG))
+            elif message.opcode == OP_CLOSE:
+                code = int.from_bytes(message.payload[:2], "big") if len(message.payload) >= 2 else CLOSE_NO_STATUS
+                await self.close(CLOSE_NORMAL)
+                raise WebSocketDisconnect(code)
+            elif message.opcode != OP_PONG:
+                kind = "Binary" if message.opcode == OP_BINARY else "Text"
+                await self.close(CLOSE_UNSUPPORTED_DATA, f"{kind} frames are not supported")
+                raise WebSocketDisconnect(CLOSE_UNSUPPORTED_DATA)
+
+    async def send_text(self, text: str):
+        await self._send(text.encode(), OP_TEXT)
+
+    async def send_bytes(self, data: bytes):
+        await self._send(data, OP_BINARY)
+
+    async def _send(self, payload: bytes, opcode):
+        if self.closed:
+            raise RuntimeError("WebSocket is closed")
+        if self.deflate is not None:
+            await self._write(self.deflate.encode(payload, opcode))
+        else:
+            await self._write(build_frame(payload, opcode))
+
+    async def close(self, code=CLOSE_NORMAL, reason=""):
+        if self.closed:
+            return
+        if not self.accepted:
+            # Đóng trước khi accept: từ chối handshake giống Starlette (HTTP 403)
+            await self._reject(403, reason or "Forbidden")
+            return
+        payload = code.to_bytes(2, "big") + reason.encode()[:123]
+        try:
+            await self._write(build_frame(payload, OP_CLOSE))
+        except Exception:
+            pass
+        await self._abort()
+
+    async def _reject(self, status, reason):
+        body = reason.encode()
+        try:
+            await self._write(
+                f"HTTP/1.1 {status} {reason}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+        except Exception:
+            pass
+        await self._abort()
+
+    async def _write(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def _abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._ping_task is not None and self._ping_task is not asyncio.current_task():
+            self._ping_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+    async def _keepalive(self):
+        while not self.closed:
+            await asyncio.sleep(self.ping_interval)
+            if time.monotonic() - self._last_received > self.ping_interval + self.ping_timeout:
+                logger.info("Closing signaling connection: no response to ping")
+                await self._abort()
+                return
+            try:
+                await self._write(build_frame(b"", OP_PING))
+            except Exception:
+                await self._abort()
+                return
+
+
+async def read_handshake(reader: asyncio.StreamReader, timeout: Optional[float] = None):
+    """
+    Đọc và kiểm tra request nâng cấp WebSocket
+
+    Args:
+        timeout: Thời gian tối đa (giây) để nhận đủ header, None: không giới hạn
+
+    Returns:
+        (channel_id, peer_id, token, accept_key, Sec-WebSocket-Extensions của client,
+        danh sách subprotocol client đề nghị)
+
+    Raises:
+        HandshakeError: Request không hợp lệ (kèm mã HTTP trả về)
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    except asyncio.TimeoutError:
+        # Client mở kết nối nhưng không gửi (đủ) header
+        raise HandshakeError(408, "Request Timeout")
+    except asyncio.LimitOverrunError:
+        raise HandshakeError(431, "Request Header Fields Too Large")
+    except asyncio.IncompleteReadError:
+        raise HandshakeError(400, "Bad Request")
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    parts = request_line.split()
+    if len(parts) != 3 or parts[0] != "GET":
+        raise HandshakeError(405, "Method Not Allowed")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        if name:
+            name = name.strip().lower()
+            # Header lặp lại (ví dụ Sec-WebSocket-Extensions) được nối bằng dấu phẩy
+            headers[name] = f"{headers[name]}, {value.strip()}" if name in headers else value.strip()
+    if headers.get("upgrade", "").lower() != "websocket" or "upgrade" not in headers.get("connection", "").lower():
+        raise HandshakeError(426, "Upgrade Required")
+    if headers.get("sec-websocket-version") != "13" or not headers.get("sec-websocket-key"):
+        raise HandshakeError(400, "Bad Request")
+
+    url = urlsplit(parts[1])
+    match = SIGNALING_PATH.match(url.path)
+    if not match:
+        raise HandshakeError(404, "Not Found")
+    query = parse_qs(url.query)
+    if not query.get("peer_id"):
+        raise HandshakeError(400, "Missing peer_id")
+    token: Optional[str] = query.get("token", [None])[0]
+    subprotocols = [item.strip() for item in headers.get("sec-websocket-protocol", "").split(",") if item.strip()]
+    return (
+        int(match.group(1)), query["peer_id"][0], token,
+        compute_accept_key(headers["sec-websocket-key"]), headers.get("sec-websocket-extensions"),
+        subprotocols
+    )
+
+
+class SignalingServer:
+    """
+    Listener signaling độc lập trên asyncio.start_server, không qua
+    Starlette/FastAPI. Handshake, ping/pong và close do StreamWebSocket xử lý;
+    mỗi kết nối chạy signaling_websocket nên dùng chung fanout, broker và
+    presence với endpoint /ws/{channel_id}/signaling của FastAPI.
+    """
+    def __init__(self, host="0.0.0.0", port=0, ping_interval=20.0, ping_timeout=20.0, handshake_timeout=10.0):
+        self.host = host
+        self.port = port
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.handshake_timeout = handshake_timeout
+        self._server = None
+        # StreamWebSocket: task xử lý kết nối
+        self._websockets = {}
+
+    @property
+    def connections(self):
+        return len(self._websockets)
+
+    async def start(self):
+        if self._server is None:
+            # reuse_port: nhiều worker uvicorn cùng lắng nghe một cổng
+            self._server = await asyncio.start_server(
+                self._handle, self.host, self.port, limit=MAX_HANDSHAKE_SIZE, reuse_port=True
+            )
+            logger.info(f"Signaling server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Đóng các kết nối đang mở (signaling_websocket nhận WebSocketDisconnect)
+            handlers = list(self._websockets.values())
+            for websocket in list(self._websockets):
+                await websocket.close(1001, "Server shutting down")
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            channel_id, peer_id, token, accept_key, extensions, subprotocols = await read_handshake(reader, self.handshake_timeout)
+        except HandshakeError as e:
+            await StreamWebSocket(reader, writer, None)._reject(e.status, e.reason)
+            return
+        extensions, deflate = get_compression_settings().negotiate(extensions)
+        websocket = StreamWebSocket(
+            reader, writer, accept_key, self.ping_interval, self.ping_timeout,
+            extensions=extensions, deflate=deflate, subprotocols=subprotocols
+        )
+        self._websockets[websocket] = asyncio.current_task()
+        try:
+            async with AsyncSessionLocal() as db:
+                await signaling_websocket(websocket, channel_id, peer_id, token, db)
+        except Exception as e:
+            logger.error(f"Error in signaling connection {peer_id}: {str(e)}")
+        finally:
+            self._websockets.pop(websocket, None)
+            await websocket.close()
+
+
+# Tạo instance mặc định của SignalingServer (cổng 0 = không bật)
+signaling_server = SignalingServer(
+    host=os.getenv("SIGNALING_SERVER_HOST", "0.0.0.0"),
+    port=int(os.getenv("SIGNALING_SERVER_PORT", "0")),
+    ping_interval=int(os.getenv("SIGNALING_SERVER_PING_INTERVAL_SECONDS", "20")),
+    ping_timeout=int(os.getenv("SIGNALING_SERVER_PING_TIMEOUT_SECONDS", "20")),
+    handshake_timeout=int(os.getenv("SIGNALING_SERVER_HANDSHAKE_TIMEOUT_SECONDS", "10"))
+)
+
+def get_signaling_server():
+    """
+    Lấy instance mặc định của SignalingServer
+
+    Returns:
+        SignalingServer instance
+    """
+    return signaling_server
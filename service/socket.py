@@ -1,7 +1,47 @@
 import json
+import os
 import struct
 import base64
 import hashlib
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy
+except ImportError:  # NumPy là tùy chọn, không có thì unmask bằng số nguyên Python
+    numpy = None
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+DATA_OPCODES = (OP_TEXT, OP_BINARY)
+CONTROL_OPCODES = (OP_CLOSE, OP_PING, OP_PONG)
+
+# Giới hạn kích thước một tin nhắn (sau khi ghép các fragment)
+DEFAULT_MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# Phần đuôi của khối deflate rỗng, bị bỏ khi gửi và thêm lại khi giải nén (RFC 7692 mục 7.2)
+DEFLATE_TAIL = b"\x00\x00\xff\xff"
+DEFLATE_EXTENSION = "permessage-deflate"
+# Payload từ kích thước này trở lên được unmask bằng NumPy (nếu có);
+# payload nhỏ hơn thì chi phí tạo mảng lớn hơn phần tiết kiệm được
+NUMPY_UNMASK_THRESHOLD = 4096
+
+
+class ProtocolError(ValueError):
+    """Luồng byte không phải frame WebSocket hợp lệ (RFC 6455)"""
+
+
+class Message(NamedTuple):
+    """Một tin nhắn hoàn chỉnh (đã ghép fragment) hoặc một control frame"""
+    opcode: int
+    payload: bytes
+
+    def text(self) -> str:
+        return self.payload.decode("utf-8")
+
 
 # Hàm tính Sec-WebSocket-Accept (không cần dùng vì FastAPI tự xử lý handshake)
 def compute_accept_key(key):
@@ -9,23 +49,52 @@ def compute_accept_key(key):
     sha1 = hashlib.sha1((key + GUID).encode()).digest()
     return base64.b64encode(sha1).decode()
 
-# Mã hóa frame (server không mask)
-def encode_frame(message, opcode=0x1):
-    payload = json.dumps(message).encode()
+# Bỏ mask payload: XOR cả payload như một số nguyên lớn (hoặc từng khối 8 byte
+# bằng NumPy với payload lớn) thay vì từng byte
+def unmask(payload, masking_key):
+    length = len(payload)
+    if not length:
+        return b""
+    masking_key = bytes(masking_key)
+    if numpy is not None and length >= NUMPY_UNMASK_THRESHOLD:
+        body = length - length % 8
+        words = numpy.frombuffer(payload, dtype="<u8", count=body // 8)
+        key = numpy.frombuffer(masking_key * 2, dtype="<u8")[0]
+        # body chia hết cho 4 nên phần còn lại bắt đầu lại từ byte đầu của key
+        return numpy.bitwise_xor(words, key).tobytes() + unmask(payload[body:], masking_key)
+    key = (masking_key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")).to_bytes(length, "little")
+
+# Dựng frame từ payload bytes; masking_key=None cho frame của server,
+# rsv1=True cho tin nhắn đã nén bằng permessage-deflate
+def build_frame(payload, opcode=OP_TEXT, fin=True, masking_key=None, rsv1=False):
     length = len(payload)
     frame = bytearray()
-    frame.append(0x80 | opcode)  # FIN=1, opcode=0x1 (text)
+    frame.append((0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode)
+    mask_bit = 0x80 if masking_key is not None else 0
     if length <= 125:
-        frame.append(length)
+        frame.append(mask_bit | length)
     elif length <= 65535:
-        frame.append(126)
+        frame.append(mask_bit | 126)
         frame.extend(struct.pack(">H", length))
     else:
-        frame.append(127)
+        frame.append(mask_bit | 127)
         frame.extend(struct.pack(">Q", length))
-    frame.extend(payload)
+    if masking_key is not None:
+        frame.extend(masking_key)
+        frame.extend(unmask(payload, masking_key))
+    else:
+        frame.extend(payload)
     return bytes(frame)
 
+# Frame do client gửi (có mask ngẫu nhiên)
+def build_client_frame(payload, opcode=OP_TEXT, fin=True, rsv1=False):
+    return build_frame(payload, opcode, fin, os.urandom(4), rsv1)
+
+# Mã hóa frame (server không mask)
+def encode_frame(message, opcode=OP_TEXT):
+    return build_frame(json.dumps(message).encode(), opcode)
+
 # Giải mã frame (client có mask)
 def decode_frame(data):
     if len(data) < 2:
@@ -55,9 +124,300 @@ def decode_frame(data):
         offset += 4
         if len(data) < offset + payload_len:
             return 0, 0, b""  # Frame chưa đủ dữ liệu
-        masked_data = data[offset:offset + payload_len]
-        unmasked_data = bytes(b ^ masking_key[i % 4] for i, b in enumerate(masked_data))
+        unmasked_data = unmask(data[offset:offset + payload_len], masking_key)
     else:
         unmasked_data = data[offset:offset + payload_len]
 
-    return fin, opcode, unmasked_data
\ No newline at end of file
+    return fin, opcode, unmasked_data
+
+
+class PerMessageDeflate:
+    """
+    Nén permessage-deflate (RFC 7692) của một kết nối, phía server.
+
+    Với context takeover, bộ nén/giải nén được giữ giữa các tin nhắn nên các
+    chuỗi lặp lại (khóa JSON, dòng SDP) chỉ tốn vài byte ở tin nhắn sau; đổi
+    lại mỗi kết nối giữ cửa sổ 2^window_bits byte cho mỗi chiều. Tin nhắn
+    ngắn hơn min_size được gửi không nén (RSV1=0).
+    """
+    def __init__(
+        self,
+        server_no_context_takeover=False,
+        client_no_context_takeover=False,
+        server_max_window_bits=15,
+        client_max_window_bits=15,
+        min_size=0,
+        compress_level=zlib.Z_DEFAULT_COMPRESSION,
+        mem_level=8
+    ):
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_max_window_bits = server_max_window_bits
+        self.client_max_window_bits = client_max_window_bits
+        self.min_size = min_size
+        self.compress_level = compress_level
+        self.mem_level = mem_level
+        self._compressor = None
+        self._decompressor = None
+
+    def should_compress(self, payload) -> bool:
+        return len(payload) >= self.min_size
+
+    def compress(self, payload) -> bytes:
+        """Nén payload của một tin nhắn (chưa bỏ qua theo min_size)"""
+        if self._compressor is None or self.server_no_context_takeover:
+            self._compressor = zlib.compressobj(
+                self.compress_level, zlib.DEFLATED, -self.server_max_window_bits, self.mem_level
+            )
+        data = self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4]
+
+    def decompress(self, payload, max_size=0) -> bytes:
+        """
+        Giải nén payload của một tin nhắn có RSV1
+
+        Raises:
+            ProtocolError: Dữ liệu nén hỏng hoặc vượt quá max_size sau khi giải nén
+        """
+        if self._decompressor is None or self.client_no_context_takeover:
+            # Cửa sổ lớn hơn vẫn giải nén đúng; zlib không hỗ trợ tốt cửa sổ 8 bit
+            self._decompressor = zlib.decompressobj(-max(9, self.client_max_window_bits))
+        try:
+            data = self._decompressor.decompress(bytes(payload) + DEFLATE_TAIL, max_size)
+        except zlib.error as e:
+            raise ProtocolError(f"Invalid compressed data: {e}")
+        if self._decompressor.unconsumed_tail:
+            raise ProtocolError("Message exceeds max_message_size")
+        return data
+
+    def encode(self, payload, opcode=OP_TEXT) -> bytes:
+        """Dựng frame server cho một tin nhắn, nén nếu đủ min_size"""
+        if self.should_compress(payload):
+            return build_frame(self.compress(payload), opcode, rsv1=True)
+        return build_frame(payload, opcode)
+
+
+def parse_extensions(header) -> List[Tuple[str, Dict[str, Optional[str]]]]:
+    """
+    Phân tích header Sec-WebSocket-Extensions
+
+    Returns:
+        Danh sách (tên extension, {tham số: giá trị hoặc None}); tham số lặp lại
+        được đánh dấu bằng khóa "" để bên gọi từ chối đề nghị đó
+    """
+    offers = []
+    for offer in header.split(","):
+        name, *parameters = [part.strip() for part in offer.split(";")]
+        if not name:
+            continue
+        params = {}
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            key = key.strip()
+            if key in params:
+                params[""] = None
+            params[key] = value.strip().strip('"') if value else None
+        offers.append((name, params))
+    return offers
+
+
+def negotiate_deflate(
+    header,
+    server_max_window_bits=15,
+    client_max_window_bits=15,
+    server_no_context_takeover=False,
+    client_no_context_takeover=False,
+    min_size=0,
+    compress_level=zlib.Z_DEFAULT_COMPRESSION,
+    mem_level=8
+):
+    """
+    Chọn đề nghị permessage-deflate đầu tiên chấp nhận được trong
+    Sec-WebSocket-Extensions của client (RFC 7692 mục 5, 7.1)
+
+    Args:
+        server_max_window_bits: Cửa sổ tối đa server dùng để nén (9-15)
+        client_max_window_bits: Cửa sổ đề nghị client dùng, nếu client hỗ trợ
+        server_no_context_takeover / client_no_context_takeover: Bỏ context
+            giữa các tin nhắn (ít bộ nhớ hơn, nén kém hơn)
+
+    Returns:
+        (giá trị header trả lời, PerMessageDeflate) hoặc (None, None) nếu không nén
+    """
+    for name, params in parse_extensions(header or ""):
+        if name != DEFLATE_EXTENSION:
+            continue
+        if set(params) - {
+            "server_no_context_takeover", "client_no_context_takeover",
+            "server_max_window_bits", "client_max_window_bits"
+        }:
+            continue
+        if params.get("server_no_context_takeover") or params.get("client_no_context_takeover"):
+            continue
+
+        server_bits = server_max_window_bits
+        if "server_max_window_bits" in params:
+            offered = params["server_max_window_bits"]
+            if offered not in [str(bits) for bits in range(8, 16)]:
+                continue
+            # zlib không nén được với cửa sổ 8 bit
+            if int(offered) < 9:
+                continue
+            server_bits = min(server_bits, int(offered))
+        client_bits = 15
+        if "client_max_window_bits" in params:
+            offered = params["client_max_window_bits"]
+            if offered is not None and offered not in [str(bits) for bits in range(8, 16)]:
+                continue
+            client_bits = min(client_max_window_bits, int(offered or 15))
+
+        response = [DEFLATE_EXTENSION]
+        server_nct = server_no_context_takeover or "server_no_context_takeover" in params
+        client_nct = client_no_context_takeover or "client_no_context_takeover" in params
+        if server_nct:
+            response.append("server_no_context_takeover")
+        if client_nct:
+            response.append("client_no_context_takeover")
+        if server_bits < 15 or "server_max_window_bits" in params:
+            response.append(f"server_max_window_bits={server_bits}")
+        if "client_max_window_bits" in params and client_bits < 15:
+            response.append(f"client_max_window_bits={client_bits}")
+        return "; ".join(response), PerMessageDeflate(
+            server_no_context_takeover=server_nct,
+            client_no_context_takeover=client_nct,
+            server_max_window_bits=server_bits,
+            client_max_window_bits=client_bits,
+            min_size=min_size,
+            compress_level=compress_level,
+            mem_level=mem_level
+        )
+    return None, None
+
+
+class FrameParser:
+    """
+    Bộ phân tích frame WebSocket dạng luồng.
+
+    feed() nhận từng đoạn byte đọc được từ socket (có thể cắt ngang frame ở
+    bất kỳ vị trí nào), giữ phần chưa đủ trong bộ đệm và trả về các tin nhắn
+    đã hoàn chỉnh. Header được đọc qua memoryview của bộ đệm nên payload chỉ
+    được sao chép một lần khi unmask. Tin nhắn bị chia thành nhiều fragment
+    được ghép lại; control frame (ping/pong/close) xen giữa các fragment được
+    trả về ngay. Khi có deflate, tin nhắn có RSV1 được giải nén sau khi ghép.
+    """
+    def __init__(self, max_message_size=DEFAULT_MAX_MESSAGE_SIZE, require_mask=True, deflate: Optional[PerMessageDeflate] = None):
+        self.max_message_size = max_message_size
+        # Frame từ client bắt buộc có mask (RFC 6455 mục 5.1)
+        self.require_mask = require_mask
+        # permessage-deflate đã thỏa thuận: cho phép RSV1 ở frame đầu của tin nhắn
+        self.deflate = deflate
+        self._buffer = bytearray()
+        self._fragments: List[bytes] = []
+        self._fragment_opcode = None
+        self._fragment_compressed = False
+        self._fragment_size = 0
+
+    def feed(self, data) -> List[Message]:
+        """
+        Thêm dữ liệu vừa nhận và lấy các tin nhắn đã hoàn chỉnh
+
+        Raises:
+            ProtocolError: Dữ liệu vi phạm giao thức, nên đóng kết nối (mã 1002/1009)
+        """
+        buffer = self._buffer
+        buffer.extend(data)
+        messages = []
+        position = 0
+        with memoryview(buffer) as view:
+            while True:
+                frame = self._parse_frame(view, position)
+                if frame is None:
+                    break
+                position, message = frame
+                if message is not None:
+                    messages.append(message)
+        if position:
+            del buffer[:position]
+        return messages
+
+    @property
+    def buffered(self):
+        """Số byte đang chờ đủ frame"""
+        return len(self._buffer)
+
+    def _parse_frame(self, view, position):
+        available = len(view) - position
+        if available < 2:
+            return None
+        first, second = view[position], view[position + 1]
+        fin = first & 0x80
+        opcode = first & 0x0F
+        masked = second & 0x80
+        length = second & 0x7F
+
+        compressed = False
+        if first & 0x70:
+            if self.deflate is None or first & 0x70 != 0x40 or opcode not in DATA_OPCODES:
+                raise ProtocolError("Reserved bits set without a negotiated extension")
+            compressed = True
+        if self.require_mask and not masked:
+            raise ProtocolError("Client frames must be masked")
+
+        header = 2
+        if length == 126:
+            header = 4
+            if available < header:
+                return None
+            length = int.from_bytes(view[position + 2:position + 4], "big")
+        elif length == 127:
+            header = 10
+            if available < header:
+                return None
+            length = int.from_bytes(view[position + 2:position + 10], "big")
+
+        if opcode in CONTROL_OPCODES:
+            if not fin or length > 125:
+                raise ProtocolError("Control frames must not be fragmented or exceed 125 bytes")
+        elif opcode == OP_CONTINUATION:
+            if self._fragment_opcode is None:
+                raise ProtocolError("Continuation frame without a message to continue")
+        elif opcode in DATA_OPCODES:
+            if self._fragment_opcode is not None:
+                raise ProtocolError("New data frame before the fragmented message finished")
+        else:
+            raise ProtocolError(f"Unknown opcode {opcode:#x}")
+        if opcode not in CONTROL_OPCODES and self._fragment_size + length > self.max_message_size:
+            raise ProtocolError("Message exceeds max_message_size")
+
+        start = position + header + (4 if masked else 0)
+        end = start + length
+        if len(view) < end:
+            return None
+        payload = view[start:end]
+        if masked:
+            payload = unmask(payload, view[start - 4:start])
+        else:
+            payload = bytes(payload)
+
+        if opcode in CONTROL_OPCODES:
+            return end, Message(opcode, payload)
+        if fin and opcode != OP_CONTINUATION:
+            if compressed:
+                payload = self.deflate.decompress(payload, self.max_message_size)
+            return end, Message(opcode, payload)
+
+        if opcode != OP_CONTINUATION:
+            self._fragment_opcode = opcode
+            self._fragment_compressed = compressed
+        self._fragments.append(payload)
+        self._fragment_size += length
+        if not fin:
+            return end, None
+        payload = b"".join(self._fragments)
+        if self._fragment_compressed:
+            payload = self.deflate.decompress(payload, self.max_message_size)
+        message = Message(self._fragment_opcode, payload)
+        self._fragments = []
+        self._fragment_opcode = None
+        self._fragment_size = 0
+        return end, message
@@ -0,0 +1,454 @@
+import json
+import re
+import struct
+from typing import Dict, Iterable, Optional, Union
+from fastapi import WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tùy chọn, không có thì dùng bộ mã hóa Python bên dưới
+    msgpack = None
+
+# Subprotocol (Sec-WebSocket-Protocol) của từng cách mã hóa
+JSON_SUBPROTOCOL = "chat.v1.json"
+COMPACT_SUBPROTOCOL = "chat.v1.compact"
+
+# Tên trường được thay bằng chỉ số trong bảng (MessagePack positive fixint).
+# Chỉ được thêm vào cuối; đổi thứ tự hoặc xóa phải tăng phiên bản subprotocol.
+FIELD_NAMES = (
+    "action", "peer_id", "target_id", "channel_id", "username", "fullname",
+    "sdp", "type", "candidate", "sdpMid", "sdpMLineIndex", "usernameFragment",
+    "id", "content", "created_at", "sender", "full_name", "status",
+    "temp_id", "users", "messages", "detail",
+)
+FIELD_INDEX = {name: index for index, name in enumerate(FIELD_NAMES)}
+# Giới hạn độ sâu lồng nhau khi giải mã dữ liệu từ client
+MAX_DEPTH = 32
+# Kiểu giá trị đơn được chấp nhận khi giải mã (tin nhắn phải chuyển được sang JSON)
+JSON_SCALARS = (str, int, float, bool)
+# Close code khi frame sai loại (text/binary) hoặc không giải mã được (RFC 6455 mục 7.4.1)
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_INVALID_DATA = 1007
+# Số trường đầu object tối đa được đọc khi định tuyến
+PEEK_MAX_FIELDS = 4
+# Trường đầu object dạng "tên": "chuỗi ngắn không có escape" (xem peek_fields)
+LEADING_FIELD = re.compile(r'\s*"(\w{1,32})"\s*:\s*"([^"\\\x00-\x1f]{0,128})"\s*([,}])')
+
+
+def serialize(message) -> str:
+    """Mã hóa JSON giống WebSocket.send_json của Starlette"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class WireCodec:
+    """
+    Cách mã hóa tin nhắn trên một WebSocket.
+
+    Dạng chuẩn của tin nhắn trong ứng dụng (broker, fanout, relay) là JSON
+    text; codec chuyển dạng chuẩn sang frame gửi cho client (transcode) và giải
+    mã frame client gửi lên (decode).
+    """
+    name = "json"
+    subprotocol: Optional[str] = None
+    binary = False
+
+    def encode(self, message) -> Union[str, bytes]:
+        return serialize(message)
+
+    def decode(self, data: Union[str, bytes]) -> Dict:
+        return json.loads(data)
+
+    def transcode(self, text: str) -> Union[str, bytes]:
+        """Chuyển một tin nhắn JSON đã mã hóa sang frame của codec"""
+        return text
+
+    async def receive(self, websocket):
+        """
+        Nhận một tin nhắn từ WebSocket
+
+        Returns:
+            (tin nhắn, dạng JSON text chuẩn để chuyển tiếp)
+
+        Raises:
+            WebSocketDisconnect: Client ngắt kết nối, hoặc frame sai loại/không
+                giải mã được (kết nối bị đóng với 1003/1007)
+        """
+        data = await self._receive_text(websocket)
+        return await self._parse(websocket, data), data
+
+    async def receive_routed(self, websocket, fields):
+        """
+        Nhận một tin nhắn chỉ để định tuyến: nếu các trường fields nằm ngay đầu
+        object (xem peek_fields) thì không phân tích phần còn lại, frame được
+        chuyển tiếp nguyên vẹn mà không kiểm tra là JSON hợp lệ. Nếu không thì
+        phân tích toàn bộ như receive.
+
+        Returns:
+            (dict chứa các trường tìm được (hoặc cả tin nhắn), dạng JSON text chuẩn)
+        """
+        data = await self._receive_text(websocket)
+        routing = peek_fields(data, fields)
+        if routing is not None:
+            return routing, data
+        return await self._parse(websocket, data), data
+
+    async def _receive_text(self, websocket):
+        try:
+            return await websocket.receive_text()
+        except KeyError:
+            # Starlette: client gửi frame binary
+            await reject_frame(websocket, CLOSE_UNSUPPORTED_DATA, "Binary frames are not supported")
+
+    async def _parse(self, websocket, data):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            await reject_frame(websocket, CLOSE_INVALID_DATA, "Invalid JSON")
+        if not isinstance(message, dict):
+            await reject_frame(websocket, CLOSE_INVALID_DATA, "Expected an object")
+        return message
+
+
+class JsonCodec(WireCodec):
+    subprotocol = JSON_SUBPROTOCOL
+
+
+class CompactCodec(WireCodec):
+    """
+    MessagePack với tên trường thường gặp thay bằng chỉ số trong FIELD_NAMES
+    (khóa map là số nguyên, còn khóa khác giữ nguyên chuỗi). Client giải mã
+    bằng bất kỳ thư viện MessagePack nào rồi tra lại tên trường theo bảng.
+    Frame được gửi dạng binary.
+    """
+    name = "compact"
+    subprotocol = COMPACT_SUBPROTOCOL
+    binary = True
+
+    def encode(self, message) -> bytes:
+        if msgpack is not None:
+            return msgpack.packb(intern_fields(message), use_bin_type=True)
+        buffer = bytearray()
+        pack(message, buffer)
+        return bytes(buffer)
+
+    def decode(self, data: Union[str, bytes]) -> Dict:
+        """
+        Raises:
+            ValueError: Frame không hợp lệ
+        """
+        if isinstance(data, str):
+            raise ValueError("Compact codec expects binary frames")
+        if msgpack is not None:
+            try:
+                value = msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=reject_extension)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"Invalid compact frame: {e}")
+            return restore_fields(value)
+        value, offset = unpack(data, 0, 0)
+        if offset != len(data):
+            raise ValueError("Invalid compact frame: trailing data")
+        return value
+
+    def transcode(self, text: str) -> bytes:
+        return self.encode(json.loads(text))
+
+    async def receive(self, websocket):
+        try:
+            data = await websocket.receive_bytes()
+        except KeyError:
+            # Starlette: client gửi frame text
+            await reject_frame(websocket, CLOSE_UNSUPPORTED_DATA, "Text frames are not supported")
+        try:
+            message = self.decode(data)
+        except ValueError as e:
+            await reject_frame(websocket, CLOSE_INVALID_DATA, str(e)[:120])
+        if not isinstance(message, dict):
+            await reject_frame(websocket, CLOSE_INVALID_DATA, "Expected an object")
+        return message, serialize(message)
+
+    async def receive_routed(self, websocket, fields):
+        # Frame MessagePack phải giải mã toàn bộ để chuyển sang dạng JSON chuẩn
+        return await self.receive(websocket)
+
+
+# JSON không qua subprotocol (client cũ)
+DEFAULT_CODEC = WireCodec()
+JSON_CODEC = JsonCodec()
+COMPACT_CODEC = CompactCodec()
+CODECS = {codec.subprotocol: codec for codec in (JSON_CODEC, COMPACT_CODEC)}
+
+
+def negotiate_codec(subprotocols: Iterable[str]) -> WireCodec:
+    """
+    Chọn codec theo danh sách subprotocol client đề nghị (theo thứ tự ưu tiên
+    của client). Không đề nghị subprotocol nào đã biết thì dùng JSON.
+    """
+    for subprotocol in subprotocols or ():
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec
+    return DEFAULT_CODEC
+
+
+async def reject_frame(websocket, code, reason):
+    """Đóng kết nối vì frame không hợp lệ; handler xử lý như client ngắt kết nối"""
+    await websocket.close(code=code, reason=reason)
+    raise WebSocketDisconnect(code)
+
+
+def peek_fields(data: str, fields) -> Optional[Dict[str, str]]:
+    """
+    Đọc các trường fields từ đầu một object JSON mà không phân tích cả frame.
+    Chỉ nhận các trường đứng liền nhau ngay sau "{" với giá trị là chuỗi ngắn
+    không có escape, ví dụ {"action":"offer","target_id":"p2","sdp":...}.
+
+    Returns:
+        {tên: giá trị} khi đọc được mọi trường trong fields, None nếu cần phân tích toàn bộ
+    """
+    start = data.find("{", 0, 16)
+    if start < 0 or data[:start].strip() or not data.rstrip().endswith("}"):
+        return None
+    found = {}
+    position = start + 1
+    for _ in range(PEEK_MAX_FIELDS):
+        match = LEADING_FIELD.match(data, position)
+        if match is None:
+            return None
+        name, value, separator = match.groups()
+        if name in fields:
+            found[name] = value
+        position = match.end()
+        if separator == "}" or len(found) == len(fields):
+            break
+    return found if len(found) == len(fields) else None
+
+
+def reject_extension(code, data):
+    raise ValueError(f"unsupported extension type {code}")
+
+
+def intern_fields(value):
+    if isinstance(value, dict):
+        return {FIELD_INDEX.get(key, key): intern_fields(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [intern_fields(item) for item in value]
+    return value
+
+
+def restore_fields(value, depth=0):
+    if depth > MAX_DEPTH:
+        raise ValueError("Invalid compact frame: nested too deeply")
+    if isinstance(value, dict):
+        return {field_name(key): restore_fields(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, list):
+        return [restore_fields(item, depth + 1) for item in value]
+    if value is not None and not isinstance(value, JSON_SCALARS):
+        # bin, Timestamp (ext -1): không có dạng JSON tương ứng
+        raise ValueError(f"Invalid compact frame: unsupported type {type(value).__name__}")
+    return value
+
+
+def field_name(key):
+    if isinstance(key, int):
+        if 0 <= key < len(FIELD_NAMES):
+            return FIELD_NAMES[key]
+        raise ValueError(f"Invalid compact frame: unknown field {key}")
+    if not isinstance(key, str):
+        raise ValueError("Invalid compact frame: map keys must be strings or field indexes")
+    return key
+
+
+def pack(value, buffer: bytearray):
+    """Mã hóa MessagePack (tập con dùng cho JSON) vào buffer, có thay tên trường"""
+    if value is None:
+        buffer.append(0xC0)
+    elif value is True:
+        buffer.append(0xC3)
+    elif value is False:
+        buffer.append(0xC2)
+    elif isinstance(value, int):
+        pack_int(value, buffer)
+    elif isinstance(value, float):
+        buffer.append(0xCB)
+        buffer.extend(struct.pack(">d", value))
+    elif isinstance(value, str):
+        pack_str(value, buffer)
+    elif isinstance(value, dict):
+        length = len(value)
+        if length < 16:
+            buffer.append(0x80 | length)
+        elif length < 0x10000:
+            buffer.append(0xDE)
+            buffer.extend(struct.pack(">H", length))
+        else:
+            buffer.append(0xDF)
+            buffer.extend(struct.pack(">I", length))
+        for key, item in value.items():
+            index = FIELD_INDEX.get(key)
+            if index is not None:
+                buffer.append(index)
+            else:
+                pack_str(key, buffer)
+            pack(item, buffer)
+    elif isinstance(value, (list, tuple)):
+        length = len(value)
+        if length < 16:
+            buffer.append(0x90 | length)
+        elif length < 0x10000:
+            buffer.append(0xDC)
+            buffer.extend(struct.pack(">H", length))
+        else:
+            buffer.append(0xDD)
+            buffer.extend(struct.pack(">I", length))
+        for item in value:
+            pack(item, buffer)
+    elif isinstance(value, (bytes, bytearray)):
+        length = len(value)
+        if length < 0x100:
+            buffer.append(0xC4)
+            buffer.append(length)
+        elif length < 0x10000:
+            buffer.append(0xC5)
+            buffer.extend(struct.pack(">H", length))
+        else:
+            buffer.append(0xC6)
+            buffer.extend(struct.pack(">I", length))
+        buffer.extend(value)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def pack_int(value, buffer: bytearray):
+    if 0 <= value < 0x80:
+        buffer.append(value)
+    elif -32 <= value < 0:
+        buffer.append(value & 0xFF)
+    elif 0 <= value < 0x100:
+        buffer.extend((0xCC, value))
+    elif 0 <= value < 0x10000:
+        buffer.append(0xCD)
+        buffer.extend(struct.pack(">H", value))
+    elif 0 <= value < 0x100000000:
+        buffer.append(0xCE)
+        buffer.extend(struct.pack(">I", value))
+    elif 0 <= value < 0x10000000000000000:
+        buffer.append(0xCF)
+        buffer.extend(struct.pack(">Q", value))
+    elif -0x80 <= value:
+        buffer.append(0xD0)
+        buffer.extend(struct.pack(">b", value))
+    elif -0x8000 <= value:
+        buffer.append(0xD1)
+        buffer.extend(struct.pack(">h", value))
+    elif -0x80000000 <= value:
+        buffer.append(0xD2)
+        buffer.extend(struct.pack(">i", value))
+    elif -0x8000000000000000 <= value:
+        buffer.append(0xD3)
+        buffer.extend(struct.pack(">q", value))
+    else:
+        raise OverflowError("Integer out of 64-bit range")
+
+
+def pack_str(value: str, buffer: bytearray):
+    data = value.encode("utf-8")
+    length = len(data)
+    if length < 32:
+        buffer.append(0xA0 | length)
+    elif length < 0x100:
+        buffer.extend((0xD9, length))
+    elif length < 0x10000:
+        buffer.append(0xDA)
+        buffer.extend(struct.pack(">H", length))
+    else:
+        buffer.append(0xDB)
+        buffer.extend(struct.pack(">I", length))
+    buffer.extend(data)
+
+
+# Định dạng có độ dài cố định: mã byte -> (struct, số byte)
+FIXED_FORMATS = {
+    0xCA: (">f", 4), 0xCB: (">d", 8),
+    0xCC: (">B", 1), 0xCD: (">H", 2), 0xCE: (">I", 4), 0xCF: (">Q", 8),
+    0xD0: (">b", 1), 0xD1: (">h", 2), 0xD2: (">i", 4), 0xD3: (">q", 8),
+}
+# Độ dài của str/bin/array/map: mã byte -> (kiểu, struct độ dài, số byte)
+SIZED_FORMATS = {
+    0xD9: ("str", ">B", 1), 0xDA: ("str", ">H", 2), 0xDB: ("str", ">I", 4),
+    0xC4: ("bin", ">B", 1), 0xC5: ("bin", ">H", 2), 0xC6: ("bin", ">I", 4),
+    0xDC: ("array", ">H", 2), 0xDD: ("array", ">I", 4),
+    0xDE: ("map", ">H", 2), 0xDF: ("map", ">I", 4),
+}
+
+
+def unpack(data, offset, depth):
+    """
+    Giải mã một giá trị MessagePack bắt đầu tại offset
+
+    Returns:
+        (giá trị, offset sau giá trị)
+
+    Raises:
+        ValueError: Dữ liệu không hợp lệ hoặc bị cắt cụt
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError("Invalid compact frame: nested too deeply")
+    try:
+        code = data[offset]
+    except IndexError:
+        raise ValueError("Invalid compact frame: truncated")
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xE0:
+        return code - 0x100, offset
+    if code == 0xC0:
+        return None, offset
+    if code == 0xC2:
+        return False, offset
+    if code == 0xC3:
+        return True, offset
+
+    if 0xA0 <= code <= 0xBF:
+        kind, length = "str", code & 0x1F
+    elif 0x90 <= code <= 0x9F:
+        kind, length = "array", code & 0x0F
+    elif 0x80 <= code <= 0x8F:
+        kind, length = "map", code & 0x0F
+    elif code in FIXED_FORMATS:
+        fmt, size = FIXED_FORMATS[code]
+        if offset + size > len(data):
+            raise ValueError("Invalid compact frame: truncated")
+        return struct.unpack_from(fmt, data, offset)[0], offset + size
+    elif code in SIZED_FORMATS:
+        kind, fmt, size = SIZED_FORMATS[code]
+        if offset + size > len(data):
+            raise ValueError("Invalid compact frame: truncated")
+        length = struct.unpack_from(fmt, data, offset)[0]
+        offset += size
+    else:
+        raise ValueError(f"Invalid compact frame: unsupported type {code:#x}")
+
+    if kind in ("str", "bin"):
+        end = offset + length
+        if end > len(data):
+            raise ValueError("Invalid compact frame: truncated")
+        if kind == "bin":
+            raise ValueError("Invalid compact frame: unsupported type bin")
+        chunk = bytes(data[offset:end])
+        try:
+            return chunk.decode("utf-8"), end
+        except UnicodeDecodeError:
+            raise ValueError("Invalid compact frame: invalid UTF-8")
+    if kind == "array":
+        items = []
+        for _ in range(length):
+            item, offset = unpack(data, offset, depth + 1)
+            items.append(item)
+        return items, offset
+    result = {}
+    for _ in range(length):
+        key, offset = unpack(data, offset, depth + 1)
+        value, offset = unpack(data, offset, depth + 1)
+        result[field_name(key)] = value
+    return result, offset
@@ -0,0 +1,139 @@
+import logging
+import os
+import zlib
+from websockets.extensions.permessage_deflate import PerMessageDeflate as WebsocketsDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import Frame, Opcode
+from websockets.server import ServerProtocol
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from service.socket import negotiate_deflate
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class CompressionSettings:
+    """
+    Cấu hình permessage-deflate (RFC 7692) dùng chung cho các endpoint
+    WebSocket của FastAPI (qua uvicorn) và listener signaling asyncio.
+    """
+    def __init__(
+        self,
+        enabled=True,
+        server_max_window_bits=12,
+        client_max_window_bits=12,
+        server_no_context_takeover=False,
+        client_no_context_takeover=False,
+        min_size=64,
+        compress_level=zlib.Z_DEFAULT_COMPRESSION,
+        mem_level=5
+    ):
+        if not 9 <= server_max_window_bits <= 15 or not 8 <= client_max_window_bits <= 15:
+            raise ValueError("Window bits must be 9-15 (server) and 8-15 (client)")
+        self.enabled = enabled
+        self.server_max_window_bits = server_max_window_bits
+        self.client_max_window_bits = client_max_window_bits
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        # Tin nhắn ngắn hơn min_size byte được gửi không nén
+        self.min_size = min_size
+        self.compress_level = compress_level
+        self.mem_level = mem_level
+
+    def negotiate(self, header):
+        """
+        Thỏa thuận với Sec-WebSocket-Extensions của client (listener asyncio)
+
+        Returns:
+            (giá trị header trả lời, service.socket.PerMessageDeflate) hoặc (None, None)
+        """
+        if not self.enabled:
+            return None, None
+        return negotiate_deflate(
+            header,
+            server_max_window_bits=self.server_max_window_bits,
+            client_max_window_bits=self.client_max_window_bits,
+            server_no_context_takeover=self.server_no_context_takeover,
+            client_no_context_takeover=self.client_no_context_takeover,
+            min_size=self.min_size,
+            compress_level=self.compress_level,
+            mem_level=self.mem_level
+        )
+
+    def extension_factory(self):
+        """Factory extension của thư viện websockets cho uvicorn"""
+        return ThresholdDeflateFactory(
+            min_size=self.min_size,
+            server_no_context_takeover=self.server_no_context_takeover,
+            client_no_context_takeover=self.client_no_context_takeover,
+            server_max_window_bits=self.server_max_window_bits,
+            client_max_window_bits=self.client_max_window_bits,
+            compress_settings={"level": self.compress_level, "memLevel": self.mem_level}
+        )
+
+
+class ThresholdDeflate(WebsocketsDeflate):
+    """PerMessageDeflate của websockets, bỏ qua nén với tin nhắn ngắn hơn min_size"""
+    def __init__(self, *args, min_size=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+
+    def encode(self, frame: Frame) -> Frame:
+        # Chỉ bỏ qua tin nhắn một frame; tin nhắn nhiều fragment vẫn nén đồng nhất
+        if frame.fin and frame.opcode is not Opcode.CONT and len(frame.data) < self.min_size:
+            return frame
+        return super().encode(frame)
+
+
+class ThresholdDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, *args, min_size=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            min_size=self.min_size
+        )
+
+
+class CompressedWebSocketProtocol(WebSocketsSansIOProtocol):
+    """
+    Giao thức WebSocket mặc định của uvicorn, với permessage-deflate theo
+    compression_settings thay vì cấu hình cố định của uvicorn. Dùng qua
+    uvicorn.run(..., ws="service.ws_compression:CompressedWebSocketProtocol").
+    """
+    def __init__(self, config, *args, **kwargs):
+        super().__init__(config, *args, **kwargs)
+        settings = get_compression_settings()
+        self.conn = ServerProtocol(
+            extensions=[settings.extension_factory()] if settings.enabled and config.ws_per_message_deflate else [],
+            max_size=config.ws_max_size,
+            logger=logging.getLogger("uvicorn.error"),
+        )
+
+
+# Tạo instance mặc định của CompressionSettings
+compression_settings = CompressionSettings(
+    enabled=os.getenv("WS_DEFLATE_ENABLED", "true").lower() == "true",
+    server_max_window_bits=int(os.getenv("WS_DEFLATE_SERVER_MAX_WINDOW_BITS", "12")),
+    client_max_window_bits=int(os.getenv("WS_DEFLATE_CLIENT_MAX_WINDOW_BITS", "12")),
+    server_no_context_takeover=os.getenv("WS_DEFLATE_SERVER_NO_CONTEXT_TAKEOVER", "false").lower() == "true",
+    client_no_context_takeover=os.getenv("WS_DEFLATE_CLIENT_NO_CONTEXT_TAKEOVER", "false").lower() == "true",
+    min_size=int(os.getenv("WS_DEFLATE_MIN_SIZE", "64")),
+    compress_level=int(os.getenv("WS_DEFLATE_LEVEL", "-1")),
+    mem_level=int(os.getenv("WS_DEFLATE_MEM_LEVEL", "5"))
+)
+
+def get_compression_settings():
+    """
+    Lấy instance mặc định của CompressionSettings
+
+    Returns:
+        CompressionSettings instance
+    """
+    return compression_settings
@@ -0,0 +1,61 @@
+"""
+Cấu hình chung cho các test: CSDL tạm (qua migration khi app khởi động) và
+một TestClient dùng cho cả phiên test.
+
+Biến môi trường phải được đặt trước khi import main/database, nên được đặt
+ngay khi pytest nạp tệp này. Chạy từ thư mục gốc của dự án:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="chatapp-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.setdefault("JWT_SECRET_KEY", "chatapp-tests")
+sys.path.insert(0, ROOT)
+# Connection logs, chính sách log... được ghi vào thư mục tạm
+os.chdir(WORKDIR)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    return main.app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(client):
+    """Tạo người dùng mới, trả về (token, user_id)"""
+    import uuid
+
+    def make_user(name=None):
+        name = name or f"user_{uuid.uuid4().hex[:8]}"
+        client.post("/auth/register", json={"username": name, "full_name": name, "password": "pw"})
+        token = client.post("/auth/login", data={"username": name, "password": "pw"}).json()["access_token"]
+        user_id = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"}).json()["id"]
+        return token, user_id
+    return make_user
+
+
+@pytest.fixture
+def text_channel(client, make_user):
+    """Server mới của một người dùng mới, trả về (token, user_id, channel_id của text channel)"""
+    token, user_id = make_user()
+    server = client.post(
+        "/servers/create", json={"name": "s", "color": "red", "is_private": False},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()
+    channel_id = next(c["id"] for c in server["channels"] if c["channel_type"] == "text")
+    return token, user_id, channel_id
@@ -0,0 +1,92 @@
+"""
+Broker giữa các worker: BrokerServer chạy tiến trình riêng, mỗi worker là một
+tiến trình dùng SocketBroker (như khi chạy WORKERS > 1).
+"""
+import asyncio
+import json
+import subprocess
+import sys
+import textwrap
+
+from service.broker import SocketBroker
+
+from tests.test_connection_log_workers import ROOT, wait_for
+
+BROKER = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    from service.broker import run_broker_server
+    run_broker_server(sys.argv[2])
+""")
+
+# Một worker: đăng ký topic, chờ mọi worker sẵn sàng, phát một tin nhắn rồi
+# in ra các tin nhắn nhận được (kể cả của chính nó)
+WORKER = textwrap.dedent("""
+    import asyncio, json, os, sys, time
+    sys.path.insert(0, sys.argv[1])
+    from service.broker import SocketBroker
+
+    async def main(url, name, workers):
+        broker = SocketBroker(url)
+        received = []
+        broker.subscribe("text:1", received.append)
+        broker.subscribe(f"only:{name}", received.append)
+        await broker.start()
+        await asyncio.wait_for(broker._connected.wait(), 10)
+        open(f"ready.{name}", "w").close()
+        while not all(os.path.exists(f"ready.{worker}") for worker in workers):
+            await asyncio.sleep(0.01)
+        for i in range(3):
+            await broker.publish("text:1", f"{name}:{i}")
+        await broker.publish("nobody", "dropped")
+        deadline = time.monotonic() + 10
+        while len(received) < 3 * len(workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await broker.stop()
+        print(json.dumps(received))
+
+    asyncio.run(main(sys.argv[2], sys.argv[3], sys.argv[4].split(",")))
+""")
+
+
+def test_publish_reaches_every_worker(tmp_path):
+    url = f"unix://{tmp_path / 'broker.sock'}"
+    server = subprocess.Popen([sys.executable, "-c", BROKER, ROOT, url], cwd=tmp_path)
+    try:
+        wait_for([tmp_path / "broker.sock"])
+        names = ["a", "b"]
+        workers = [
+            subprocess.Popen([sys.executable, "-c", WORKER, ROOT, url, name, ",".join(names)],
+                             cwd=tmp_path, stdout=subprocess.PIPE, text=True)
+            for name in names
+        ]
+        results = [json.loads(worker.communicate(timeout=30)[0]) for worker in workers]
+    finally:
+        server.kill()
+        server.wait()
+    assert [worker.returncode for worker in workers] == [0, 0]
+    for received in results:
+        # Mọi worker nhận tin nhắn của mọi worker, mỗi nguồn đúng thứ tự đã phát
+        assert sorted(received) == sorted(f"{name}:{i}" for name in names for i in range(3))
+        for name in names:
+            assert [m for m in received if m.startswith(name)] == [f"{name}:{i}" for i in range(3)]
+    # Mọi worker thấy cùng thứ tự do broker server quyết định
+    assert results[0] == results[1]
+
+
+class ResetWriter:
+    """StreamWriter của kết nối vừa bị broker đóng"""
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        raise ConnectionResetError("Connection reset by peer")
+
+
+def test_publish_drops_message_when_connection_is_lost():
+    async def publish():
+        broker = SocketBroker("unix:///nonexistent/broker.sock")
+        broker._writer = ResetWriter()
+        await broker.publish("text:1", "hello")
+    # Không ném lỗi ra handler WebSocket đang gọi publish
+    asyncio.run(publish())
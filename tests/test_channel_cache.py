@@ -0,0 +1,135 @@
+"""
+ChannelCache: nạp chung một lần cho các yêu cầu đồng thời, cập nhật khi
+join/leave/đổi status, xóa mục cache khi nhận thông báo từ worker khác.
+"""
+import asyncio
+import json
+import time
+
+from service import channel_cache as channel_cache_module
+from service.broker import InProcessBroker
+from service.channel_cache import ChannelCache, ChannelInfo, MemberInfo
+
+
+class FakeChannelCache(ChannelCache):
+    """ChannelCache nạp channel từ dict thay vì DB, đếm số lần nạp"""
+    def __init__(self, channels, **kwargs):
+        super().__init__(session_factory=None, **kwargs)
+        # channel_id: [(user_id, status)]
+        self.source = channels
+        self.loads = 0
+
+    async def _load(self, channel_id):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        if channel_id not in self.source:
+            return None
+        members = {
+            user_id: MemberInfo(user_id, "member", self._user(user_id, f"u{user_id}", f"U {user_id}", status))
+            for user_id, status in self.source[channel_id]
+        }
+        return ChannelInfo(channel_id, f"c{channel_id}", "text", 1, members, time.monotonic() + self.ttl)
+
+
+def test_concurrent_gets_share_one_load():
+    cache = FakeChannelCache({1: [(10, "online")]})
+
+    async def run():
+        return await asyncio.gather(*(cache.get(1) for _ in range(5)))
+
+    channels = asyncio.run(run())
+    assert cache.loads == 1
+    assert all(channel is channels[0] for channel in channels)
+    assert asyncio.run(cache.get(2)) is None
+    assert cache.peek(2) is None
+
+
+def test_users_are_shared_between_channels_and_kept_on_reload():
+    cache = FakeChannelCache({1: [(10, "online"), (11, "online")], 2: [(10, "online")]})
+    first = asyncio.run(cache.get(1))
+    second = asyncio.run(cache.get(2))
+    assert first.members[10].user is second.members[10].user
+
+    # Nạp lại channel 1 (hết hạn): người dùng 10 vẫn là cùng một đối tượng,
+    # người dùng 11 không còn trong channel nào thì bị bỏ khỏi _users
+    cache.source[1] = [(10, "online")]
+    cache._channels[1].expires_at = 0
+    reloaded = asyncio.run(cache.get(1))
+    assert reloaded.members[10].user is second.members[10].user
+    assert 10 in cache._users and 11 not in cache._users
+    assert cache._channels_by_user[10] == {1, 2}
+
+    cache.update_user(10, "invisible")
+    assert reloaded.members[10].user.status == "invisible"
+    assert second.members[10].user.status == "invisible"
+
+
+def test_update_user_notifies_listeners():
+    cache = FakeChannelCache({})
+    updates = []
+    cache.add_user_listener(lambda user_id, status: updates.append((user_id, status)))
+    # Người dùng chưa có trong cache vẫn được báo (message_cache có thể đang giữ tin nhắn của họ)
+    cache.update_user(42, "offline")
+    assert updates == [(42, "offline")]
+
+
+def test_remove_member_and_invalidate_forget_users():
+    cache = FakeChannelCache({1: [(10, "online"), (11, "online")], 2: [(11, "online")]})
+    asyncio.run(cache.get(1))
+    asyncio.run(cache.get(2))
+
+    cache.remove_member(1, 10)
+    assert not cache.peek(1).is_member(10)
+    assert 10 not in cache._users and 10 not in cache._channels_by_user
+
+    cache.invalidate(1)
+    assert cache.peek(1) is None
+    # Người dùng 11 vẫn còn trong channel 2
+    assert cache._channels_by_user[11] == {2}
+    cache.invalidate(2)
+    assert cache._users == {} and cache._channels_by_user == {}
+
+    asyncio.run(cache.get(1))
+    assert cache.loads == 3
+
+
+def test_invalidation_from_other_worker(monkeypatch):
+    broker = InProcessBroker()
+    monkeypatch.setattr(channel_cache_module, "get_broker", lambda: broker)
+    source = {1: [(10, "online")]}
+    sender, receiver = FakeChannelCache(source), FakeChannelCache(source)
+    asyncio.run(sender.get(1))
+    asyncio.run(receiver.get(1))
+    receiver.subscribe()
+
+    # Worker gửi bỏ qua thông báo của chính nó
+    receiver._on_invalidation(json.dumps({"origin": receiver._origin, "channel_ids": [1]}))
+    assert receiver.peek(1) is not None
+
+    asyncio.run(sender.publish([1], user_id=10, status="invisible"))
+    assert receiver.peek(1) is None
+    assert sender.peek(1) is not None
+    asyncio.run(receiver.get(1))
+    receiver._on_invalidation(json.dumps({"origin": sender._origin, "channel_ids": [], "user": [10, "offline"]}))
+    assert receiver.peek(1).members[10].user.status == "offline"
+
+
+def test_join_leave_and_status_update_cached_members(client, make_user, text_channel):
+    token, _, channel_id = text_channel
+    other_token, other_id = make_user()
+    headers = {"Authorization": f"Bearer {token}"}
+    other_headers = {"Authorization": f"Bearer {other_token}"}
+
+    def member_statuses():
+        members = client.get(f"/channels/{channel_id}/members", headers=headers).json()
+        return {member["user"]["id"]: member["user"]["status"] for member in members}
+
+    assert member_statuses() == {}
+    assert client.post("/channels/join", json={"channel_id": channel_id}, headers=other_headers).status_code == 200
+    assert other_id in member_statuses()
+
+    assert client.put("/auth/status", json={"status": "invisible"}, headers=other_headers).status_code == 200
+    assert member_statuses()[other_id] == "invisible"
+
+    assert client.post("/channels/leave", json={"channel_id": channel_id}, headers=other_headers).status_code == 204
+    assert other_id not in member_statuses()
@@ -0,0 +1,121 @@
+"""
+Connection logs khi chạy nhiều worker: mỗi tiến trình ghi một tệp riêng (slot),
+truy vấn và thống kê ở bất kỳ worker nào cũng thấy bản ghi của mọi worker.
+"""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+from service.connection_logger import ConnectionLogger, known_slots
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDS = 120
+
+# Một worker (instance mặc định, như worker uvicorn): ghi RECORDS bản ghi (xoay vòng
+# nhiều lần), báo sẵn sàng rồi giữ slot đến khi có tệp done
+WORKER = textwrap.dedent("""
+    import os, sys, time
+    sys.path.insert(0, sys.argv[1])
+    from service.connection_logger import get_connection_logger
+    logger = get_connection_logger()
+    logger.max_records = 50
+    logger.index_checkpoint_records = 10
+    for i in range(int(sys.argv[2])):
+        logger.log_connection("text_channel", 1, i, 1, "connect", {"worker": os.getpid(), "i": i})
+        time.sleep(0.001)
+    logger.flush()
+    # Chờ nén xong các segment đã xoay vòng
+    logger.segments.close()
+    open(f"ready.{logger.slot}", "w").close()
+    deadline = time.monotonic() + 30
+    while not os.path.exists("done") and time.monotonic() < deadline:
+        time.sleep(0.05)
+    logger.close()
+""")
+
+
+def wait_for(paths, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not all(os.path.exists(path) for path in paths):
+        assert time.monotonic() < deadline, f"Timed out waiting for {paths}"
+        time.sleep(0.05)
+
+
+def test_workers_write_separate_files_and_queries_merge(tmp_path):
+    workers = [
+        subprocess.Popen([sys.executable, "-c", WORKER, ROOT, str(RECORDS)], cwd=tmp_path)
+        for _ in range(2)
+    ]
+    try:
+        wait_for([tmp_path / "ready.0", tmp_path / "ready.1"])
+        reader = ConnectionLogger(str(tmp_path / "logs" / "connections.log"), worker_slots=True)
+        assert reader.slot == 2
+        assert known_slots(reader.base_log_file) == [0, 1, 2]
+        assert (tmp_path / "logs" / "connections.log").exists()
+        assert (tmp_path / "logs" / "connections.1.log").exists()
+
+        logs = reader.get_connection_logs(limit=10 * RECORDS)
+        assert len(logs) == 2 * RECORDS
+        # Mỗi bản ghi đọc đúng dòng của nó (offset của chỉ mục khớp tệp của worker đó)
+        by_worker = {}
+        for entry in logs:
+            by_worker.setdefault(entry["metadata"]["worker"], []).append(entry["metadata"]["i"])
+        assert sorted(by_worker) == sorted(worker.pid for worker in workers)
+        assert all(indexes == list(range(RECORDS)) for indexes in by_worker.values())
+        timestamps = [entry["timestamp"] for entry in logs]
+        assert timestamps == sorted(timestamps)
+
+        # Phân trang trên kết quả đã trộn
+        pages = []
+        for offset in range(0, 2 * RECORDS, 37):
+            pages.extend(reader.get_connection_logs(limit=37, offset=offset))
+        assert pages == logs
+        assert len(reader.get_connection_logs(filters={"user_id": 7})) == 2
+
+        assert reader.count() == 2 * RECORDS
+        stats = reader.get_stats()
+        assert stats["total_records"] == 2 * RECORDS
+        assert stats["event_types"] == {"connect": 2 * RECORDS}
+        reader.close()
+    finally:
+        (tmp_path / "done").touch()
+        for worker in workers:
+            worker.wait(30)
+    assert [worker.returncode for worker in workers] == [0, 0]
+
+
+def test_slot_is_reused_after_worker_exits(tmp_path):
+    log_file = str(tmp_path / "connections.log")
+    first = ConnectionLogger(log_file, worker_slots=True)
+    second = ConnectionLogger(log_file, worker_slots=True)
+    assert (first.slot, second.slot) == (0, 1)
+    assert second.log_file == str(tmp_path / "connections.1.log")
+    # Khóa được nhả (như khi tiến trình kết thúc): worker mới nhận lại slot 1
+    second._slot_lock.close()
+    third = ConnectionLogger(log_file, worker_slots=True)
+    assert third.slot == 1
+
+
+def test_clear_reaches_other_workers(tmp_path):
+    log_file = str(tmp_path / "connections.log")
+    first = ConnectionLogger(log_file, worker_slots=True)
+    second = ConnectionLogger(log_file, worker_slots=True)
+    for logger in (first, second):
+        logger.log_connection("text_channel", 1, logger.slot, 1, "connect")
+        logger.flush()
+    assert first.count() == 2
+    assert len(second.get_connection_logs()) == 2
+
+    first.clear()
+    assert first.count() == 1
+    # Yêu cầu xóa phát qua broker (publish_clear); worker gửi bỏ qua yêu cầu của chính nó
+    first._on_clear(json.dumps({"origin": first._origin}))
+    second._on_clear(json.dumps({"origin": first._origin}))
+    deadline = time.monotonic() + 5
+    while second.count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert first.count() == 0
+    assert first.get_connection_logs() == []
@@ -0,0 +1,169 @@
+"""
+ConnectionLogger: ghi theo lô ở luồng nền, chỉ mục, thống kê, segment và
+chính sách ghi (sample/aggregate).
+"""
+import json
+import time
+from datetime import datetime, timedelta
+
+from service.connection_logger import ConnectionLogger
+from service.log_policy import LogPolicy, make_rule, parse_rules
+
+
+def read_lines(log_file):
+    with open(log_file) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_aggregate_summary_is_stamped_with_window_end(tmp_path):
+    policy = LogPolicy(str(tmp_path / "policy.json"))
+    policy.set_rules([make_rule("signaling", "*", "aggregate", interval_seconds=0.05)])
+    policy.decide("signaling", "offer", 1, 1, 7)
+    policy.decide("signaling", "offer", 1, 1, 8)
+    started_at = datetime.fromisoformat(policy._windows[("signaling", "offer", 1, 1)][3].isoformat())
+    time.sleep(0.1)
+    [summary] = policy.collect()
+    assert summary["timestamp"] == (started_at + timedelta(seconds=0.05)).isoformat()
+    assert summary["metadata"]["count"] == 2 and summary["metadata"]["users"] == 2
+
+    # Không sớm hơn bản ghi mới nhất đã ghi
+    policy.decide("signaling", "offer", 1, 1, 7)
+    time.sleep(0.1)
+    later = datetime.now().isoformat()
+    [summary] = policy.collect(not_before=later)
+    assert summary["timestamp"] == later
+
+
+def test_aggregate_summaries_keep_log_in_time_order(tmp_path):
+    logger = ConnectionLogger(
+        str(tmp_path / "connections.log"), batch_size=5,
+        policy_rules=parse_rules("signaling:*=aggregate:0.01")
+    )
+    for i in range(200):
+        logger.log_connection("signaling", 1, i, 1, "ice_candidate")
+        logger.log_connection("text_channel", 1, i, 1, "connect")
+        if i % 20 == 0:
+            time.sleep(0.02)
+    logger.close()
+
+    entries = read_lines(logger.log_file)
+    timestamps = [entry["timestamp"] for entry in entries]
+    assert timestamps == sorted(timestamps)
+    summaries = [entry for entry in entries if entry["metadata"].get("aggregated")]
+    assert sum(entry["metadata"]["count"] for entry in summaries) == 200
+
+    # Tìm theo khoảng thời gian (bisect trên chỉ mục) khớp với lọc tuần tự
+    reader = ConnectionLogger(str(tmp_path / "connections.log"))
+    since, until = timestamps[len(timestamps) // 3], timestamps[2 * len(timestamps) // 3]
+    expected = [entry for entry in entries if since <= entry["timestamp"] <= until]
+    assert reader.get_connection_logs(limit=len(entries), since=since, until=until) == expected
+    reader.close()
+
+
+def write_records(logger, count, start=0):
+    for i in range(start, start + count):
+        logger.log_connection(
+            "text_channel" if i % 2 else "signaling", 1, i % 5, i % 3,
+            "connect" if i % 4 else "disconnect", {"i": i}
+        )
+
+
+def test_index_round_trip_with_unindexed_tail(tmp_path):
+    log_file = str(tmp_path / "connections.log")
+    logger = ConnectionLogger(log_file, index_checkpoint_records=10)
+    write_records(logger, 25)
+    logger.close()
+    entries = read_lines(log_file)
+    assert [entry["metadata"]["i"] for entry in entries] == list(range(25))
+
+    # Checkpoint chỉ mục mới có 20 bản ghi: 5 bản ghi cuối được quét lại khi nạp
+    reader = ConnectionLogger(log_file)
+    assert len(reader.index) == 25
+    assert reader.get_connection_logs(limit=100) == entries
+    assert reader.get_connection_logs(limit=7, offset=10) == entries[10:17]
+    filters = {"host_type": "signaling", "channel_id": 1}
+    expected = [entry for entry in entries if entry["host_type"] == "signaling" and entry["channel_id"] == 1]
+    assert reader.get_connection_logs(limit=100, filters=filters) == expected
+    assert reader.get_connection_logs(filters={"user_id": 99}) == []
+    reader.close()
+
+
+def test_stats_round_trip(tmp_path):
+    log_file = str(tmp_path / "connections.log")
+    logger = ConnectionLogger(log_file, stats_checkpoint_interval=0)
+    write_records(logger, 20)
+    logger.flush()
+    stats = logger.get_stats()
+    assert stats == {
+        "total_records": 20,
+        "host_types": {"signaling": 10, "text_channel": 10},
+        "event_types": {"connect": 15, "disconnect": 5}
+    }
+    logger.close()
+
+    # Checkpoint cộng các bản ghi ghi sau checkpoint (ghi thẳng vào tệp)
+    entry = {"timestamp": read_lines(log_file)[-1]["timestamp"], "host_type": "message", "host_id": 1,
+             "user_id": 1, "channel_id": 1, "event_type": "send_message", "metadata": {}}
+    with open(log_file, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    reader = ConnectionLogger(log_file)
+    stats = reader.get_stats()
+    assert stats["total_records"] == 21 and stats["host_types"]["message"] == 1
+    assert reader.count() == 21
+    # Khoảng thời gian chứa mọi bản ghi cho cùng kết quả
+    assert reader.get_stats(since=read_lines(log_file)[0]["timestamp"], until=entry["timestamp"]) == stats
+    reader.close()
+
+
+def test_rotated_segments_are_compressed_and_queried(tmp_path):
+    log_file = str(tmp_path / "connections.log")
+    logger = ConnectionLogger(log_file, max_records=10, batch_size=3)
+    write_records(logger, 35)
+    logger.close()
+    segments = logger.segments.paths()
+    assert len(segments) == 3 and all(path.endswith(".gz") for path in segments)
+
+    reader = ConnectionLogger(log_file, max_records=10)
+    logs = reader.get_connection_logs(limit=100)
+    assert [entry["metadata"]["i"] for entry in logs] == list(range(35))
+    assert reader.get_connection_logs(limit=4, offset=8) == logs[8:12]
+    assert reader.count() == 35
+    reader.close()
+
+
+def test_retention_removes_oldest_segments_and_their_stats(tmp_path):
+    log_file = str(tmp_path / "connections.log")
+    logger = ConnectionLogger(log_file, max_records=10, batch_size=3, retention_bytes=1, compress_segments=False)
+    write_records(logger, 35)
+    logger.close()
+    assert logger.segments.paths() == []
+
+    logs = logger.get_connection_logs(limit=100)
+    assert [entry["metadata"]["i"] for entry in logs] == list(range(30, 35))
+    assert logger.count() == 5
+    assert logger.get_stats()["total_records"] == 5
+
+
+def test_sampled_and_aggregated_records_are_weighted_in_stats(tmp_path):
+    logger = ConnectionLogger(
+        str(tmp_path / "connections.log"),
+        policy_rules=parse_rules("message:send_message=sample:0.25,signaling:*=aggregate:3600")
+    )
+    for i in range(400):
+        logger.log_connection("message", 1, i, 1, "send_message")
+    for i in range(30):
+        logger.log_connection("signaling", 1, i, 1, "ice_candidate")
+    logger.close()
+
+    entries = read_lines(logger.log_file)
+    sampled = [entry for entry in entries if entry["host_type"] == "message"]
+    assert 0 < len(sampled) < 400
+    assert all(entry["metadata"]["sample_rate"] == 0.25 for entry in sampled)
+    [summary] = [entry for entry in entries if entry["host_type"] == "signaling"]
+    assert summary["metadata"]["count"] == 30 and summary["metadata"]["users"] == 30
+
+    # Thống kê đếm số sự kiện ước lượng, count() đếm bản ghi thực có
+    stats = logger.get_stats()
+    assert stats["host_types"] == {"message": 4 * len(sampled), "signaling": 30}
+    assert stats["total_records"] == 4 * len(sampled) + 30
+    assert logger.count() == len(sampled) + 1
@@ -0,0 +1,90 @@
+"""
+ChannelFanout: mỗi kết nối có hàng đợi gửi riêng, client nhận chậm bị loại
+(close 4008) mà không làm chậm các kết nối khác.
+"""
+import asyncio
+
+from service.fanout import SLOW_CONSUMER_CLOSE_CODE, ChannelFanout
+from service.wire_codec import COMPACT_CODEC, DEFAULT_CODEC
+
+
+class FakeWebSocket:
+    """WebSocket có thể bị "treo" (client không đọc)"""
+    def __init__(self, stalled=False):
+        self.sent = []
+        self.closed_with = None
+        self.unblocked = asyncio.Event()
+        if not stalled:
+            self.unblocked.set()
+
+    async def send_text(self, text):
+        await self.unblocked.wait()
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        await self.unblocked.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = (code, reason)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_slow_consumer_is_evicted_when_queue_is_full():
+    async def scenario():
+        fanout = ChannelFanout(max_queue=3, max_lag=60)
+        fast, slow = FakeWebSocket(), FakeWebSocket(stalled=True)
+        fanout.add(1, "fast", fast)
+        connection = fanout.add(1, "slow", slow)
+        delivered = []
+        for i in range(6):
+            delivered.append(fanout.broadcast(1, {"i": i}))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        return fanout, fast, slow, connection, delivered
+
+    fanout, fast, slow, connection, delivered = run(scenario())
+    # Frame đầu đang gửi dở, 3 frame chờ trong hàng đợi, frame tiếp theo làm tràn
+    assert delivered == [2, 2, 2, 2, 1, 1]
+    assert connection.closed
+    assert slow.closed_with == (SLOW_CONSUMER_CLOSE_CODE, "Slow consumer")
+    assert list(fanout.channels[1]) == ["fast"]
+    assert fast.sent == [f'{{"i":{i}}}' for i in range(6)]
+
+
+def test_slow_consumer_is_evicted_when_lagging():
+    async def scenario():
+        fanout = ChannelFanout(max_queue=100, max_lag=0.02)
+        slow = FakeWebSocket(stalled=True)
+        connection = fanout.add(1, "slow", slow)
+        assert connection.send_json({"i": 0})
+        await asyncio.sleep(0.05)
+        assert connection.lag >= 0.02
+        sent = connection.send_json({"i": 1})
+        await asyncio.sleep(0)
+        return fanout, slow, sent
+
+    fanout, slow, sent = run(scenario())
+    assert sent is False
+    assert slow.closed_with[0] == SLOW_CONSUMER_CLOSE_CODE
+    assert 1 not in fanout.channels
+
+
+def test_broadcast_transcodes_once_per_codec():
+    async def scenario():
+        fanout = ChannelFanout()
+        sockets = [FakeWebSocket() for _ in range(4)]
+        for i, websocket in enumerate(sockets):
+            fanout.add(1, i, websocket, codec=COMPACT_CODEC if i % 2 else DEFAULT_CODEC)
+        assert fanout.broadcast_text(1, '{"content":"hi"}', exclude=3) == 3
+        await asyncio.sleep(0.01)
+        return sockets
+
+    sockets = run(scenario())
+    assert sockets[0].sent == sockets[2].sent == ['{"content":"hi"}']
+    assert sockets[1].sent == [COMPACT_CODEC.encode({"content": "hi"})]
+    assert sockets[3].sent == []
+
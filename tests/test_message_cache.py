@@ -0,0 +1,209 @@
+"""
+MessageCache: trang lấy từ ring khớp với DB, ring được bổ sung từ broadcast
+và bị xóa khi untrack, khi có tin nhắn optimistic (chưa có ID) hoặc khi vượt
+giới hạn bộ nhớ.
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from service import message_cache as message_cache_module
+from service.fast_json import user_json
+from service.message_cache import MessageCache, MessageRing, get_message_cache
+
+CHANNEL_ID = 1
+
+
+def make_message(message_id, sender_id=10, status="online"):
+    return {
+        "id": message_id,
+        "content": f"message {message_id}",
+        "created_at": "2026-01-01T00:00:00",
+        "sender": user_json(sender_id, f"u{sender_id}", f"U {sender_id}", status)
+    }
+
+
+class FakeDB:
+    """Tin nhắn của các channel trong bộ nhớ, đếm số truy vấn"""
+    def __init__(self):
+        self.messages = {}
+        self.queries = 0
+
+    def add(self, channel_id, message):
+        self.messages.setdefault(channel_id, []).append(message)
+        return message
+
+    def query_page(self, channel_id, before_id=None, after_id=None, limit=50):
+        """Cùng ngữ nghĩa với query_page trên DB"""
+        self.queries += 1
+        messages = self.messages.get(channel_id, [])
+        if after_id is not None:
+            rows = [message for message in messages if message["id"] > after_id][:limit + 1]
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            return [dict(row) for row in rows], rows[-1]["id"] if has_more else None
+        rows = [message for message in messages if before_id is None or message["id"] < before_id][-(limit + 1):]
+        has_more = len(rows) > limit
+        rows = rows[-limit:] if has_more else rows
+        return [dict(row) for row in rows], rows[0]["id"] if has_more else None
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB()
+
+    async def query_page(session, channel_id, before_id=None, after_id=None, limit=50):
+        return db.query_page(channel_id, before_id, after_id, limit)
+
+    monkeypatch.setattr(message_cache_module, "query_page", query_page)
+    return db
+
+
+def make_cache(**kwargs):
+    @asynccontextmanager
+    async def session_factory():
+        yield None
+    cache = MessageCache(session_factory=session_factory, **kwargs)
+    cache.track(CHANNEL_ID)
+    return cache
+
+
+def broadcast(cache, db, message):
+    cache.on_broadcast(CHANNEL_ID, json.dumps(db.add(CHANNEL_ID, message)))
+
+
+def test_ring_pages_match_db(db):
+    for message_id in range(1, 31):
+        db.add(CHANNEL_ID, make_message(message_id))
+    cache = make_cache(capacity=20)
+    assert asyncio.run(cache.page(CHANNEL_ID, limit=5)) == db.query_page(CHANNEL_ID, limit=5)
+    assert cache._rings[CHANNEL_ID].floor == 11
+    assert cache.misses == 1
+
+    for message_id in range(31, 36):
+        broadcast(cache, db, make_message(message_id))
+    # Ring giữ capacity tin nhắn mới nhất
+    assert cache._rings[CHANNEL_ID].ids == list(range(16, 36))
+
+    queries = db.queries
+    for before_id, after_id, limit in [
+        (None, None, 5), (20, None, 4), (None, 16, 10), (None, 30, 10), (None, 15, 3), (None, 34, 5),
+    ]:
+        expected = db.query_page(CHANNEL_ID, before_id, after_id, limit)
+        assert asyncio.run(cache.page(CHANNEL_ID, before_id, after_id, limit)) == expected
+    # Chỉ các trang trong ring không truy vấn DB
+    db.queries = queries
+    asyncio.run(cache.page(CHANNEL_ID, limit=10))
+    asyncio.run(cache.page(CHANNEL_ID, after_id=20, limit=10))
+    assert db.queries == queries
+    asyncio.run(cache.page(CHANNEL_ID, before_id=18, limit=10))
+    asyncio.run(cache.page(CHANNEL_ID, after_id=5, limit=10))
+    assert db.queries == queries + 2
+
+
+def test_ring_page_outside_floor():
+    ring = MessageRing(floor=5, expires_at=float("inf"))
+    ring.ids = [5, 6, 7]
+    ring.messages = [make_message(message_id) for message_id in ring.ids]
+    assert ring.page(limit=2) == (ring.messages[1:], 6)
+    # Trang cần tin nhắn cũ hơn floor: phải truy vấn DB
+    assert ring.page(limit=3) is None
+    assert ring.page(after_id=3, limit=10) is None
+    assert ring.page(after_id=4, limit=2) == (ring.messages[:2], 6)
+
+    # floor = 0: ring chứa toàn bộ lịch sử của channel
+    ring.floor = 0
+    assert ring.page(limit=10) == (ring.messages, None)
+    assert ring.page(before_id=5, limit=10) == ([], None)
+
+
+def test_untrack_and_invalidate_drop_ring(db):
+    db.add(CHANNEL_ID, make_message(1))
+    cache = make_cache()
+    asyncio.run(cache.page(CHANNEL_ID))
+    assert cache.stats()["channels"] == 1
+    assert cache.size > 0 and 10 in cache._senders
+
+    cache.invalidate(CHANNEL_ID)
+    assert cache.stats()["channels"] == 0
+    assert cache.size == 0 and cache._senders == {}
+
+    asyncio.run(cache.page(CHANNEL_ID))
+    cache.untrack(CHANNEL_ID)
+    assert cache._rings == {}
+    # Không còn nhận broadcast: không nạp lại ring
+    asyncio.run(cache.page(CHANNEL_ID))
+    assert cache._rings == {}
+
+
+def test_optimistic_message_bypasses_cache(db):
+    db.add(CHANNEL_ID, make_message(1))
+    cache = make_cache()
+    asyncio.run(cache.page(CHANNEL_ID))
+
+    optimistic = make_message(None)
+    cache.on_broadcast(CHANNEL_ID, json.dumps(optimistic))
+    assert cache._rings == {}
+    queries = db.queries
+    asyncio.run(cache.page(CHANNEL_ID))
+    asyncio.run(cache.page(CHANNEL_ID))
+    assert cache._rings == {}
+    assert db.queries == queries + 2
+
+    # Hết thời gian bỏ qua: ring được nạp lại
+    cache._bypass[CHANNEL_ID] = 0
+    asyncio.run(cache.page(CHANNEL_ID))
+    assert CHANNEL_ID in cache._rings
+
+
+def test_update_user_changes_cached_senders(db):
+    db.add(CHANNEL_ID, make_message(1, sender_id=10))
+    db.add(CHANNEL_ID, make_message(2, sender_id=11))
+    cache = make_cache()
+    asyncio.run(cache.page(CHANNEL_ID))
+    broadcast(cache, db, make_message(3, sender_id=10))
+
+    cache.update_user(10, "invisible")
+    messages, _ = asyncio.run(cache.page(CHANNEL_ID))
+    assert [message["sender"]["status"] for message in messages] == ["invisible", "online", "invisible"]
+    # Người gửi dùng chung một dict giữa các tin nhắn
+    assert messages[0]["sender"] is messages[2]["sender"]
+
+
+def test_memory_limit_evicts_least_recently_used(db):
+    for channel_id in (1, 2):
+        db.add(channel_id, make_message(channel_id))
+    cache = make_cache()
+    cache.track(2)
+    asyncio.run(cache.page(1))
+    asyncio.run(cache.page(2))
+    cache.max_bytes = cache.size - 1
+    cache._evict()
+    assert list(cache._rings) == [2]
+    assert cache.size == cache._rings[2].size
+
+
+def test_rest_history_follows_websocket_messages(client, text_channel):
+    token, _, channel_id = text_channel
+    cache = get_message_cache()
+
+    def history():
+        return [message["content"] for message in client.get(f"/channels/{channel_id}/messages").json()["messages"]]
+
+    with client.websocket_connect(f"/ws/{channel_id}?token={token}") as ws:
+        for i in range(3):
+            ws.send_json({"content": f"hello {i}"})
+            # Bỏ qua khung presence cho tới khi nhận lại tin nhắn vừa gửi
+            while "content" not in ws.receive_json():
+                pass
+            assert history() == [f"hello {n}" for n in range(i + 1)]
+        assert channel_id in cache._rings
+    # Đóng kết nối cuối cùng: untrack xóa ring
+    deadline = time.monotonic() + 5
+    while channel_id in cache._rings and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert channel_id not in cache._rings
+    assert history() == ["hello 0", "hello 1", "hello 2"]
@@ -0,0 +1,88 @@
+"""
+MessagePersister: ghi tin nhắn theo lô (group commit), lô lỗi được ghi lại
+từng tin nhắn để chỉ tin nhắn lỗi thất bại.
+"""
+import asyncio
+
+import pytest
+
+from service.message_persister import MessagePersister
+
+
+class FakeSession:
+    """Session ghi nhận các lô; lô có tin nhắn "bad" lỗi khi flush"""
+    def __init__(self, store):
+        self.store = store
+        self.pending = []
+
+    def add_all(self, messages):
+        self.pending.extend(messages)
+
+    def flush(self):
+        self.store["attempts"].append([message.content for message in self.pending])
+        if any(message.content == "bad" for message in self.pending):
+            raise ValueError("constraint failed")
+        for message in self.pending:
+            self.store["next_id"] += 1
+            message.id = self.store["next_id"]
+
+    def commit(self):
+        self.store["committed"].extend(message.content for message in self.pending)
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def store():
+    return {"attempts": [], "committed": [], "next_id": 0}
+
+
+def submit_all(persister, contents):
+    async def scenario():
+        futures = [persister.submit(content, 1, 1) for content in contents]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await persister.stop()
+        return results
+    return asyncio.run(scenario())
+
+
+def test_messages_are_committed_in_one_batch(store):
+    persister = MessagePersister(session_factory=lambda: FakeSession(store), max_batch=10, max_delay=0.05)
+    assert submit_all(persister, [f"m{i}" for i in range(5)]) == [1, 2, 3, 4, 5]
+    assert store["attempts"] == [[f"m{i}" for i in range(5)]]
+
+
+def test_batches_are_limited_to_max_batch(store):
+    persister = MessagePersister(session_factory=lambda: FakeSession(store), max_batch=2, max_delay=0.05)
+    assert submit_all(persister, ["a", "b", "c"]) == [1, 2, 3]
+    assert store["attempts"] == [["a", "b"], ["c"]]
+
+
+def test_failed_batch_is_retried_one_by_one(store):
+    persister = MessagePersister(session_factory=lambda: FakeSession(store), max_batch=10, max_delay=0.05)
+    results = submit_all(persister, ["a", "bad", "c"])
+    assert results[0] == 1 and results[2] == 2
+    assert isinstance(results[1], ValueError)
+    assert store["attempts"] == [["a", "bad", "c"], ["a"], ["bad"], ["c"]]
+    assert store["committed"] == ["a", "c"]
+
+
+def test_stop_commits_pending_messages(store):
+    persister = MessagePersister(session_factory=lambda: FakeSession(store), max_batch=10, max_delay=0.2)
+
+    async def scenario():
+        future = persister.submit("late", 1, 1)
+        await persister.stop()
+        return future.result()
+
+    assert asyncio.run(scenario()) == 1
+    assert store["committed"] == ["late"]
+
+
+def test_invalid_broadcast_mode():
+    with pytest.raises(ValueError):
+        MessagePersister(broadcast_mode="eventually")
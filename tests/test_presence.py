@@ -0,0 +1,122 @@
+"""
+PresenceTracker: trạng thái theo kết nối, ghi theo lô khi flush và giữ status
+người dùng tự chọn.
+"""
+import asyncio
+import json
+
+import pytest
+
+from service import presence
+from service.broker import InProcessBroker
+from service.presence import INVISIBLE, OFFLINE, ONLINE, PRESENCE_TOPIC, PresenceTracker
+
+
+class FakeSession:
+    def __init__(self, writes):
+        self.writes = writes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        self.writes.append({row["id"]: row["status"] for row in rows})
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    # Không phát thông báo tới tracker của ứng dụng
+    broker = InProcessBroker()
+    monkeypatch.setattr(presence, "get_broker", lambda: broker)
+    return broker
+
+
+@pytest.fixture
+def tracker(broker):
+    writes = []
+    tracker = PresenceTracker(session_factory=lambda: FakeSession(writes))
+    tracker.writes = writes
+    tracker.notified = []
+    tracker.add_listener(tracker.notified.append)
+    return tracker
+
+
+def flush(tracker):
+    return asyncio.run(tracker.flush())
+
+
+def test_connect_and_disconnect_are_flushed_in_one_batch(tracker):
+    tracker.connect(1, OFFLINE)
+    tracker.connect(2, OFFLINE)
+    tracker.connect(2, OFFLINE)
+    assert flush(tracker) == {1: ONLINE, 2: ONLINE}
+    assert tracker.writes == [{1: ONLINE, 2: ONLINE}]
+
+    tracker.disconnect(1)
+    tracker.disconnect(2)
+    # user 2 vẫn còn một kết nối
+    assert flush(tracker) == {1: OFFLINE}
+    assert flush(tracker) == {}
+    assert tracker.notified == [{1: ONLINE, 2: ONLINE}, {1: OFFLINE}]
+
+
+def test_reconnect_within_one_interval_is_not_written(tracker):
+    tracker.connect(1)
+    flush(tracker)
+    tracker.disconnect(1)
+    tracker.connect(1)
+    assert flush(tracker) == {}
+    assert tracker.writes == [{1: ONLINE}]
+
+
+def test_explicit_offline_survives_live_connection(tracker):
+    tracker.connect(1, ONLINE)
+    flush(tracker)
+    tracker.set_preference(1, OFFLINE)
+    assert flush(tracker) == {1: OFFLINE}
+    tracker.heartbeat(1)
+    assert flush(tracker) == {}
+    assert tracker.status(1) == OFFLINE
+    # Chọn lại "online": trạng thái theo kết nối
+    tracker.set_preference(1, ONLINE)
+    assert flush(tracker) == {1: ONLINE}
+
+
+def test_invisible_from_database_is_kept_on_connect(tracker):
+    tracker.connect(1, INVISIBLE)
+    assert flush(tracker) == {1: INVISIBLE}
+    tracker.disconnect(1)
+    assert flush(tracker) == {}
+    tracker.connect(1, OFFLINE)
+    assert tracker.status(1) == INVISIBLE
+
+
+def test_rest_only_login_is_not_written_offline(tracker):
+    # /auth/login ghi "online" nhưng người dùng không mở WebSocket
+    tracker.set_preference(1, ONLINE)
+    assert flush(tracker) == {}
+    assert tracker.writes == []
+
+
+def test_user_stays_online_while_connected_to_another_worker(tracker, broker):
+    tracker.connect(1)
+    flush(tracker)
+    broker.subscribe(PRESENCE_TOPIC, tracker._on_announcement)
+    broker._dispatch(PRESENCE_TOPIC, json.dumps({"origin": "other", "users": [1], "ttl": 60}))
+    tracker.disconnect(1)
+    assert flush(tracker) == {}
+    broker._dispatch(PRESENCE_TOPIC, json.dumps({"origin": "other", "users": [], "ttl": 60}))
+    assert flush(tracker) == {1: OFFLINE}
+
+
+def test_preference_from_another_worker(tracker):
+    tracker.connect(1)
+    flush(tracker)
+    tracker._on_announcement(json.dumps({"origin": "other", "preference": [1, INVISIBLE]}))
+    assert flush(tracker) == {1: INVISIBLE}
@@ -0,0 +1,137 @@
+"""
+Kiểm tra kế hoạch truy vấn (EXPLAIN QUERY PLAN) của mọi truy vấn mà các router gửi tới SQLite.
+
+Test gọi lần lượt các endpoint REST và WebSocket, ghi lại mọi câu lệnh SQL
+được thực thi rồi chạy EXPLAIN QUERY PLAN trên từng câu lệnh. Thất bại nếu có
+truy vấn quét toàn bảng (SCAN <bảng>) hoặc phải dựng index tạm
+(AUTOMATIC INDEX), trừ các trường hợp được liệt kê trong ALLOWED_SCANS.
+Chạy riêng (in kế hoạch của từng câu lệnh):
+    python3 -m pytest tests/test_query_plans.py -s
+"""
+import re
+
+import pytest
+from sqlalchemy import event
+
+from database import engine, async_engine, read_async_engine
+
+# (endpoint, bảng) được phép quét toàn bảng, kèm lý do
+ALLOWED_SCANS = {}
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+AUTOMATIC_INDEX = re.compile(r"USING AUTOMATIC (?:COVERING |PARTIAL )?INDEX")
+
+
+class Recorder:
+    """TestClient ghi nhận endpoint đang gọi cho các câu lệnh SQL"""
+    def __init__(self, client):
+        self.client = client
+        self.endpoint = "setup"
+        # (endpoint, câu lệnh) -> tham số của lần thực thi đầu tiên
+        self.statements = {}
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            return
+        self.statements.setdefault((self.endpoint, statement), parameters)
+
+    def request(self, method, path, label=None, **kwargs):
+        self.endpoint = label or f"{method} {path.split('?')[0]}"
+        response = self.client.request(method, path, **kwargs)
+        assert response.status_code < 400, f"{self.endpoint} failed: {response.status_code} {response.text}"
+        return response
+
+    def websocket(self, path, label):
+        self.endpoint = label
+        return self.client.websocket_connect(path)
+
+
+@pytest.fixture
+def recorder(client):
+    recorder = Recorder(client)
+    targets = (engine, async_engine.sync_engine, read_async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", recorder.record)
+    yield recorder
+    for target in targets:
+        event.remove(target, "before_cursor_execute", recorder.record)
+
+
+def exercise(client: Recorder):
+    """Gọi mọi endpoint có truy vấn CSDL"""
+    tokens = []
+    for name in ("alice", "bob"):
+        client.request("POST", "/auth/register", json={"username": name, "full_name": name, "password": "pw"})
+        token = client.request("POST", "/auth/login", data={"username": name, "password": "pw"}).json()["access_token"]
+        tokens.append({"Authorization": f"Bearer {token}"})
+    alice, bob = tokens
+
+    server = client.request("POST", "/servers/create", json={"name": "s", "color": "red", "is_private": False}, headers=alice).json()
+    channel_id = next(c["id"] for c in server["channels"] if c["channel_type"] == "text")
+    created = client.request("POST", "/channels/create", json={"name": "extra", "server_id": server["id"], "channel_type": "text"}, headers=alice).json()
+    client.request("POST", "/channels/join", json={"channel_id": created["id"]}, headers=bob)
+    bob_id = client.request("GET", "/auth/me", headers=bob).json()["id"]
+    provisioned = client.request("POST", "/servers/provision", json={
+        "name": "team", "color": "blue", "is_private": True,
+        "channels": [{"name": "general", "channel_type": "text"}, {"name": "ops", "channel_type": "text", "members": []}],
+        "members": [{"user_id": bob_id}]
+    }, headers=alice).json()
+    client.request("POST", "/channels/leave", json={"channel_id": created["id"]}, headers=bob)
+    client.request("POST", f"/servers/{provisioned['id']}/members", label="POST /servers/{server_id}/members",
+                   json={"user_ids": [bob_id]}, headers=alice)
+
+    client.request("GET", "/auth/me", headers=alice)
+    client.request("PUT", "/auth/status", json={"status": "invisible"}, headers=alice)
+    client.request("POST", "/auth/login-guest", json={"username": "guest"})
+
+    token = alice["Authorization"].split()[1]
+    with client.websocket(f"/ws/{channel_id}?token={token}", "WS /ws/{channel_id}") as ws:
+        for i in range(3):
+            ws.send_json({"content": f"message {i}"})
+            ws.receive_json()
+    with client.websocket(f"/ws/{channel_id}/signaling?peer_id=p1&token={token}", "WS /ws/{channel_id}/signaling"):
+        pass
+
+    page = client.request("GET", "/servers?limit=1", headers=alice).json()
+    client.request("GET", f"/servers?limit=1&after_id={page['servers'][0]['id']}", headers=alice)
+    client.request("GET", f"/servers/{server['id']}", label="GET /servers/{server_id}", headers=alice)
+    client.request("GET", f"/channels/{channel_id}", label="GET /channels/{channel_id}", headers=alice)
+    client.request("GET", f"/channels/{channel_id}/members", label="GET /channels/{channel_id}/members", headers=alice)
+    label = "GET /channels/{channel_id}/messages"
+    page = client.request("GET", f"/channels/{channel_id}/messages?limit=2", label=label).json()
+    client.request("GET", f"/channels/{channel_id}/messages?limit=2&before_id={page['next_cursor']}", label=label)
+    client.request("GET", f"/channels/{channel_id}/messages?limit=2&after_id=0", label=label)
+    label = "GET /search/messages"
+    page = client.request("GET", f"/search/messages?q=message&channel_id={channel_id}&limit=2", label=label, headers=alice).json()
+    client.request("GET", f"/search/messages?q=message&channel_id={channel_id}&limit=2&cursor={page['next_cursor']}", label=label, headers=alice)
+    client.request("GET", f"/search/messages?q=mess*&server_id={server['id']}", label=label, headers=alice)
+
+
+def explain(statement, parameters):
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def test_no_full_table_scans(recorder):
+    exercise(recorder)
+    assert recorder.statements, "No SQL statements recorded"
+
+    failures = []
+    for (endpoint, statement), parameters in recorder.statements.items():
+        plan = explain(statement, parameters)
+        problems = []
+        for detail in plan:
+            scan = FULL_SCAN.match(detail)
+            if scan and (endpoint, scan.group(1)) not in ALLOWED_SCANS:
+                problems.append(detail)
+            elif AUTOMATIC_INDEX.search(detail):
+                problems.append(detail)
+        print(f"[{'FAIL' if problems else 'ok'}] {endpoint}: {' '.join(statement.split())[:120]}")
+        for detail in plan:
+            print(f"         {detail}")
+        if problems:
+            failures.append(f"{endpoint}: {' '.join(statement.split())[:120]} -> {'; '.join(problems)}")
+
+    print(f"\n{len(recorder.statements)} statements checked, {len(failures)} with full table scans")
+    assert not failures, "Full table scans:\n" + "\n".join(failures)
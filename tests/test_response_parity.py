@@ -0,0 +1,218 @@
+"""
+Kiểm tra các endpoint đọc nhiều dùng FastJSONResponse trả về đúng từng byte như
+cách cũ (trả ORM/dict để FastAPI kiểm tra qua response_model Pydantic).
+
+Test ghi dữ liệu có ký tự đặc biệt (Unicode, emoji, dấu nháy, ký tự điều
+khiển, U+2028, thời điểm không có micro giây), gắn các endpoint tham chiếu
+(bản cài đặt cũ) vào cùng app dưới tiền tố /reference, rồi so sánh nội dung
+response của từng cặp request. Chạy riêng:
+    python3 -m pytest tests/test_response_parity.py
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pytest
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database import SessionLocal, get_async_read_db
+from models import Channels, ChannelMembers, Messages, Servers, Users
+from routers.channel import ChannelMember, DataChannelResponse, channel_cache
+from routers.server import ServerListResponse, ServerResponse
+from service.auth import get_current_user, get_current_user_optional
+from service.presence import get_presence_tracker
+
+USERS = 12
+MESSAGES = 500
+
+# Nội dung khó mã hóa: escape của JSON, ký tự ngoài ASCII, ký tự điều khiển
+TRICKY_TEXT = [
+    "xin chào", "Tiếng Việt có dấu: ắằẳẵặ ỨỪỬỮỰ", "emoji 🎉👍🏽👨‍👩‍👧", 'dấu "nháy" và \\gạch chéo\\',
+    "dòng\nmới\tvà\rký tự\x01\x1f\x7f", "line separator ", "</script><b>html</b>", "",
+    "中文 日本語 한국어", "a" * 2000, "null", "퟿￿",
+]
+
+reference = APIRouter(prefix="/reference")
+
+
+@reference.get("/channels/{channel_id}/messages", response_model=DataChannelResponse)
+async def reference_messages(
+    channel_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    db_channel = await channel_cache.get(channel_id)
+    if not db_channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    query = select(Messages).where(Messages.channel_id == channel_id)
+    if after_id is not None:
+        query = query.where(Messages.id > after_id).order_by(Messages.id.asc()).limit(limit + 1)
+        messages = (await db.execute(query)).scalars().all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        next_cursor = messages[-1].id if has_more else None
+    else:
+        if before_id is not None:
+            query = query.where(Messages.id < before_id)
+        query = query.order_by(Messages.id.desc()).limit(limit + 1)
+        messages = (await db.execute(query)).scalars().all()
+        has_more = len(messages) > limit
+        messages = messages[:limit][::-1]
+        next_cursor = messages[0].id if has_more else None
+    sender_ids = {message.sender_id for message in messages}
+    senders = {}
+    if sender_ids:
+        result = await db.execute(select(Users).where(Users.id.in_(sender_ids)))
+        senders = {user.id: user for user in result.scalars()}
+    return {
+        "id": db_channel.id,
+        "name": db_channel.name,
+        "channel_type": db_channel.channel_type,
+        "messages": [
+            {"id": message.id, "content": message.content, "created_at": message.created_at, "sender": senders.get(message.sender_id)}
+            for message in messages
+        ],
+        "next_cursor": next_cursor
+    }
+
+
+@reference.get("/channels/{channel_id}/members", response_model=list[ChannelMember])
+async def reference_members(channel_id: int, current_user: Users = Depends(get_current_user_optional)):
+    db_channel = await channel_cache.get(channel_id)
+    if not db_channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    return db_channel.member_list(exclude_user_id=current_user.id if current_user is not None else None)
+
+
+@reference.get("/servers", response_model=ServerListResponse)
+async def reference_servers(
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Users = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    member_server_ids = (
+        select(Channels.server_id)
+        .join(ChannelMembers, ChannelMembers.channel_id == Channels.id)
+        .where(ChannelMembers.user_id == current_user.id)
+    )
+    channel_count = select(func.count(Channels.id)).where(Channels.server_id == Servers.id).correlate(Servers).scalar_subquery()
+    query = (
+        select(Servers.id, Servers.name, Servers.host_user_id, Servers.color, Servers.is_private, channel_count.label("channel_count"))
+        .where(or_(Servers.host_user_id == current_user.id, Servers.id.in_(member_server_ids)))
+        .order_by(Servers.id)
+        .limit(limit + 1)
+    )
+    if after_id is not None:
+        query = query.where(Servers.id > after_id)
+    rows = (await db.execute(query)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {"servers": rows, "next_cursor": rows[-1]["id"] if has_more else None}
+
+
+@reference.get("/servers/{server_id}", response_model=ServerResponse)
+async def reference_server(server_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    server = await db.get(
+        Servers,
+        server_id,
+        options=[selectinload(Servers.channels).selectinload(Channels.members).selectinload(ChannelMembers.user)]
+    )
+    if not server:
+        raise HTTPException(status_code=404, detail="Server not found")
+    return server
+
+
+def seed(client, users, messages):
+    """Tạo người dùng, server, channel, thành viên và tin nhắn; trả về (headers, server_ids, channel_ids)"""
+    headers = []
+    for index in range(users):
+        name = f"user{index}_{random.choice(TRICKY_TEXT)[:20]}"
+        client.post("/auth/register", json={"username": name, "full_name": random.choice(TRICKY_TEXT)[:60], "password": "pw"})
+        token = client.post("/auth/login", data={"username": name, "password": "pw"}).json()["access_token"]
+        headers.append({"Authorization": f"Bearer {token}"})
+
+    server_ids, channel_ids = [], []
+    for index, host in enumerate(headers[:3]):
+        server = client.post("/servers/create", json={
+            "name": f"server {index} {TRICKY_TEXT[index]}", "color": random.choice(["red", "#00ff00", "xanh lá"]),
+            "is_private": bool(index % 2)
+        }, headers=host).json()
+        server_ids.append(server["id"])
+        for channel in server["channels"]:
+            channel_ids.append(channel["id"])
+        extra = client.post("/channels/create", json={"name": "thảo luận 💬", "server_id": server["id"], "channel_type": "text"}, headers=host).json()
+        channel_ids.append(extra["id"])
+    for member in headers[3:]:
+        for channel_id in random.sample(channel_ids, k=min(4, len(channel_ids))):
+            client.post("/channels/join", json={"channel_id": channel_id}, headers=member)
+    client.put("/auth/status", json={"status": "invisible"}, headers=headers[-1])
+
+    # Ghi tin nhắn trực tiếp để có created_at tùy ý (cả giá trị không có micro giây)
+    sender_ids = [client.get("/auth/me", headers=header).json()["id"] for header in headers]
+    started = datetime(2026, 1, 1, 8, 0, 0)
+    with SessionLocal() as db:
+        for index in range(messages):
+            created_at = started + timedelta(seconds=index * 7, microseconds=0 if index % 3 == 0 else random.randrange(1, 10**6))
+            db.add(Messages(
+                content=random.choice(TRICKY_TEXT) + f" #{index}", channel_id=random.choice(channel_ids),
+                sender_id=random.choice(sender_ids), created_at=created_at
+            ))
+        db.commit()
+    return headers, server_ids, channel_ids
+
+
+def requests_to_compare(client, headers, server_ids, channel_ids):
+    """Danh sách (path, headers) gồm các trang tin nhắn, thành viên và server"""
+    paths = []
+    for channel_id in channel_ids:
+        for query in ("", "?limit=1", "?limit=7", "?limit=200", "?after_id=0&limit=5"):
+            paths.append((f"/channels/{channel_id}/messages{query}", None))
+        cursor = client.get(f"/channels/{channel_id}/messages?limit=3").json()["next_cursor"]
+        while cursor is not None:
+            paths.append((f"/channels/{channel_id}/messages?limit=3&before_id={cursor}", None))
+            cursor = client.get(f"/channels/{channel_id}/messages?limit=3&before_id={cursor}").json()["next_cursor"]
+        paths.append((f"/channels/{channel_id}/members", None))
+        paths.append((f"/channels/{channel_id}/members", headers[0]))
+        paths.append((f"/channels/{channel_id}/members", headers[-1]))
+    for header in headers:
+        paths.append(("/servers", header))
+        paths.append(("/servers?limit=1", header))
+        paths.append(("/servers?limit=1&after_id=1", header))
+    for server_id in server_ids:
+        paths.append((f"/servers/{server_id}", headers[0]))
+    return paths
+
+
+@pytest.fixture
+def seeded(app, client):
+    random.seed(1)
+    app.include_router(reference)
+    headers, server_ids, channel_ids = seed(client, USERS, MESSAGES)
+    # Ghi trạng thái online/offline đang chờ, tránh đổi dữ liệu giữa hai request của một cặp
+    client.portal.call(get_presence_tracker().flush)
+    return headers, server_ids, channel_ids
+
+
+def test_fast_path_matches_reference(client, seeded):
+    paths = requests_to_compare(client, *seeded)
+    assert paths
+
+    mismatches = []
+    for path, header in paths:
+        fast = client.get(path, headers=header)
+        slow = client.get(f"/reference{path}", headers=header)
+        if fast.status_code != slow.status_code or fast.content != slow.content:
+            offset = next((i for i, (x, y) in enumerate(zip(fast.content, slow.content)) if x != y), min(len(fast.content), len(slow.content)))
+            start = max(offset - 80, 0)
+            mismatches.append(
+                f"{path} at byte {offset}: {fast.status_code} {fast.content[start:offset + 80]!r}\n"
+                f"    reference {slow.status_code} {slow.content[start:offset + 80]!r}"
+            )
+    print(f"{len(paths)} responses compared, {len(mismatches)} differ")
+    assert not mismatches, "\n".join(mismatches)
@@ -0,0 +1,47 @@
+"""
+Vòng đời kết nối WebSocket chat/signaling: đăng ký và dọn dẹp fanout,
+presence và topic broker.
+"""
+import pytest
+
+from routers import signaling
+from service.fanout import serialize
+
+
+@pytest.fixture
+def failing_publish(monkeypatch):
+    """broker.publish lỗi như khi kết nối tới broker bị đóng giữa chừng"""
+    async def publish(topic, payload):
+        raise ConnectionResetError("broker connection reset")
+    monkeypatch.setattr(signaling.broker, "publish", publish)
+
+
+def test_text_cleanup_runs_when_handler_fails(client, text_channel, failing_publish):
+    token, user_id, channel_id = text_channel
+    with pytest.raises(ConnectionResetError):
+        with client.websocket_connect(f"/ws/{channel_id}?token={token}") as ws:
+            assert channel_id in signaling.text_connections
+            assert user_id in signaling.presence_tracker._local
+            ws.send_json({"content": "hello"})
+            ws.receive_json()
+    assert channel_id not in signaling.text_connections
+    assert user_id not in signaling.presence_tracker._local
+    assert signaling.text_topic(channel_id) not in signaling.broker._handlers
+    assert channel_id not in signaling.message_cache._tracked
+
+
+def test_signaling_cleanup_runs_when_handler_fails(client, text_channel, monkeypatch):
+    token, user_id, channel_id = text_channel
+    async def publish(topic, payload):
+        raise ConnectionResetError("broker connection reset")
+
+    with pytest.raises(ConnectionResetError):
+        with client.websocket_connect(f"/ws/{channel_id}/signaling?peer_id=p1&token={token}") as ws:
+            assert "p1" in signaling.active_connections[channel_id]
+            # Lỗi từ lần publish tiếp theo (frame broadcast); "peer_left" cũng lỗi
+            monkeypatch.setattr(signaling.broker, "publish", publish)
+            ws.send_text(serialize({"action": "chat", "text": "hi"}))
+            ws.receive_text()
+    assert channel_id not in signaling.active_connections
+    assert user_id not in signaling.presence_tracker._local
+    assert signaling.signaling_topic(channel_id) not in signaling.broker._handlers
@@ -0,0 +1,93 @@
+"""
+Chuyển tiếp signaling: đọc trường định tuyến ở đầu frame, gắn peer_id không
+mã hóa lại, gộp ice_candidate.
+"""
+import asyncio
+import json
+
+from service.signaling_relay import ICE_BATCH_ACTION, ROUTING_FIELDS, SignalingRelay, with_peer_id
+from service.wire_codec import peek_fields
+
+OFFER = '{"action":"offer","target_id":"p2","sdp":"v=0\\r\\no=- 1 2 IN IP4 0.0.0.0\\r\\n","type":"offer"}'
+
+
+def test_peek_fields_reads_leading_routing_fields():
+    assert peek_fields(OFFER, ROUTING_FIELDS) == {"action": "offer", "target_id": "p2"}
+    assert peek_fields(' { "target_id" : "p2", "action": "answer"}', ROUTING_FIELDS) == {"action": "answer", "target_id": "p2"}
+
+
+def test_peek_fields_falls_back_to_full_parse():
+    for data in (
+        '{"sdp":{"type":"offer"},"action":"offer","target_id":"p2"}',  # trường lồng nhau đứng trước
+        '{"action":"offer","target_id":2}',  # target_id không phải chuỗi
+        '{"action":"offer","target_id":"p\\u0032"}',  # có escape
+        '{"action":"heartbeat"}',  # thiếu target_id
+        '{"action":"offer","target_id":"p2"',  # object chưa đóng
+        '[{"action":"offer","target_id":"p2"}]',
+        '{"a":"1","b":"2","c":"3","d":"4","action":"offer","target_id":"p2"}',
+    ):
+        assert peek_fields(data, ROUTING_FIELDS) is None, data
+
+
+def test_with_peer_id_keeps_payload_bytes():
+    frame = with_peer_id(OFFER, "p1")
+    assert frame.startswith(OFFER[:-1])
+    assert json.loads(frame) == {**json.loads(OFFER), "peer_id": "p1"}
+    # peer_id client tự gửi bị ghi đè
+    assert json.loads(with_peer_id('{"action":"offer","peer_id":"fake"}', "p1"))["peer_id"] == "p1"
+    assert json.loads(with_peer_id("{}", "p1")) == {"peer_id": "p1"}
+
+
+class Target:
+    def __init__(self):
+        self.frames = []
+
+    def send(self, frame):
+        self.frames.append(frame)
+
+
+def candidate(i):
+    return with_peer_id(json.dumps({"action": "ice_candidate", "target_id": "p2", "candidate": f"c{i}"}), "p1")
+
+
+def test_ice_candidates_are_coalesced_per_target():
+    async def relay():
+        relay = SignalingRelay(coalesce_window=0.01)
+        target = Target()
+        for i in range(3):
+            relay.forward((1, "p2"), target, "ice_candidate", candidate(i))
+        assert target.frames == []
+        await asyncio.sleep(0.05)
+        return target.frames
+
+    frames = asyncio.run(relay())
+    assert len(frames) == 1
+    batch = json.loads(frames[0])
+    assert batch["action"] == ICE_BATCH_ACTION
+    assert [message["candidate"] for message in batch["messages"]] == ["c0", "c1", "c2"]
+
+
+def test_pending_candidates_are_sent_before_offer():
+    async def relay():
+        relay = SignalingRelay(coalesce_window=10)
+        target = Target()
+        relay.forward((1, "p2"), target, "ice_candidate", candidate(0))
+        relay.forward((1, "p2"), target, "offer", with_peer_id(OFFER, "p1"))
+        return target.frames
+
+    frames = asyncio.run(relay())
+    # Một candidate không cần bọc trong frame gộp
+    assert [json.loads(frame)["action"] for frame in frames] == ["ice_candidate", "offer"]
+
+
+def test_offer_is_relayed_to_target_peer(client, text_channel):
+    token, _, channel_id = text_channel
+    path = f"/ws/{channel_id}/signaling?token={token}&peer_id="
+    with client.websocket_connect(path + "p1") as first, client.websocket_connect(path + "p2") as second:
+        assert first.receive_json()["action"] == "new_peer"
+        first.send_text(OFFER)
+        relayed = second.receive_text()
+        assert relayed == with_peer_id(OFFER, "p1")
+        # Frame không định tuyến được ở đầu vẫn được phân tích và chuyển tiếp
+        first.send_text('{"type":"answer","action":"answer","target_id":"p2"}')
+        assert json.loads(second.receive_text()) == {"type": "answer", "action": "answer", "target_id": "p2", "peer_id": "p1"}
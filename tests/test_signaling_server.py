@@ -0,0 +1,107 @@
+"""
+Listener signaling độc lập: handshake và frame của StreamWebSocket.
+"""
+import asyncio
+import socket
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from service.signaling_server import (
+    CLOSE_INVALID_DATA, CLOSE_UNSUPPORTED_DATA, HandshakeError, StreamWebSocket, read_handshake
+)
+from service.socket import OP_TEXT, build_client_frame
+
+HANDSHAKE = (
+    "GET /ws/1/signaling?peer_id=p1&token=t HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "Sec-WebSocket-Protocol: chat.v1.compact, chat.v1.json\r\n"
+    "\r\n"
+)
+
+
+async def open_pair():
+    """(reader, writer) phía server và phía client của một kết nối"""
+    server_sock, client_sock = socket.socketpair()
+    server = await asyncio.open_connection(sock=server_sock)
+    client = await asyncio.open_connection(sock=client_sock)
+    return server, client
+
+
+async def handshake(request, timeout=1.0):
+    (reader, writer), (_, client_writer) = await open_pair()
+    client_writer.write(request.encode())
+    try:
+        return await read_handshake(reader, timeout)
+    finally:
+        writer.close()
+        client_writer.close()
+
+
+def test_handshake_is_parsed():
+    channel_id, peer_id, token, accept_key, _, subprotocols = asyncio.run(handshake(HANDSHAKE))
+    assert (channel_id, peer_id, token) == (1, "p1", "t")
+    # Ví dụ trong RFC 6455 mục 1.3
+    assert accept_key == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+    assert subprotocols == ["chat.v1.compact", "chat.v1.json"]
+
+
+@pytest.mark.parametrize("request_text, status", [
+    (HANDSHAKE[:40], 408),  # header chưa gửi hết
+    (HANDSHAKE.replace("GET", "POST"), 405),
+    (HANDSHAKE.replace("Upgrade: websocket\r\n", ""), 426),
+    (HANDSHAKE.replace("Version: 13", "Version: 8"), 400),
+    (HANDSHAKE.replace("/ws/1/signaling", "/ws/1"), 404),
+    (HANDSHAKE.replace("peer_id=p1&", ""), 400),
+])
+def test_bad_handshake_is_rejected(request_text, status):
+    with pytest.raises(HandshakeError) as error:
+        asyncio.run(handshake(request_text, timeout=0.05))
+    assert error.value.status == status
+
+
+async def receive_after(frame, binary=False):
+    """Gửi một frame từ client, trả về (close code server dùng, frame close client nhận được)"""
+    (reader, writer), (client_reader, client_writer) = await open_pair()
+    websocket = StreamWebSocket(reader, writer, "key", ping_interval=0)
+    websocket.accepted = True
+    client_writer.write(frame)
+    with pytest.raises(WebSocketDisconnect) as error:
+        if binary:
+            await websocket.receive_bytes()
+        else:
+            await websocket.receive_text()
+    close = await client_reader.read()
+    client_writer.close()
+    return error.value.code, close
+
+
+def test_invalid_utf8_closes_with_1007():
+    code, close = asyncio.run(receive_after(build_client_frame(b"\xff\xfe", OP_TEXT)))
+    assert code == CLOSE_INVALID_DATA
+    assert close[:2] == b"\x88\x0f" and int.from_bytes(close[2:4], "big") == CLOSE_INVALID_DATA
+
+
+def test_unexpected_frame_type_closes_with_1003():
+    code, close = asyncio.run(receive_after(build_client_frame(b"{}", OP_TEXT), binary=True))
+    assert code == CLOSE_UNSUPPORTED_DATA
+    assert int.from_bytes(close[2:4], "big") == CLOSE_UNSUPPORTED_DATA
+
+
+def test_text_frame_is_received():
+    async def receive():
+        (reader, writer), (_, client_writer) = await open_pair()
+        websocket = StreamWebSocket(reader, writer, "key", ping_interval=0)
+        websocket.accepted = True
+        client_writer.write(build_client_frame("xin chào".encode(), OP_TEXT))
+        try:
+            return await websocket.receive_text()
+        finally:
+            await websocket.close()
+            client_writer.close()
+
+    assert asyncio.run(receive()) == "xin chào"
@@ -0,0 +1,56 @@
+"""
+TokenCache: mục của người dùng bị xóa trên mọi worker khi thông tin người
+dùng thay đổi.
+"""
+import asyncio
+
+import pytest
+
+from service import auth
+from service.auth import TokenCache, UserSnapshot
+from service.broker import InProcessBroker
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = InProcessBroker()
+    monkeypatch.setattr(auth, "get_broker", lambda: broker)
+    return broker
+
+
+def snapshot(user_id, status="online"):
+    return UserSnapshot(user_id, f"user{user_id}", f"User {user_id}", status, True)
+
+
+def test_invalidate_user_drops_every_token_of_the_user():
+    cache = TokenCache()
+    cache.put("a", {}, snapshot(1))
+    cache.put("b", {}, snapshot(1))
+    cache.put("c", {}, snapshot(2))
+    cache.invalidate_user(1)
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c").id == 2
+
+
+def test_invalidation_reaches_other_workers(broker):
+    # Hai worker dùng chung broker
+    local, remote = TokenCache(), TokenCache()
+    remote.subscribe()
+    for cache in (local, remote):
+        cache.put("token", {}, snapshot(1))
+
+    local.invalidate_user(1)
+    asyncio.run(local.publish(1))
+    assert remote.get("token") is None
+
+    # Worker gửi bỏ qua thông báo của chính nó
+    local.put("token", {}, snapshot(1, "invisible"))
+    local._on_invalidation(f'{{"origin": "{local._origin}", "user_id": 1}}')
+    assert local.get("token").status == "invisible"
+
+
+def test_entries_expire_with_the_token():
+    cache = TokenCache(ttl=60)
+    cache.put("token", {"exp": 1}, snapshot(1))
+    assert cache.get("token") is None
+    assert cache.stats()["entries"] == 0
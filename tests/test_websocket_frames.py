@@ -0,0 +1,82 @@
+"""
+FrameParser: frame WebSocket nhận từng đoạn byte, ghép fragment, control
+frame xen giữa và các vi phạm giao thức (RFC 6455).
+"""
+import os
+
+import pytest
+
+from service.socket import (
+    OP_BINARY, OP_CLOSE, OP_CONTINUATION, OP_PING, OP_TEXT, FrameParser, Message, ProtocolError,
+    build_client_frame, build_frame, unmask
+)
+
+
+def feed_bytewise(parser, data):
+    messages = []
+    for i in range(len(data)):
+        messages.extend(parser.feed(data[i:i + 1]))
+    return messages
+
+
+def test_frames_split_at_any_byte():
+    data = (
+        build_client_frame(b"hello")
+        + build_client_frame(b"x" * 300, OP_BINARY)  # độ dài 16 bit
+        + build_client_frame(b"y" * 70000)  # độ dài 64 bit
+    )
+    parser = FrameParser()
+    assert feed_bytewise(parser, data) == [
+        Message(OP_TEXT, b"hello"), Message(OP_BINARY, b"x" * 300), Message(OP_TEXT, b"y" * 70000)
+    ]
+    assert parser.buffered == 0
+
+
+def test_fragments_are_joined_around_control_frames():
+    parser = FrameParser()
+    data = (
+        build_client_frame(b"frag", OP_TEXT, fin=False)
+        + build_client_frame(b"ping", OP_PING)
+        + build_client_frame(b"men", OP_CONTINUATION, fin=False)
+        + build_client_frame(b"ted", OP_CONTINUATION)
+    )
+    assert parser.feed(data[:-3]) == [Message(OP_PING, b"ping")]
+    assert parser.feed(data[-3:]) == [Message(OP_TEXT, b"fragmented")]
+    # Tin nhắn tiếp theo không dính fragment cũ
+    assert parser.feed(build_client_frame(b"next")) == [Message(OP_TEXT, b"next")]
+
+
+def test_unmask_matches_bytewise_xor():
+    key = os.urandom(4)
+    for length in (1, 7, 4096, 4099, 10001):
+        payload = os.urandom(length)
+        assert unmask(payload, key) == bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+
+
+@pytest.mark.parametrize("data, reason", [
+    (build_frame(b"hi"), "masked"),
+    (build_client_frame(b"hi", OP_TEXT, rsv1=True), "Reserved bits"),
+    (bytes([0x80 | 0x20 | OP_TEXT]) + build_client_frame(b"hi")[1:], "Reserved bits"),  # RSV2
+    (build_client_frame(b"more", OP_CONTINUATION), "Continuation"),
+    (build_client_frame(b"x" * 126, OP_PING), "Control frames"),
+    (build_client_frame(b"", OP_CLOSE, fin=False), "Control frames"),
+    (build_client_frame(b"hi", 0x3), "Unknown opcode"),
+    (build_client_frame(b"x" * 65, OP_TEXT), "max_message_size"),
+])
+def test_protocol_errors(data, reason):
+    with pytest.raises(ProtocolError, match=reason):
+        FrameParser(max_message_size=64).feed(data)
+
+
+def test_new_data_frame_inside_fragmented_message():
+    parser = FrameParser()
+    parser.feed(build_client_frame(b"a", OP_TEXT, fin=False))
+    with pytest.raises(ProtocolError, match="before the fragmented message finished"):
+        parser.feed(build_client_frame(b"b", OP_TEXT))
+
+
+def test_fragmented_message_size_is_limited():
+    parser = FrameParser(max_message_size=10)
+    parser.feed(build_client_frame(b"x" * 6, OP_TEXT, fin=False))
+    with pytest.raises(ProtocolError, match="max_message_size"):
+        parser.feed(build_client_frame(b"x" * 6, OP_CONTINUATION))
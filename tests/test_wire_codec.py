@@ -0,0 +1,93 @@
+"""
+Cách mã hóa tin nhắn WebSocket: JSON hoặc compact (MessagePack với tên trường
+thay bằng chỉ số), thỏa thuận qua subprotocol.
+"""
+import json
+
+import msgpack
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from service import wire_codec
+from service.wire_codec import (
+    COMPACT_CODEC, COMPACT_SUBPROTOCOL, DEFAULT_CODEC, FIELD_INDEX, JSON_CODEC, MAX_DEPTH, negotiate_codec
+)
+
+MESSAGE = {
+    "id": 12345, "content": "xin chào 👋", "created_at": "2026-10-18T05:00:00",
+    "sender": {"id": 7, "username": "alice", "full_name": "Alice", "status": "online"},
+    "temp_id": None, "edited": False, "score": -1.5, "big": 2 ** 40, "negative": -70000,
+    "users": [{"id": 1, "status": "invisible"}, {"id": 2, "status": "offline"}],
+}
+
+
+@pytest.fixture(params=["msgpack", "pure"])
+def implementation(request, monkeypatch):
+    """Chạy với thư viện msgpack và với bộ mã hóa Python (khi không cài msgpack)"""
+    if request.param == "pure":
+        monkeypatch.setattr(wire_codec, "msgpack", None)
+    return request.param
+
+
+def test_round_trip(implementation):
+    data = COMPACT_CODEC.encode(MESSAGE)
+    assert COMPACT_CODEC.decode(data) == MESSAGE
+    assert COMPACT_CODEC.transcode(json.dumps(MESSAGE)) == data
+    # Tên trường trong bảng được thay bằng chỉ số, khóa khác giữ nguyên
+    raw = msgpack.unpackb(data, strict_map_key=False)
+    assert FIELD_INDEX["content"] in raw and "edited" in raw
+
+
+def test_both_implementations_produce_the_same_bytes(monkeypatch):
+    data = COMPACT_CODEC.encode(MESSAGE)
+    monkeypatch.setattr(wire_codec, "msgpack", None)
+    assert COMPACT_CODEC.encode(MESSAGE) == data
+
+
+def nested(depth):
+    value = 1
+    for _ in range(depth):
+        value = [value]
+    return {"content": value}
+
+
+@pytest.mark.parametrize("data", [
+    "text frame",
+    b"",
+    msgpack.packb({"content": "hi"})[:-1],  # cắt cụt
+    msgpack.packb({"content": "hi"}) + b"\x00",  # dữ liệu thừa
+    msgpack.packb({100: "unknown field"}),
+    msgpack.packb({"content": b"binary"}, use_bin_type=True),
+    msgpack.packb({"content": msgpack.ExtType(5, b"x")}),
+    msgpack.packb({1.5: "float key"}),
+    msgpack.packb(nested(MAX_DEPTH + 2)),
+    b"\xc1",  # mã byte không dùng
+])
+def test_invalid_frames_are_rejected(implementation, data):
+    with pytest.raises(ValueError):
+        COMPACT_CODEC.decode(data)
+
+
+def test_negotiate_codec():
+    assert negotiate_codec(["chat.v2", COMPACT_SUBPROTOCOL, "chat.v1.json"]) is COMPACT_CODEC
+    assert negotiate_codec(["chat.v1.json", COMPACT_SUBPROTOCOL]) is JSON_CODEC
+    assert negotiate_codec(["graphql-ws"]) is DEFAULT_CODEC
+    assert negotiate_codec(None) is DEFAULT_CODEC
+
+
+def test_compact_chat_connection(client, text_channel):
+    token, user_id, channel_id = text_channel
+    with client.websocket_connect(f"/ws/{channel_id}?token={token}", subprotocols=[COMPACT_SUBPROTOCOL]) as ws:
+        ws.send_bytes(COMPACT_CODEC.encode({"content": "hello", "temp_id": "t1"}))
+        # Có thể nhận frame presence trước tin nhắn
+        message = COMPACT_CODEC.decode(ws.receive_bytes())
+        while "content" not in message:
+            message = COMPACT_CODEC.decode(ws.receive_bytes())
+        assert message["content"] == "hello" and message["sender"]["id"] == user_id
+
+        # Frame text trên kết nối compact: đóng với 1003
+        ws.send_text('{"content": "hello"}')
+        with pytest.raises(WebSocketDisconnect) as error:
+            while True:
+                ws.receive_bytes()
+        assert error.value.code == 1003
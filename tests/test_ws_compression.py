@@ -0,0 +1,87 @@
+"""
+permessage-deflate (RFC 7692): thỏa thuận Sec-WebSocket-Extensions và nén/giải
+nén tin nhắn của listener asyncio.
+"""
+import zlib
+
+import pytest
+
+from service.socket import (
+    DEFLATE_TAIL, OP_CONTINUATION, OP_TEXT, FrameParser, Message, build_client_frame, negotiate_deflate
+)
+
+
+@pytest.mark.parametrize("header, response", [
+    ("permessage-deflate", "permessage-deflate"),
+    ("permessage-deflate; client_max_window_bits", "permessage-deflate"),
+    ("permessage-deflate; server_max_window_bits=10", "permessage-deflate; server_max_window_bits=10"),
+    ("permessage-deflate; client_max_window_bits=12", "permessage-deflate; client_max_window_bits=12"),
+    (
+        "permessage-deflate; server_no_context_takeover; client_no_context_takeover",
+        "permessage-deflate; server_no_context_takeover; client_no_context_takeover"
+    ),
+    # Đề nghị đầu không chấp nhận được (cửa sổ 8 bit): chọn đề nghị tiếp theo
+    ("permessage-deflate; server_max_window_bits=8, permessage-deflate", "permessage-deflate"),
+    ("x-webkit-deflate-frame, permessage-deflate", "permessage-deflate"),
+    ("permessage-deflate; server_max_window_bits=16", None),
+    ("permessage-deflate; client_max_window_bits=7", None),
+    ("permessage-deflate; server_no_context_takeover=1", None),
+    ("permessage-deflate; mystery", None),
+    ("permessage-deflate; client_max_window_bits; client_max_window_bits", None),
+    ("x-webkit-deflate-frame", None),
+    ("", None),
+    (None, None),
+])
+def test_negotiate_deflate_response(header, response):
+    accepted, deflate = negotiate_deflate(header)
+    assert accepted == response
+    assert (deflate is None) == (response is None)
+
+
+def test_server_settings_are_announced():
+    response, deflate = negotiate_deflate(
+        "permessage-deflate; client_max_window_bits",
+        server_max_window_bits=11, client_max_window_bits=10, server_no_context_takeover=True
+    )
+    assert response == (
+        "permessage-deflate; server_no_context_takeover; server_max_window_bits=11; client_max_window_bits=10"
+    )
+    assert (deflate.server_max_window_bits, deflate.client_max_window_bits) == (11, 10)
+
+
+def client_compress(compressor, payload):
+    data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    assert data.endswith(DEFLATE_TAIL)
+    return data[:-4]
+
+
+def test_client_messages_are_decompressed_with_context_takeover():
+    _, deflate = negotiate_deflate("permessage-deflate")
+    parser = FrameParser(deflate=deflate)
+    compressor = zlib.compressobj(wbits=-15)
+    message = b'{"action":"ice_candidate","candidate":"candidate:1 1 UDP 2122252543 192.168.1.2 50000 typ host"}'
+    first = client_compress(compressor, message)
+    second = client_compress(compressor, message)
+    # Tin nhắn thứ hai dùng lại cửa sổ của tin nhắn đầu
+    assert len(second) < len(first)
+    data = build_client_frame(first, rsv1=True) + build_client_frame(second, rsv1=True)
+    assert parser.feed(data) == [Message(OP_TEXT, message), Message(OP_TEXT, message)]
+
+    # Tin nhắn nén bị chia fragment: RSV1 chỉ ở frame đầu
+    third = client_compress(compressor, message)
+    data = build_client_frame(third[:5], OP_TEXT, fin=False, rsv1=True) + build_client_frame(third[5:], OP_CONTINUATION)
+    assert parser.feed(data) == [Message(OP_TEXT, message)]
+
+
+def test_server_messages_below_min_size_are_not_compressed():
+    _, deflate = negotiate_deflate("permessage-deflate", min_size=64)
+    decompressor = zlib.decompressobj(-15)
+
+    small = deflate.encode(b'{"action":"heartbeat"}')
+    assert small[0] & 0x40 == 0
+    assert small[2:] == b'{"action":"heartbeat"}'
+
+    payload = b'{"content":"' + b"xin chao " * 20 + b'"}'
+    frame = deflate.encode(payload)
+    assert frame[0] & 0x40
+    assert decompressor.decompress(frame[2:] + DEFLATE_TAIL) == payload
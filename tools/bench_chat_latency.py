@@ -0,0 +1,93 @@
+"""
+Đo độ trễ chat qua WebSocket khi có tải REST đồng thời.
+
+Chạy server trước (python3 main.py), sau đó:
+    pip install httpx
+    python3 tools/bench_chat_latency.py --url http://127.0.0.1:8000 --clients 20 --messages 200 --rest-concurrency 20
+
+In ra p50/p95/p99 độ trễ từ lúc gửi đến lúc mọi client nhận được tin nhắn,
+lần lượt khi không có và khi có tải GET /servers đồng thời.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+import httpx
+import websockets
+
+
+async def login(client: httpx.AsyncClient):
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    await client.post("/auth/register", json={"username": username, "full_name": username, "password": "bench"})
+    response = await client.post("/auth/login", data={"username": username, "password": "bench"})
+    return response.json()["access_token"]
+
+
+async def setup(client: httpx.AsyncClient, clients):
+    # Mỗi client một user: kết nối text được đăng ký theo user nên cùng user sẽ thay thế nhau
+    tokens = [await login(client) for _ in range(clients)]
+    headers = {"Authorization": f"Bearer {tokens[0]}"}
+    response = await client.post("/servers/create", json={"name": "bench", "color": "#000", "is_private": False}, headers=headers)
+    channel_id = next(c["id"] for c in response.json()["channels"] if c["channel_type"] == "text")
+    return tokens, headers, channel_id
+
+
+async def rest_load(client: httpx.AsyncClient, headers, stop: asyncio.Event, counter):
+    while not stop.is_set():
+        await client.get("/servers", headers=headers)
+        counter[0] += 1
+
+
+async def measure(ws_url, tokens, channel_id, messages):
+    sockets = [await websockets.connect(f"{ws_url}/ws/{channel_id}?token={token}") for token in tokens]
+    latencies = []
+    try:
+        for i in range(messages):
+            started = time.perf_counter()
+            await sockets[0].send(json.dumps({"content": f"bench {i}", "created_at": "bench"}))
+            for ws in sockets:
+                while True:
+                    message = json.loads(await ws.recv())
+                    if message.get("content") == f"bench {i}":
+                        break
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        for ws in sockets:
+            await ws.close()
+    return latencies
+
+
+def report(label, latencies, extra=""):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    print(f"{label:<14} p50={statistics.median(latencies):7.2f}ms p95={p(0.95):7.2f}ms p99={p(0.99):7.2f}ms {extra}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rest-concurrency", type=int, default=20)
+    args = parser.parse_args()
+    ws_url = args.url.replace("http", "ws", 1)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        tokens, headers, channel_id = await setup(client, args.clients)
+        report("idle", await measure(ws_url, tokens, channel_id, args.messages))
+
+        stop = asyncio.Event()
+        counter = [0]
+        load = [asyncio.create_task(rest_load(client, headers, stop, counter)) for _ in range(args.rest_concurrency)]
+        started = time.perf_counter()
+        latencies = await measure(ws_url, tokens, channel_id, args.messages)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*load)
+        report("rest load", latencies, f"({counter[0] / elapsed:.0f} REST req/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+"""
+Đo thông lượng giải mã frame WebSocket: hàm decode_frame cũ (unmask từng byte)
+so với decode_frame hiện tại và FrameParser dạng luồng.
+
+Chạy từ thư mục gốc của dự án:
+    python3 tools/bench_frame_codec.py --sizes 32,1024,65536 --messages 2000 --fragments 4 --chunk 4096
+
+Mỗi tin nhắn được chia thành --fragments frame có mask như client gửi.
+Hàm cũ và decode_frame giải mã từng frame đã tách sẵn (có lợi cho chúng: không
+phải tìm ranh giới frame); FrameParser nhận cả luồng byte cắt thành các đoạn
+--chunk byte như khi đọc từ socket. Kết quả của ba cách được đối chiếu với nhau
+trước khi in MB/s và số tin nhắn/giây.
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service import socket as codec  # noqa: E402
+
+
+# decode_frame trước khi có unmask theo khối, giữ nguyên để so sánh
+def legacy_decode_frame(data):
+    if len(data) < 2:
+        return 0, 0, b""
+
+    fin = (data[0] & 0x80) >> 7
+    opcode = data[0] & 0x0F
+    mask = (data[1] & 0x80) >> 7
+    payload_len = data[1] & 0x7F
+
+    offset = 2
+    if payload_len == 126:
+        if len(data) < 4:
+            return 0, 0, b""
+        payload_len = struct.unpack(">H", data[2:4])[0]
+        offset = 4
+    elif payload_len == 127:
+        if len(data) < 10:
+            return 0, 0, b""
+        payload_len = struct.unpack(">Q", data[2:10])[0]
+        offset = 10
+
+    if mask:
+        if len(data) < offset + 4:
+            return 0, 0, b""
+        masking_key = data[offset:offset + 4]
+        offset += 4
+        if len(data) < offset + payload_len:
+            return 0, 0, b""
+        masked_data = data[offset:offset + payload_len]
+        unmasked_data = bytes(b ^ masking_key[i % 4] for i, b in enumerate(masked_data))
+    else:
+        unmasked_data = data[offset:offset + payload_len]
+
+    return fin, opcode, unmasked_data
+
+
+def build_stream(size, messages, fragments):
+    """Trả về (payload các tin nhắn, các frame, luồng byte nối liền)"""
+    payloads = [os.urandom(size) for _ in range(messages)]
+    frames = []
+    for payload in payloads:
+        step = max(1, -(-len(payload) // fragments))
+        pieces = [payload[i:i + step] for i in range(0, len(payload), step)] or [b""]
+        for index, piece in enumerate(pieces):
+            opcode = codec.OP_BINARY if index == 0 else codec.OP_CONTINUATION
+            frames.append(codec.build_client_frame(piece, opcode, fin=index == len(pieces) - 1))
+    return payloads, frames, b"".join(frames)
+
+
+def reassemble(decode, frames):
+    messages, parts = [], []
+    for frame in frames:
+        fin, _, payload = decode(frame)
+        parts.append(payload)
+        if fin:
+            messages.append(b"".join(parts))
+            parts = []
+    return messages
+
+
+def parse_stream(stream, chunk):
+    parser = codec.FrameParser()
+    messages = []
+    for start in range(0, len(stream), chunk):
+        messages.extend(message.payload for message in parser.feed(stream[start:start + chunk]))
+    return messages
+
+
+def measure(run, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="32,1024,65536", help="Kích thước payload (byte), phân tách bằng dấu phẩy")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--fragments", type=int, default=1, help="Số frame của mỗi tin nhắn")
+    parser.add_argument("--chunk", type=int, default=4096, help="Kích thước mỗi lần đọc của FrameParser")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"NumPy: {'có' if codec.numpy is not None else 'không'}")
+    print(f"{'size':>8} {'method':<14} {'MB/s':>10} {'msg/s':>12} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        payloads, frames, stream = build_stream(size, args.messages, args.fragments)
+        total = size * args.messages
+        runs = [
+            ("legacy", lambda: reassemble(legacy_decode_frame, frames)),
+            ("decode_frame", lambda: reassemble(codec.decode_frame, frames)),
+            ("FrameParser", lambda: parse_stream(stream, args.chunk)),
+        ]
+        baseline = None
+        for name, run in runs:
+            elapsed, result = measure(run, args.repeat)
+            if result != payloads:
+                raise SystemExit(f"{name} produced different payloads for size {size}")
+            baseline = baseline or elapsed
+            print(f"{size:>8} {name:<14} {total / elapsed / 1e6:>10.1f} {args.messages / elapsed:>12.0f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
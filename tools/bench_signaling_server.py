@@ -0,0 +1,183 @@
+"""
+So sánh signaling qua FastAPI (/ws/{channel_id}/signaling) với listener asyncio
+độc lập (service/signaling_server.py): số tin nhắn chuyển tiếp mỗi giây và bộ
+nhớ (RSS) của server trên mỗi kết nối.
+
+Chạy từ thư mục gốc của dự án (Linux, đọc RSS từ /proc):
+    python3 tools/bench_signaling_server.py --connections 200 --messages 200 --sdp-size 2000
+
+Với mỗi chế độ, script khởi chạy một tiến trình uvicorn mới trên CSDL tạm (bật
+SIGNALING_SERVER_PORT), mở --connections kết nối vào cùng một voice channel,
+đo RSS trước và sau, rồi cho từng cặp peer gửi --messages offer (payload
+--sdp-size byte) tới nhau và đo thời gian tới khi mọi offer được nhận cùng
+thời gian CPU server đã dùng cho mỗi tin nhắn (client chạy trên cùng máy nên
+msg/s phụ thuộc cả client; µs CPU/msg chỉ tính phía server).
+Client không dùng permessage-deflate ở cả hai chế độ.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from websockets.asyncio.client import connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kib(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def cpu_seconds(pid):
+    """Thời gian CPU (user + system) của tiến trình"""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class ServerProcess:
+    def __init__(self):
+        self.http_port = free_port()
+        self.signaling_port = free_port()
+        self.workdir = tempfile.mkdtemp(prefix="chatapp-bench-")
+        env = dict(os.environ, SIGNALING_SERVER_PORT=str(self.signaling_port), SIGNALING_SERVER_HOST="127.0.0.1")
+        env.setdefault("JWT_SECRET_KEY", "bench")
+        env.pop("DATABASE_URL", None)
+        env.pop("ASYNC_DATABASE_URL", None)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", ROOT,
+             "--ws", "service.ws_compression:CompressedWebSocketProtocol",
+             "--host", "127.0.0.1", "--port", str(self.http_port), "--log-level", "warning"],
+            cwd=self.workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    async def wait_ready(self, client: httpx.AsyncClient):
+        for _ in range(100):
+            try:
+                await client.get("/healthy")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        raise SystemExit("Server did not start")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+async def setup(client: httpx.AsyncClient):
+    await client.post("/auth/register", json={"username": "bench", "full_name": "bench", "password": "bench"})
+    token = (await client.post("/auth/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post("/servers/create", json={"name": "bench", "color": "#000", "is_private": False}, headers=headers)
+    channel_id = next(c["id"] for c in response.json()["channels"] if c["channel_type"] == "voice")
+    return token, channel_id
+
+
+class Peer:
+    """Kết nối của một peer, đọc liên tục và đếm số offer nhận được"""
+    def __init__(self, ws, peer_id):
+        self.ws = ws
+        self.peer_id = peer_id
+        self.received = 0
+        self.frames = 0
+        self.done = asyncio.Event()
+        self.expected = None
+        self.task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for data in self.ws:
+            self.frames += 1
+            if '"offer"' in data and json.loads(data).get("action") == "offer":
+                self.received += 1
+                if self.received == self.expected:
+                    self.done.set()
+
+
+async def settle(peers, timeout=5.0):
+    """Chờ tới khi không còn frame nào được nhận (ví dụ các new_peer sau khi join)"""
+    deadline = time.monotonic() + timeout
+    previous = -1
+    while time.monotonic() < deadline:
+        total = sum(peer.frames for peer in peers)
+        if total == previous:
+            return
+        previous = total
+        await asyncio.sleep(0.3)
+
+
+async def run_mode(label, url_for, server: ServerProcess, token, channel_id, args):
+    before = rss_kib(server.process.pid)
+    peers = []
+    for i in range(args.connections):
+        ws = await connect(url_for(channel_id, f"p{i}", token), compression=None, max_size=None, ping_interval=None)
+        peers.append(Peer(ws, f"p{i}"))
+    await settle(peers)
+    after = rss_kib(server.process.pid)
+
+    sdp = "v=0 " + "a" * max(0, args.sdp_size - 4)
+    pairs = [(peers[i], peers[i + 1]) for i in range(0, len(peers) - 1, 2)]
+    for _, receiver in pairs:
+        receiver.expected = args.messages
+    cpu_before = cpu_seconds(server.process.pid)
+    started = time.perf_counter()
+
+    async def send(sender: Peer, receiver: Peer):
+        for _ in range(args.messages):
+            await sender.ws.send(json.dumps({"action": "offer", "target_id": receiver.peer_id, "sdp": sdp}))
+
+    await asyncio.gather(*(send(sender, receiver) for sender, receiver in pairs))
+    await asyncio.wait_for(asyncio.gather(*(receiver.done.wait() for _, receiver in pairs)), timeout=args.timeout)
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds(server.process.pid) - cpu_before
+
+    for peer in peers:
+        await peer.ws.close()
+        peer.task.cancel()
+    total = len(pairs) * args.messages
+    print(
+        f"{label:<10} {total / elapsed:>10.0f} msg/s {cpu / total * 1e6:>10.1f} µs CPU/msg "
+        f"{(after - before) / len(peers):>10.1f} KiB/conn  (RSS {before / 1024:.1f} -> {after / 1024:.1f} MiB)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=200, help="Số offer mỗi cặp peer gửi")
+    parser.add_argument("--sdp-size", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    modes = [
+        ("fastapi", lambda server: lambda cid, peer, token: f"ws://127.0.0.1:{server.http_port}/ws/{cid}/signaling?peer_id={peer}&token={token}"),
+        ("asyncio", lambda server: lambda cid, peer, token: f"ws://127.0.0.1:{server.signaling_port}/ws/{cid}/signaling?peer_id={peer}&token={token}"),
+    ]
+    for label, url_factory in modes:
+        server = ServerProcess()
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.http_port}", timeout=60) as client:
+                await server.wait_ready(client)
+                token, channel_id = await setup(client)
+            await run_mode(label, url_factory(server), server, token, channel_id, args)
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
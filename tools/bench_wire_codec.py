@@ -0,0 +1,110 @@
+"""
+So sánh cách mã hóa tin nhắn WebSocket (service/wire_codec.py): JSON text và
+compact (MessagePack, tên trường thay bằng chỉ số) — byte mỗi tin nhắn, µs mã
+hóa/giải mã, và byte sau permessage-deflate.
+
+Chạy từ thư mục gốc của dự án:
+    python3 tools/bench_wire_codec.py --peers 20 --chat 200
+
+Luồng tin nhắn giống tools/bench_ws_compression.py (new_peer, offer SDP,
+ice_candidate, tin nhắn chat) cộng thêm peer_left và presence. Đường compact
+được đo với msgpack (nếu cài) và bộ mã hóa Python thuần. "transcode" là chi phí
+phía server khi phát: từ JSON text chuẩn sang frame của codec.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ws_compression import voice_join_stream  # noqa: E402
+from service import wire_codec  # noqa: E402
+from service.socket import PerMessageDeflate, build_frame  # noqa: E402
+
+
+def message_stream(peers, chat, video):
+    """Các tin nhắn (JSON text chuẩn) một client nhận, theo từng loại"""
+    texts = [payload.decode() for payload in voice_join_stream(peers, chat, video)]
+    for index in range(peers):
+        texts.append(wire_codec.serialize({"action": "peer_left", "peer_id": f"peer-{index:08x}", "channel_id": 42}))
+        texts.append(wire_codec.serialize({"action": "presence", "users": [{"id": index + 1, "status": "offline"}]}))
+    return texts
+
+
+def kind_of(message):
+    if "action" in message:
+        return message["action"]
+    return "chat"
+
+
+def measure(codec, texts, repeat):
+    """Returns: (frames, µs transcode, µs decode) mỗi tin nhắn"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        frames = [codec.transcode(text) for text in texts]
+    transcode_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            codec.decode(frame)
+    decode_time = time.perf_counter() - started
+    scale = 1e6 / (len(texts) * repeat)
+    return frames, transcode_time * scale, decode_time * scale
+
+
+def wire_size(frames, deflate):
+    encoder = PerMessageDeflate(server_max_window_bits=12, mem_level=5, min_size=64) if deflate else None
+    total = 0
+    for frame in frames:
+        payload = frame.encode() if isinstance(frame, str) else frame
+        total += len(encoder.encode(payload) if encoder else build_frame(payload))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, default=20, help="Số peer cùng vào voice channel")
+    parser.add_argument("--chat", type=int, default=200, help="Số tin nhắn chat")
+    parser.add_argument("--video", action="store_true", help="SDP có cả audio và video")
+    parser.add_argument("--repeat", type=int, default=20, help="Số lần lặp khi đo thời gian")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    texts = message_stream(args.peers, args.chat, args.video)
+    messages = [json.loads(text) for text in texts]
+
+    codecs = [("json", wire_codec.JSON_CODEC, wire_codec.msgpack)]
+    if wire_codec.msgpack is not None:
+        codecs.append(("compact/msgpack", wire_codec.COMPACT_CODEC, wire_codec.msgpack))
+    codecs.append(("compact/python", wire_codec.COMPACT_CODEC, None))
+
+    print(f"{len(texts)} messages, msgpack {'available' if wire_codec.msgpack is not None else 'not installed'}")
+    kinds = sorted({kind_of(message) for message in messages})
+    print(f"{'codec':<16} {'transcode µs':>13} {'decode µs':>10} {'wire KiB':>9} {'+deflate KiB':>13}  " + " ".join(f"{kind:>13}" for kind in kinds))
+    for name, codec, module in codecs:
+        # compact/python: tạm tắt msgpack để đo bộ mã hóa Python thuần
+        saved, wire_codec.msgpack = wire_codec.msgpack, module
+        try:
+            frames, transcode_us, decode_us = measure(codec, texts, args.repeat)
+            for frame, message in zip(frames, messages):
+                if codec.decode(frame) != message:
+                    raise SystemExit(f"{name}: round trip mismatch")
+        finally:
+            wire_codec.msgpack = saved
+        sizes = {}
+        for frame, message in zip(frames, messages):
+            sizes.setdefault(kind_of(message), []).append(len(frame.encode() if isinstance(frame, str) else frame))
+        per_kind = " ".join(f"{sum(sizes[kind]) / len(sizes[kind]):>11.0f} B" for kind in kinds)
+        print(
+            f"{name:<16} {transcode_us:>13.1f} {decode_us:>10.1f} {wire_size(frames, False) / 1024:>9.1f} "
+            f"{wire_size(frames, True) / 1024:>13.1f}  {per_kind}"
+        )
+
+
+if __name__ == "__main__":
+    main()
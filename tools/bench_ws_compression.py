@@ -0,0 +1,184 @@
+"""
+Đo hiệu quả permessage-deflate (service/socket.py PerMessageDeflate) trên luồng
+tin nhắn giống thực tế: byte tiết kiệm được so với thời gian CPU nén/giải nén.
+
+Chạy từ thư mục gốc của dự án:
+    python3 tools/bench_ws_compression.py --peers 20 --chat 200
+
+Luồng tin nhắn mô phỏng một client trong voice channel lớn: mỗi peer khác gửi
+new_peer, offer (SDP vài KB), vài ice_candidate, cùng các tin nhắn chat của
+text channel. Mỗi cấu hình nén toàn bộ luồng như một kết nối (server -> client)
+và in tổng byte trên đường truyền (kèm header frame), tỉ lệ tiết kiệm, µs CPU
+nén và giải nén mỗi tin nhắn, và bộ nhớ zlib ước tính mỗi kết nối.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.socket import PerMessageDeflate, build_frame  # noqa: E402
+
+AUDIO_CODECS = [
+    (111, "opus/48000/2"), (63, "red/48000/2"), (9, "G722/8000"), (0, "PCMU/8000"),
+    (8, "PCMA/8000"), (13, "CN/8000"), (110, "telephone-event/48000"), (126, "telephone-event/8000"),
+]
+VIDEO_CODECS = [(96, "VP8/90000"), (98, "VP9/90000"), (102, "H264/90000"), (45, "AV1/90000"), (97, "rtx/90000")]
+
+
+def random_hex(count):
+    return ":".join(f"{random.randrange(256):02X}" for _ in range(count))
+
+
+def candidate(component=1):
+    ip = f"192.168.{random.randrange(256)}.{random.randrange(1, 255)}"
+    return (
+        f"candidate:{random.randrange(1 << 32)} {component} udp {random.randrange(1 << 31)} {ip} "
+        f"{random.randrange(1024, 65535)} typ host generation 0 ufrag {uuid.uuid4().hex[:4]} network-id 1"
+    )
+
+
+def media_section(kind, codecs, mid, ufrag, password, fingerprint):
+    payloads = " ".join(str(pt) for pt, _ in codecs)
+    msid = uuid.uuid4()
+    ssrc = random.randrange(1 << 32)
+    lines = [
+        f"m={kind} 9 UDP/TLS/RTP/SAVPF {payloads}",
+        "c=IN IP4 0.0.0.0",
+        "a=rtcp:9 IN IP4 0.0.0.0",
+        f"a=ice-ufrag:{ufrag}",
+        f"a=ice-pwd:{password}",
+        "a=ice-options:trickle",
+        f"a=fingerprint:sha-256 {fingerprint}",
+        "a=setup:actpass",
+        f"a=mid:{mid}",
+        "a=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level",
+        "a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time",
+        "a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01",
+        "a=extmap:4 urn:ietf:params:rtp-hdrext:sdes:mid",
+        "a=sendrecv",
+        f"a=msid:{msid} {uuid.uuid4()}",
+        "a=rtcp-mux",
+    ]
+    for pt, codec in codecs:
+        lines.append(f"a=rtpmap:{pt} {codec}")
+        lines.append(f"a=rtcp-fb:{pt} transport-cc")
+        if codec.startswith("opus"):
+            lines.append(f"a=fmtp:{pt} minptime=10;useinbandfec=1")
+    lines.append(f"a=ssrc:{ssrc} cname:{uuid.uuid4().hex[:16]}")
+    lines.append(f"a=ssrc:{ssrc} msid:{msid} {uuid.uuid4()}")
+    return lines
+
+
+def sdp_offer(video=False):
+    ufrag = uuid.uuid4().hex[:4]
+    password = uuid.uuid4().hex[:24]
+    fingerprint = random_hex(32)
+    lines = [
+        "v=0",
+        f"o=- {random.randrange(1 << 62)} 2 IN IP4 127.0.0.1",
+        "s=-",
+        "t=0 0",
+        "a=group:BUNDLE 0 1" if video else "a=group:BUNDLE 0",
+        "a=extmap-allow-mixed",
+        f"a=msid-semantic: WMS {uuid.uuid4()}",
+    ]
+    lines += media_section("audio", AUDIO_CODECS, 0, ufrag, password, fingerprint)
+    if video:
+        lines += media_section("video", VIDEO_CODECS, 1, ufrag, password, fingerprint)
+    return "\r\n".join(lines) + "\r\n"
+
+
+def voice_join_stream(peers, chat, video):
+    """Các tin nhắn (đã mã hóa JSON) một client nhận khi nhiều peer cùng vào voice channel"""
+    messages = []
+    for index in range(peers):
+        peer_id = f"peer-{uuid.uuid4().hex[:8]}"
+        messages.append({"action": "new_peer", "peer_id": peer_id, "channel_id": 42, "username": f"user{index}", "fullname": f"User {index}"})
+        messages.append({"action": "offer", "target_id": "me", "sdp": {"type": "offer", "sdp": sdp_offer(video)}, "peer_id": peer_id})
+        for _ in range(random.randint(2, 6)):
+            messages.append({"action": "ice_candidate", "target_id": "me", "candidate": {"candidate": candidate(), "sdpMid": "0", "sdpMLineIndex": 0}, "peer_id": peer_id})
+    for index in range(chat):
+        messages.append({
+            "id": 1000 + index,
+            "content": random.choice(["ok", "nghe rõ không?", "mình vào rồi", "chờ chút nhé, đang bật mic"]) + " " * random.randint(0, 3),
+            "created_at": f"2026-10-18T04:{index % 60:02d}:{random.randrange(60):02d}.{random.randrange(10**6):06d}",
+            "sender": {"id": random.randint(1, peers), "username": f"user{index % max(peers, 1)}", "full_name": f"User {index % max(peers, 1)}", "status": "online"},
+        })
+    return [json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode() for message in messages]
+
+
+def zlib_memory(window_bits, mem_level):
+    """Bộ nhớ zlib ước tính (byte) cho bộ nén + bộ giải nén của một kết nối"""
+    deflate = (1 << (window_bits + 2)) + (1 << (mem_level + 9))
+    inflate = 1 << window_bits
+    return deflate + inflate
+
+
+def run(name, messages, window_bits=12, no_context_takeover=False, min_size=64, mem_level=5, enabled=True):
+    raw = sum(len(build_frame(payload)) for payload in messages)
+    if not enabled:
+        return name, raw, raw, 0.0, 0.0, 0
+    encoder = PerMessageDeflate(
+        server_no_context_takeover=no_context_takeover, server_max_window_bits=window_bits,
+        min_size=min_size, mem_level=mem_level
+    )
+    # Phía client giải nén tin nhắn của server: tham số server_* của encoder là client_* ở đây
+    decoder = PerMessageDeflate(client_no_context_takeover=no_context_takeover, client_max_window_bits=window_bits)
+
+    frames = []
+    started = time.perf_counter()
+    for payload in messages:
+        compressed = encoder.should_compress(payload)
+        frames.append((compressed, encoder.encode(payload)))
+    compress_time = time.perf_counter() - started
+
+    wire = sum(len(frame) for _, frame in frames)
+    started = time.perf_counter()
+    for (compressed, frame), payload in zip(frames, messages):
+        if compressed:
+            header = 2 if frame[1] < 126 else 4 if frame[1] == 126 else 10
+            if decoder.decompress(frame[header:]) != payload:
+                raise SystemExit(f"{name}: round trip mismatch")
+    decompress_time = time.perf_counter() - started
+    return name, raw, wire, compress_time, decompress_time, zlib_memory(window_bits, mem_level)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, default=20, help="Số peer cùng vào voice channel")
+    parser.add_argument("--chat", type=int, default=200, help="Số tin nhắn chat")
+    parser.add_argument("--video", action="store_true", help="SDP có cả audio và video")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    messages = voice_join_stream(args.peers, args.chat, args.video)
+    sdp_sizes = [len(payload) for payload in messages if b'"action":"offer"' in payload]
+    print(f"{len(messages)} messages, {sum(len(m) for m in messages) / 1024:.1f} KiB, SDP offer ~{sum(sdp_sizes) / len(sdp_sizes) / 1024:.1f} KiB")
+
+    configs = [
+        dict(name="off", enabled=False),
+        dict(name="w15 takeover", window_bits=15, mem_level=8),
+        dict(name="w12 takeover", window_bits=12),
+        dict(name="w9 takeover", window_bits=9),
+        dict(name="w12 no-takeover", window_bits=12, no_context_takeover=True),
+        dict(name="w12 min_size=0", window_bits=12, min_size=0),
+        dict(name="w12 min_size=256", window_bits=12, min_size=256),
+        dict(name="w12 min_size=1024", window_bits=12, min_size=1024),
+    ]
+    print(f"{'config':<20} {'wire KiB':>9} {'saved':>7} {'comp µs/msg':>12} {'decomp µs/msg':>14} {'zlib KiB/conn':>14}")
+    for config in configs:
+        name, raw, wire, compress_time, decompress_time, memory = run(messages=messages, **config)
+        print(
+            f"{name:<20} {wire / 1024:>9.1f} {1 - wire / raw:>6.1%} {compress_time / len(messages) * 1e6:>12.1f} "
+            f"{decompress_time / len(messages) * 1e6:>14.1f} {memory / 1024:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
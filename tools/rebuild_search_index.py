@@ -0,0 +1,64 @@
+"""
+Dựng lại index tìm kiếm toàn văn messages_fts (migration 0003) từ bảng messages.
+
+Chạy từ thư mục gốc của dự án (CSDL theo DATABASE_URL trong .env):
+    python3 tools/rebuild_search_index.py [--check] [--optimize]
+
+Trigger giữ index đồng bộ với mọi thay đổi qua SQLite, nên chỉ cần dựng lại
+khi dữ liệu messages được nạp mà không qua trigger (khôi phục bản sao lưu, sửa
+tay khi tắt trigger) hoặc khi --check báo index lệch. --optimize gộp các
+segment của index sau nhiều lần ghi nhỏ để truy vấn nhanh hơn.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import engine  # noqa: E402
+from sqlalchemy.exc import DatabaseError  # noqa: E402
+
+
+def integrity_check(connection):
+    """Returns: None nếu index khớp với messages, ngược lại là thông báo lỗi"""
+    try:
+        # rank = 1: so sánh cả nội dung index với bảng messages
+        connection.exec_driver_sql("INSERT INTO messages_fts(messages_fts, rank) VALUES ('integrity-check', 1)")
+    except DatabaseError as e:
+        return str(e.orig)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="Chỉ kiểm tra index khớp với messages, không dựng lại")
+    parser.add_argument("--optimize", action="store_true", help="Gộp các segment của index sau khi dựng lại")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).first()
+        if exists is None:
+            raise SystemExit("messages_fts not found: run alembic upgrade head (or start the app) first")
+        count = connection.exec_driver_sql("SELECT count(*) FROM messages").scalar()
+
+        if args.check:
+            error = integrity_check(connection)
+            print(f"{count} messages, index {'ok' if error is None else 'out of sync: ' + error}")
+            return 0 if error is None else 1
+
+        started = time.perf_counter()
+        connection.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        print(f"Rebuilt index for {count} messages in {time.perf_counter() - started:.2f}s")
+        if args.optimize:
+            started = time.perf_counter()
+            connection.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')")
+            print(f"Optimized in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())